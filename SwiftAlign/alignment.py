@@ -0,0 +1,146 @@
+"""
+Compact alignment storage and streaming writers for SwiftAlign.
+
+An alignment is kept as a uint8 matrix (one row per sequence, one byte per
+column) next to the row titles. Large alignments are memory-mapped from a
+scratch file instead of held in memory. FASTA, Clustal and PHYLIP output is
+written block by block straight from the matrix, byte-for-byte as Biopython's
+writers would, and column statistics are computed with NumPy.
+"""
+
+import tempfile
+
+import numpy as np
+
+from SwiftAlign.ingest import scan_fasta
+
+MEMMAP_BYTES = 1 << 28          # alignments larger than 256 MiB are memory-mapped
+ROW_BLOCK = 1024                # rows per block when scanning columns
+GAP = ord("-")
+
+FASTA_WIDTH = 60
+CLUSTAL_WIDTH = 50
+CLUSTAL_ID_WIDTH = 36
+PHYLIP_ID_WIDTH = 10
+
+UPPER = np.arange(256, dtype=np.uint8)
+UPPER[ord("a"):ord("z") + 1] -= 32
+
+
+class Alignment:
+    """Aligned rows as a (rows x columns) uint8 matrix with their FASTA titles."""
+
+    def __init__(self, titles, matrix):
+        self.titles = list(titles)
+        self.matrix = matrix
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def get_alignment_length(self):
+        return self.matrix.shape[1]
+
+    @property
+    def ids(self):
+        return [title.split(None, 1)[0] if title.strip() else "" for title in self.titles]
+
+    def row(self, i):
+        return self.matrix[i].tobytes()
+
+    @classmethod
+    def from_fasta(cls, path, scratch_dir=None, memmap_bytes=MEMMAP_BYTES):
+        """Load an aligned FASTA file; memory-mapped in scratch_dir when larger than memmap_bytes."""
+        index = scan_fasta(path)
+        width = int(index.lengths[0]) if len(index) else 0
+        if (index.lengths != width).any():
+            raise ValueError(f"Rows of {path} have different lengths; not an alignment.")
+        shape = (len(index), width)
+        if len(index) * width > memmap_bytes:
+            # The scratch file is unlinked on close; the mapping keeps it alive until the matrix is freed
+            matrix = np.memmap(tempfile.TemporaryFile(dir=scratch_dir), dtype=np.uint8, mode="w+", shape=shape)
+        else:
+            matrix = np.empty(shape, dtype=np.uint8)
+        titles = []
+        for i, (record, seq) in enumerate(index.iter_sequences()):
+            titles.append(record.description)
+            matrix[i] = np.frombuffer(seq, dtype=np.uint8)
+        return cls(titles, matrix)
+
+    # ---- statistics ----
+    def column_stats(self):
+        """Gap fraction, gap-free and fully conserved columns, and mean identity of the non-gap residues per column."""
+        rows, width = self.matrix.shape
+        gaps = np.zeros(width, dtype=np.int64)
+        counts = {}
+        for start in range(0, rows, ROW_BLOCK):
+            block = UPPER[self.matrix[start:start + ROW_BLOCK]]
+            gaps += (block == GAP).sum(axis=0)
+            for code in np.unique(block).tolist():
+                if code != GAP:
+                    counts[code] = counts.get(code, 0) + (block == code).sum(axis=0)
+        residues = rows - gaps
+        top = np.max(list(counts.values()), axis=0) if counts else np.zeros(width, dtype=np.int64)
+        occupied = residues > 0
+        identity = top[occupied] / residues[occupied]
+        return {
+            "sequences": rows,
+            "alignment_length": width,
+            "gap_fraction": float(gaps.sum() / max(rows * width, 1)),
+            "gap_free_columns": int((gaps == 0).sum()),
+            "conserved_columns": int(((gaps == 0) & (top == rows)).sum()) if rows else 0,
+            "mean_identity": float(identity.mean()) if identity.size else 0.0,
+        }
+
+    # ---- writers ----
+    def write(self, path, out_format="fasta"):
+        writers = {"fasta": self.write_fasta, "clustal": self.write_clustal, "phylip": self.write_phylip}
+        with open(path, "w") as handle:
+            writers[out_format](handle)
+
+    def write_fasta(self, handle, width=FASTA_WIDTH):
+        for i, title in enumerate(self.titles):
+            row = self.matrix[i].tobytes().decode("ascii")
+            handle.write(f">{title}\n")
+            handle.writelines(row[start:start + width] + "\n" for start in range(0, len(row), width))
+
+    def write_clustal(self, handle):
+        rows, width = self.matrix.shape
+        if not rows or not width:
+            raise ValueError("Clustal output needs a non-empty alignment.")
+        labels = [name[:30].replace(" ", "_").ljust(CLUSTAL_ID_WIDTH) for name in self.ids]
+        handle.write("CLUSTAL X (1.81) multiple sequence alignment\n\n\n")
+        for start in range(0, width, CLUSTAL_WIDTH):
+            block = self.matrix[:, start:start + CLUSTAL_WIDTH]
+            handle.writelines(label + block[i].tobytes().decode("ascii") + "\n" for i, label in enumerate(labels))
+            handle.write("\n")
+        handle.write("\n")
+
+    def write_phylip(self, handle):
+        rows, width = self.matrix.shape
+        if not rows or not width:
+            raise ValueError("PHYLIP output needs a non-empty alignment.")
+        names = [phylip_name(name) for name in self.ids]
+        repeated = {name for name in names if names.count(name) > 1} if len(set(names)) < rows else set()
+        if repeated:
+            raise ValueError(f"Repeated PHYLIP name {sorted(repeated)[0]!r}, possibly due to truncation.")
+        handle.write(f" {rows} {width}\n")
+        for start in range(0, width, 50):
+            if start:
+                handle.write("\n")
+            block = self.matrix[:, start:start + 50]
+            for i, name in enumerate(names):
+                row = block[i].tobytes().decode("ascii")
+                label = name.ljust(PHYLIP_ID_WIDTH) if start == 0 else " " * PHYLIP_ID_WIDTH
+                # Five groups of ten columns per line; a group ending exactly at the last column still gets a trailing blank group
+                groups = [row[k:k + 10] for k in range(0, 50, 10) if k == 0 or start + k <= width]
+                handle.write(label + "".join(f" {group}" for group in groups) + "\n")
+
+
+def phylip_name(name, width=PHYLIP_ID_WIDTH):
+    """Strip the characters PHYLIP forbids in names and truncate to width."""
+    name = name.strip()
+    for char in "[](),":
+        name = name.replace(char, "")
+    for char in ":;":
+        name = name.replace(char, "|")
+    return name[:width]
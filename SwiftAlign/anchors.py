@@ -0,0 +1,116 @@
+"""
+Anchor-based segmentation of long sequences for SwiftAlign.
+
+Minimizer k-mers of the median-length sequence that occur exactly once in a
+large majority of the sequences are anchor candidates. Sequences holding most
+of them are cut at the anchors they all share; the others (partial, divergent
+or reverse-complemented sequences) are aligned separately, so one outlier does
+not remove every anchor. The anchors are chained into a collinear set (a
+longest increasing subsequence of positions, sequence by sequence), and one
+long alignment becomes many short independent ones whose results are simply
+concatenated.
+"""
+
+import bisect
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from SwiftAlign.sketch import kmer_positions, mix64
+
+ANCHOR_K = {"dna": 21, "protein": 10}
+MINIMIZER_WINDOW = 16
+ANCHOR_SHARE = 0.8      # share of the sequences an anchor must be unique in, and of those anchors a sequence must hold
+
+
+def unique_kmers(seq, seq_type="dna", k=None):
+    """Sorted codes of k-mers occurring exactly once in seq, with their positions."""
+    codes, positions = kmer_positions(seq, seq_type, k or ANCHOR_K[seq_type])
+    values, first, counts = np.unique(codes, return_index=True, return_counts=True)
+    once = counts == 1
+    return values[once], positions[first[once]]
+
+
+def minimizer_mask(codes, window=MINIMIZER_WINDOW):
+    """Mark the k-mers whose hash is the smallest in at least one window of consecutive k-mers."""
+    mask = np.zeros(codes.size, dtype=bool)
+    if codes.size == 0:
+        return mask
+    hashes = mix64(codes)
+    if codes.size <= window:
+        mask[np.argmin(hashes)] = True
+        return mask
+    mask[sliding_window_view(hashes, window).argmin(axis=1) + np.arange(codes.size - window + 1)] = True
+    return mask
+
+
+def find_anchors(seqs, seq_type="dna", k=None, window=MINIMIZER_WINDOW, share=ANCHOR_SHARE):
+    """Shared anchor positions and the sequences they are shared by.
+
+    Returns (positions, members): members are the indices of the sequences holding at least share of the
+    minimizers unique in at least share of all sequences, and positions has one row per member with the
+    anchors unique in every member, ordered along the median-length sequence. With fewer than two members
+    there are no anchors and members holds every sequence.
+    """
+    k = k or ANCHOR_K[seq_type]
+    n = len(seqs)
+    reference = int(np.argsort([len(seq) for seq in seqs], kind="stable")[(n - 1) // 2])
+    codes, _ = kmer_positions(seqs[reference], seq_type, k)
+    candidates, _ = unique_kmers(seqs[reference], seq_type, k)
+    candidates = candidates[np.isin(candidates, codes[minimizer_mask(codes, window)])]
+    positions = np.full((n, candidates.size), -1, dtype=np.int64)
+    for i, seq in enumerate(seqs):
+        seq_codes, seq_positions = unique_kmers(seq, seq_type, k)
+        _, found, where = np.intersect1d(candidates, seq_codes, assume_unique=True, return_indices=True)
+        positions[i, found] = seq_positions[where]
+    present = positions >= 0
+    majority = present.mean(axis=0) >= share
+    members = np.flatnonzero(present[:, majority].mean(axis=1) >= share) if majority.any() else np.arange(0)
+    if members.size < 2:
+        return np.empty((n, 0), dtype=np.int64), np.arange(n)
+    positions = positions[members][:, majority & present[members].all(axis=0)]
+    order = np.argsort(positions[np.flatnonzero(members == reference)[0]], kind="stable")
+    return positions[:, order], members
+
+
+def longest_increasing(values):
+    """Indices of a longest strictly increasing subsequence of values."""
+    tails, tail_index = [], []
+    previous = np.full(len(values), -1)
+    for i, value in enumerate(values.tolist()):
+        j = bisect.bisect_left(tails, value)
+        if j == len(tails):
+            tails.append(value)
+            tail_index.append(i)
+        else:
+            tails[j] = value
+            tail_index[j] = i
+        previous[i] = tail_index[j - 1] if j else -1
+    chain, i = [], tail_index[-1] if tail_index else -1
+    while i >= 0:
+        chain.append(i)
+        i = previous[i]
+    return np.array(chain[::-1], dtype=np.int64)
+
+
+def chain_anchors(positions, k):
+    """Keep anchors collinear in every sequence and at least k residues apart."""
+    keep = np.arange(positions.shape[1])
+    for row in positions:
+        keep = keep[longest_increasing(row[keep])]
+    selected = []
+    for j in keep.tolist():
+        if not selected or (positions[:, j] - positions[:, selected[-1]] >= k).all():
+            selected.append(j)
+    return positions[:, selected]
+
+
+def segment_bounds(lengths, anchors, segment_length):
+    """Cut points (one row per sequence, starting at 0 and ending at each length) every ~segment_length residues."""
+    cuts, last = [], 0
+    for j, start in enumerate(anchors[0].tolist() if anchors.size else []):
+        if start - last >= segment_length:
+            cuts.append(j)
+            last = start
+    lengths = np.asarray(lengths, dtype=np.int64).reshape(-1, 1)
+    return np.hstack([np.zeros_like(lengths), anchors[:, cuts], lengths])
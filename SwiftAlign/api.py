@@ -0,0 +1,130 @@
+"""
+In-process Python API for SwiftAlign.
+
+    from SwiftAlign.api import Aligner, align
+
+    alignment = align({"a": "ACGTAC", "b": "ACGAC"}, mode="fast", threads=4)
+
+    with Aligner(threads=16, mode="fast") as aligner:
+        alignments = aligner.align_many(families)
+
+Records may be Bio.SeqRecord objects, (id, sequence) pairs or an {id: sequence}
+mapping. Results are Bio.Align.MultipleSeqAlignment objects with rows in input
+order. Failures raise SwiftAlignError instead of exiting, and nothing is printed
+unless a handler is attached to the "SwiftAlign" logger.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from Bio import AlignIO
+from Bio.Align import MultipleSeqAlignment
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+from SwiftAlign.hybrid_msa import (CoreBudget, SwiftAlignError, build_parser, find_binary, log_binary_versions,
+                                   run_pipeline)
+
+__all__ = ["Aligner", "SwiftAlignError", "align"]
+
+# Command-line options that the API manages itself
+RESERVED_OPTIONS = {"input", "output", "format", "add", "reference_format", "add_fragments", "keeplength",
+                    "refine_added",
+                    "resume", "manifest", "workdir", "tmpdir", "report_json", "events_prefix", "batch", "batch_jobs",
+                    "coordinator", "cluster_token"}
+
+
+def _as_pairs(records):
+    """(id, sequence string) pairs from SeqRecords, pairs or a mapping."""
+    if isinstance(records, dict):
+        records = records.items()
+    pairs = []
+    for record in records:
+        if isinstance(record, SeqRecord):
+            pairs.append((record.id, str(record.seq)))
+        else:
+            name, seq = record
+            pairs.append((str(name), str(seq)))
+    return pairs
+
+
+class Aligner:
+    """Reusable aligner: binaries are resolved once and one worker pool serves every call."""
+
+    def __init__(self, threads=4, workdir=None, **options):
+        self.threads = max(1, threads)
+        self.options = self._options(options, threads=self.threads, log_file=None)
+        self.workdir = workdir
+        try:
+            for binary in ("mafft", "muscle"):
+                find_binary(binary)
+        except FileNotFoundError as e:
+            raise SwiftAlignError(str(e)) from e
+        log_binary_versions()
+        self.pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="swiftalign")
+        self.budget = CoreBudget(self.threads, pool=self.pool)
+
+    @staticmethod
+    def _options(options, **base):
+        defaults = vars(build_parser().parse_args(["-i", "-", "-o", "-"]))
+        unknown = set(options) - set(defaults) | set(options) & RESERVED_OPTIONS
+        if unknown:
+            raise TypeError(f"Unsupported SwiftAlign option(s): {', '.join(sorted(unknown))}")
+        defaults.update(base)
+        defaults.update(options)
+        return defaults
+
+    def align(self, records, **options):
+        """Align one family of sequences and return a MultipleSeqAlignment."""
+        pairs = _as_pairs(records)
+        if not pairs:
+            raise SwiftAlignError("No sequences to align.")
+        if len({name for name, _ in pairs}) != len(pairs):
+            raise SwiftAlignError("Sequence ids must be unique.")
+        if len(pairs) == 1:
+            return MultipleSeqAlignment([SeqRecord(Seq(pairs[0][1]), id=pairs[0][0], description="")])
+
+        args = argparse.Namespace(**self._options(options, **self.options))
+        workdir = tempfile.mkdtemp(prefix="swiftalign_api_", dir=self.workdir)
+        try:
+            args.input = os.path.join(workdir, "input.fasta")
+            args.output = os.path.join(workdir, "output.fasta")
+            args.format = "fasta"
+            # Rows get internal names s0, s1, ...: caller ids may hold whitespace or other text FASTA would cut
+            with open(args.input, "w") as out:
+                for i, (_, seq) in enumerate(pairs):
+                    out.write(f">s{i}\n{seq}\n")
+            run_pipeline(args, workdir, args.log_file, budget=self.budget)
+            alignment = AlignIO.read(args.output, "fasta")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        rows = {record.id: record.seq for record in alignment}
+        internal = [f"s{i}" for i in range(len(pairs))]
+        if len(alignment) != len(pairs) or set(rows) != set(internal):
+            raise SwiftAlignError("The alignment does not match the input sequences.")
+        return MultipleSeqAlignment([SeqRecord(rows[key], id=name, description="")
+                                     for key, (name, _) in zip(internal, pairs)])
+
+    def align_many(self, families, **options):
+        """Align several families concurrently on the shared core budget; results keep the input order."""
+        families = list(families)
+        with ThreadPoolExecutor(max_workers=max(1, min(len(families), self.threads))) as drivers:
+            return list(drivers.map(lambda family: self.align(family, **options), families))
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def align(records, mode="accurate", threads=4, **options):
+    """Align one family of sequences with a temporary Aligner."""
+    with Aligner(threads=threads, mode=mode, **options) as aligner:
+        return aligner.align(records)
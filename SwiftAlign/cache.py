@@ -0,0 +1,104 @@
+"""
+Persistent, content-addressed cache of SwiftAlign alignments.
+
+Entries are keyed by a SHA-256 over the input content and every setting
+that changes MAFFT's output. Reads refresh an entry's mtime, and prune()
+evicts least-recently-used entries until the cache fits its size cap.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+DEFAULT_MAX_BYTES = 5 * 1024 ** 3
+
+
+def file_digest(path, block_size=1 << 20):
+    """SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_key(*parts):
+    """Stable cache key from strings, numbers, None or bytes."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else repr(part).encode()
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class AlignmentCache:
+    """On-disk store of aligned FASTA outputs with an LRU size cap."""
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.fasta")
+
+    def fetch(self, key, dest):
+        """Copy a cached entry to dest; returns False on a miss."""
+        path = self.path(key)
+        try:
+            shutil.copyfile(path, dest)
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return False
+        with self.lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, src):
+        """Atomically add src to the cache under key."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def prune(self):
+        """Evict least-recently-used entries until the cache fits max_bytes."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".fasta"):
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            evicted += 1
+        return evicted
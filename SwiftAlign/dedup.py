@@ -0,0 +1,132 @@
+"""
+Duplicate collapsing for SwiftAlign.
+
+Exact duplicates are found by hashing residues. Near duplicates are limited
+to sequences of equal length whose ungapped identity to a representative is
+at least a threshold, so each one can be projected exactly onto the
+representative's aligned row after alignment.
+"""
+
+import hashlib
+from collections import defaultdict, namedtuple
+
+import numpy as np
+
+from SwiftAlign.ingest import scan_fasta
+
+Dedup = namedtuple("Dedup", ["representatives", "rep_of", "exact"])
+LEADER_CAPACITY = 64    # initial rows of a length group's near-duplicate leader array
+
+
+def parse_identity(text):
+    """A near-duplicate identity threshold: a fraction in (0, 1]."""
+    value = float(text)
+    if not 0.0 < value <= 1.0:
+        raise ValueError(f"Identity must be in (0, 1], got {text!r}")
+    return value
+
+
+def all_records(n):
+    """A Dedup in which every record represents itself; expanding it only restores input order."""
+    return Dedup(list(range(n)), np.arange(n), np.zeros(n, dtype=bool))
+
+
+def find_duplicates(index, identity=None):
+    """Map every record to a representative; near duplicates only when identity is set."""
+    if identity is not None:
+        parse_identity(identity)
+    n = len(index)
+    rep_of = np.arange(n)
+    exact = np.zeros(n, dtype=bool)
+    seen = {}
+    by_length = defaultdict(list)
+    for pos, (record, seq) in enumerate(index.iter_sequences()):
+        digest = hashlib.blake2b(seq.upper(), digest_size=16).digest()
+        if digest in seen:
+            rep_of[pos] = seen[digest]
+            exact[pos] = True
+        else:
+            seen[digest] = pos
+            by_length[record.length].append(pos)
+
+    if identity is not None:
+        with index.open() as handle:
+            for length, positions in by_length.items():
+                if len(positions) < 2 or length == 0:
+                    continue
+                # leader rows live in one array that doubles when full, so no candidate copies the others
+                leaders = np.empty((min(LEADER_CAPACITY, len(positions)), length), dtype=np.uint8)
+                leader_pos = []
+                for pos in positions:
+                    seq = np.frombuffer(index.sequence(index[pos], handle).upper(), dtype=np.uint8)
+                    count = len(leader_pos)
+                    if count:
+                        scores = (leaders[:count] == seq).mean(axis=1)
+                        best = int(np.argmax(scores))
+                        if scores[best] >= identity:
+                            rep_of[pos] = leader_pos[best]
+                            continue
+                    if count == len(leaders):
+                        grown = np.empty((min(2 * count, len(positions)), length), dtype=np.uint8)
+                        grown[:count] = leaders
+                        leaders = grown
+                    leaders[count] = seq
+                    leader_pos.append(pos)
+        # exact copies of a near duplicate follow it to its representative and are projected like it
+        first = rep_of
+        rep_of = rep_of[rep_of]
+        exact &= first == rep_of
+
+    representatives = [pos for pos in range(n) if rep_of[pos] == pos]
+    return Dedup(representatives, rep_of, exact)
+
+
+def _project(aligned_row, residues):
+    """Place residues onto the gap pattern of an aligned row of the same ungapped length."""
+    row = np.frombuffer(aligned_row, dtype=np.uint8).copy()
+    filled = row != ord("-")
+    lower = (row >= ord("a")) & (row <= ord("z"))
+    values = np.frombuffer(residues.upper(), dtype=np.uint8)
+    row[filled] = np.where(lower[filled], values | 0x20, values)
+    return row.tobytes()
+
+
+def _representative_rows(aligned_fasta, index, dedup):
+    """Map each representative's input position to its aligned row.
+
+    Rows are matched by ID; representatives sharing an ID (repeated IDs, or IDs equal up to the first
+    whitespace) are told apart by their residues, which differ between representatives.
+    """
+    positions = defaultdict(list)
+    for pos in dedup.representatives:
+        positions[index[pos].id].append(pos)
+    aligned = scan_fasta(aligned_fasta)
+    rows = {}
+    with open(aligned_fasta, "rb") as handle, index.open() as source:
+        for record in aligned:
+            row = aligned.sequence(record, handle)
+            candidates = positions.get(record.id)
+            if not candidates:
+                raise ValueError(f"Aligned record '{record.id}' does not match any input sequence.")
+            pos = candidates[0]
+            if len(candidates) > 1:
+                residues = row.replace(b"-", b"").upper()
+                pos = next((p for p in candidates if index.sequence(index[p], source).upper() == residues), pos)
+            candidates.remove(pos)
+            rows[pos] = row
+    missing = [index[pos].id for pos in dedup.representatives if pos not in rows]
+    if missing:
+        raise ValueError(f"{len(missing)} sequences are missing from the alignment (first: '{missing[0]}').")
+    return rows
+
+
+def expand_alignment(aligned_fasta, index, dedup, output_fasta):
+    """Write the full alignment in input order, re-expanding collapsed records."""
+    rows = _representative_rows(aligned_fasta, index, dedup)
+    with index.open() as source, open(output_fasta, "wb") as out:
+        for pos, record in enumerate(index):
+            row = rows[int(dedup.rep_of[pos])]
+            if dedup.rep_of[pos] != pos and not dedup.exact[pos]:
+                row = _project(row, index.sequence(record, source))
+            out.write(b">" + record.description.encode() + b"\n" + row + b"\n")
+    return len(index)
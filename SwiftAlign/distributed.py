@@ -0,0 +1,453 @@
+"""
+Multi-node work distribution for SwiftAlign.
+
+A coordinator (the `swiftalign --coordinator HOST:PORT` run) queues the chunk
+and merge tasks of its job graph; workers on other nodes
+(`swiftalign-worker HOST:PORT`) pull tasks, run the usual MAFFT wrappers on a
+private copy of the inputs and send the aligned FASTA back. Every request is
+one short TCP connection carrying a length-prefixed JSON message, so no
+shared filesystem is needed. Input and output files follow the message as raw
+blobs whose sizes the message lists; they are streamed between disk and socket
+in blocks, so neither side holds a whole alignment in memory.
+
+Workers register the cores they bring (jobs x threads) with every request; the
+coordinator reports the total to a capacity callback, which sizes how many
+worker cores the run keeps busy.
+
+Workers send a heartbeat for every running task. A task whose worker has been
+silent for a few heartbeat intervals is put back at the front of the queue
+and handed to the next worker that asks; the first result to arrive wins.
+A heartbeat for a task that is no longer the worker's is answered with
+'cancel', and the worker stops the task's commands.
+"""
+
+import argparse
+import collections
+import hmac
+import itertools
+import json
+import os
+import re
+import shutil
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+HEARTBEAT_SECONDS = 10.0
+DEAD_AFTER = 3                  # missed heartbeats before a task is re-queued
+MAX_ATTEMPTS = 3                # workers lost per task before it fails
+POLL_SECONDS = 1.0              # idle worker back-off
+LINGER_SECONDS = 60.0           # how long a worker keeps retrying an unreachable coordinator
+CONNECT_TIMEOUT = 30.0
+BLOCK_SIZE = 1 << 20            # bytes per socket read or write of a streamed file
+
+
+class RemoteError(Exception):
+    """A task failed on a worker, or could not be run anywhere."""
+
+
+def parse_address(text, default_host="0.0.0.0"):
+    """(host, port) from 'HOST:PORT' or 'PORT'."""
+    host, _, port = str(text).rpartition(":")
+    return host or default_host, int(port)
+
+
+def send_message(sock, message, blobs=None):
+    """Send message, followed by blobs: name -> bytes, or the path of a file streamed from disk."""
+    blobs = blobs or {}
+    sizes = [[name, len(blob) if isinstance(blob, bytes) else os.path.getsize(blob)] for name, blob in blobs.items()]
+    data = json.dumps(dict(message, blobs=sizes) if sizes else message).encode()
+    sock.sendall(len(data).to_bytes(8, "big") + data)
+    for (name, size), blob in zip(sizes, blobs.values()):
+        if isinstance(blob, bytes):
+            sock.sendall(blob)
+            continue
+        with open(blob, "rb") as handle:
+            while size:
+                block = handle.read(min(size, BLOCK_SIZE))
+                if not block:
+                    raise OSError(f"{blob} shrank while it was being sent")
+                sock.sendall(block)
+                size -= len(block)
+
+
+def _recv_blocks(sock, size):
+    while size:
+        block = sock.recv(min(size, BLOCK_SIZE))
+        if not block:
+            raise ConnectionError("connection closed mid-message")
+        yield block
+        size -= len(block)
+
+
+def _recv_exactly(sock, size):
+    return b"".join(_recv_blocks(sock, size))
+
+
+def recv_message(sock, blob_path=None):
+    """Receive a message; message["blobs"] maps each blob's name to its bytes or, with blob_path, to the
+    file blob_path(message, name) it was streamed to (blobs for which that returns None are dropped)."""
+    message = json.loads(_recv_exactly(sock, int.from_bytes(_recv_exactly(sock, 8), "big")))
+    blobs = {}
+    for name, size in message.pop("blobs", []):
+        if not re.fullmatch(r"\w+", str(name)):
+            raise ValueError(f"bad blob name {name!r}")
+        if blob_path is None:
+            blobs[name] = _recv_exactly(sock, size)
+            continue
+        path = blob_path(message, name)
+        try:
+            with open(path if path else os.devnull, "wb") as out:
+                for block in _recv_blocks(sock, size):
+                    out.write(block)
+        except BaseException:
+            if path:
+                os.remove(path)
+            raise
+        if path:
+            blobs[name] = path
+    message["blobs"] = blobs
+    return message
+
+
+def request(address, message, timeout=CONNECT_TIMEOUT, blobs=None, blob_path=None):
+    """Send one message (and its blobs) on a new connection and return the reply."""
+    with socket.create_connection(address, timeout=timeout) as sock:
+        send_message(sock, message, blobs)
+        return recv_message(sock, blob_path)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            message = recv_message(self.request, self.server.coordinator.blob_path)
+            send_message(self.request, *self.server.coordinator.dispatch(message))
+        except (ConnectionError, OSError, ValueError):
+            pass
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Coordinator:
+    """Task queue served to pull-based workers over TCP."""
+
+    def __init__(self, host="0.0.0.0", port=0, token=None, heartbeat=HEARTBEAT_SECONDS, log=None):
+        self.token = token or ""
+        self.heartbeat = heartbeat
+        self.log = log or (lambda message: None)
+        self.cond = threading.Condition()
+        self.queue = collections.deque()
+        self.tasks = {}
+        self.workers = {}           # name -> (last seen, cores)
+        self.on_capacity = None
+        self.ids = itertools.count()
+        self.closed = False
+        self.server = _Server((host, port), _Handler)
+        self.server.coordinator = self
+        threading.Thread(target=self.server.serve_forever, name="coordinator", daemon=True).start()
+        threading.Thread(target=self._reap, name="coordinator reaper", daemon=True).start()
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    @property
+    def capacity(self):
+        """Cores registered by the live workers."""
+        with self.cond:
+            return sum(cores for _, cores in self.workers.values())
+
+    def watch_capacity(self, callback):
+        """Call callback(cores) now and whenever workers join, leave or change their cores."""
+        with self.cond:
+            self.on_capacity = callback
+            callback(self.capacity)
+
+    def submit(self, kind, params, files=None, outputs=None):
+        """Queue a task; the future resolves to the worker's result dict.
+
+        files maps names to bytes or paths sent to the worker; outputs maps the names of the worker's
+        result files to the paths they are written to, which result["files"] then holds.
+        """
+        future = Future()
+        with self.cond:
+            if self.closed:
+                raise RemoteError("coordinator is closed")
+            task_id = next(self.ids)
+            self.tasks[task_id] = {"kind": kind, "params": params, "files": files or {}, "outputs": outputs or {},
+                                   "future": future, "worker": None, "seen": None, "attempts": 0}
+            self.queue.append(task_id)
+        return future
+
+    def run(self, kind, params, files=None, outputs=None):
+        return self.submit(kind, params, files, outputs).result()
+
+    def close(self):
+        """Stop serving; idle workers are told to exit and unfinished tasks fail."""
+        with self.cond:
+            self.closed = True
+            pending = [task["future"] for task in self.tasks.values()]
+            self.tasks.clear()
+            self.queue.clear()
+        for future in pending:
+            if not future.done():
+                future.set_exception(RemoteError("coordinator closed before the task finished"))
+        # Give polling workers a moment to hear 'stop' before the port goes away
+        time.sleep(min(POLL_SECONDS, self.heartbeat))
+        self.server.shutdown()
+        self.server.server_close()
+
+    # ---- protocol ----
+    def authorized(self, message):
+        return hmac.compare_digest(str(message.get("token", "")), self.token)
+
+    def blob_path(self, message, name):
+        # A result file is received next to the task's output path; others, and late results, are dropped
+        if message.get("op") != "result" or not self.authorized(message):
+            return None
+        with self.cond:
+            task = self.tasks.get(message.get("task"))
+            target = task and task["outputs"].get(name)
+        if not target:
+            return None
+        fd, path = tempfile.mkstemp(prefix=f"{os.path.basename(target)}.", suffix=".part",
+                                    dir=os.path.dirname(os.path.abspath(target)))
+        os.close(fd)
+        return path
+
+    def dispatch(self, message):
+        """The reply to a worker's message, and the blobs sent after it."""
+        if not self.authorized(message):
+            return {"op": "error", "error": "bad token"}, None
+        op, worker = message.get("op"), str(message.get("worker", "?"))
+        with self.cond:
+            self._register(worker, max(0, int(message.get("cores", 1))))
+            if op == "pull":
+                return self._assign(worker)
+            if op == "heartbeat":
+                task = self.tasks.get(message.get("task"))
+                if task is None or task["worker"] != worker:
+                    return {"op": "cancel"}, None
+                task["seen"] = time.time()
+                return {"op": "ok"}, None
+            if op == "result":
+                self._finish(message, worker)
+                return {"op": "ok"}, None
+        return {"op": "error", "error": f"unknown op {op!r}"}, None
+
+    def _register(self, worker, cores):
+        known = self.workers.get(worker)
+        self.workers[worker] = (time.time(), cores)
+        if known is None or known[1] != cores:
+            self.log(f"Worker {worker} {'joined with' if known is None else 'now has'} {cores} cores.")
+            self._capacity_changed()
+
+    def _capacity_changed(self):
+        if self.on_capacity is not None:
+            self.on_capacity(sum(cores for _, cores in self.workers.values()))
+
+    def _assign(self, worker):
+        if self.closed:
+            return {"op": "stop"}, None
+        while self.queue:
+            task_id = self.queue.popleft()
+            task = self.tasks.get(task_id)
+            if task is None:
+                continue
+            task.update(worker=worker, seen=time.time(), attempts=task["attempts"] + 1)
+            return ({"op": "task", "task": task_id, "kind": task["kind"], "params": task["params"],
+                     "heartbeat": self.heartbeat}, task["files"])
+        return {"op": "wait", "poll": POLL_SECONDS}, None
+
+    def _finish(self, message, worker):
+        received = message["blobs"]
+        task = self.tasks.get(message.get("task"))
+        # First result wins; a failure only counts from the worker the task is assigned to now
+        if task is None or not (message.get("ok") or task["worker"] == worker):
+            for path in received.values():
+                os.remove(path)
+            return
+        del self.tasks[message.get("task")]
+        if message.get("ok"):
+            missing = sorted(set(task["outputs"]) - set(received))
+            if missing:
+                task["future"].set_exception(RemoteError(f"worker {worker} sent no {', '.join(missing)} file"))
+                return
+            for name, path in received.items():
+                os.replace(path, task["outputs"][name])
+            task["future"].set_result(dict(message.get("result", {}), files=dict(task["outputs"]), worker=worker))
+        else:
+            task["future"].set_exception(RemoteError(f"{message.get('error')} (on worker {worker})"))
+
+    def _reap(self):
+        while True:
+            time.sleep(self.heartbeat / 2)
+            failed = []
+            with self.cond:
+                if self.closed:
+                    return
+                deadline = time.time() - DEAD_AFTER * self.heartbeat
+                for task_id, task in list(self.tasks.items()):
+                    if task["worker"] is None or task["seen"] >= deadline:
+                        continue
+                    self.log(f"Worker {task['worker']} stopped responding; re-queueing {task['kind']} task {task_id}.")
+                    if task["attempts"] >= MAX_ATTEMPTS:
+                        del self.tasks[task_id]
+                        failed.append(task)
+                    else:
+                        task.update(worker=None, seen=None)
+                        self.queue.appendleft(task_id)
+                lost = [name for name, (seen, _) in self.workers.items() if seen < deadline]
+                for name in lost:
+                    del self.workers[name]
+                if lost:
+                    self._capacity_changed()
+            for task in failed:
+                task["future"].set_exception(RemoteError(f"{task['kind']} task lost on {MAX_ATTEMPTS} workers"))
+
+
+class Worker:
+    """Pulls tasks from a coordinator and runs them with handler(kind, params, files, workdir, cancel) -> result dict.
+
+    files maps names to the task's input files in workdir; result["files"], if present, maps names to
+    result files sent back. cancel is set once the coordinator takes the task back, and the handler
+    should then stop its commands.
+    """
+
+    def __init__(self, address, handler, jobs=1, threads=None, token=None, name=None, linger=LINGER_SECONDS,
+                 log=print):
+        self.address = address
+        self.handler = handler
+        self.jobs = max(1, jobs)
+        self.threads = threads
+        self.token = token or ""
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.linger = linger
+        self.log = log
+        self.stopping = threading.Event()
+
+    @property
+    def cores(self):
+        return self.jobs * (self.threads or os.cpu_count() or 1)
+
+    def request(self, message, blobs=None, blob_path=None):
+        # Retries while the coordinator is unreachable, for up to linger seconds
+        message = dict(message, token=self.token, worker=self.name, cores=self.cores)
+        give_up = time.time() + self.linger
+        while True:
+            try:
+                return request(self.address, message, blobs=blobs, blob_path=blob_path)
+            except OSError:
+                if time.time() >= give_up or self.stopping.is_set():
+                    raise
+                time.sleep(POLL_SECONDS)
+
+    def run(self):
+        """Serve until the coordinator says stop or stays unreachable; returns the number of tasks run."""
+        counts = []
+        slots = [threading.Thread(target=lambda: counts.append(self._loop()), name=f"slot {k}", daemon=True)
+                 for k in range(self.jobs)]
+        for slot in slots:
+            slot.start()
+        for slot in slots:
+            slot.join()
+        return sum(counts)
+
+    def _loop(self):
+        done = 0
+        while not self.stopping.is_set():
+            workdir = []
+
+            def blob_path(message, name):
+                # A task's input files go straight to its private directory
+                if not workdir:
+                    workdir.append(tempfile.mkdtemp(prefix="swiftalign_worker_"))
+                return os.path.join(workdir[0], name)
+
+            try:
+                reply = self.request({"op": "pull"}, blob_path=blob_path)
+            except OSError:
+                for path in workdir:
+                    shutil.rmtree(path, ignore_errors=True)
+                self.log(f"Coordinator {self.address[0]}:{self.address[1]} unreachable; stopping.")
+                break
+            if reply["op"] == "task":
+                self._run_task(reply, workdir[0] if workdir else tempfile.mkdtemp(prefix="swiftalign_worker_"))
+                done += 1
+            elif reply["op"] == "wait":
+                time.sleep(reply.get("poll", POLL_SECONDS))
+            else:
+                if reply["op"] == "error":
+                    self.log(f"Coordinator refused this worker: {reply.get('error')}")
+                break
+        self.stopping.set()
+        return done
+
+    def _run_task(self, task, workdir):
+        finished = threading.Event()
+        cancel = threading.Event()
+
+        def beat():
+            while not finished.wait(task["heartbeat"]):
+                try:
+                    if self.request({"op": "heartbeat", "task": task["task"]})["op"] == "cancel":
+                        cancel.set()
+                        return
+                except OSError:
+                    return
+
+        threading.Thread(target=beat, daemon=True).start()
+        params = dict(task["params"])
+        if self.threads:
+            params["threads"] = max(1, min(params.get("threads", self.threads), self.threads))
+        started = time.time()
+        files = {}
+        try:
+            result = self.handler(task["kind"], params, task["blobs"], workdir, cancel)
+            files = result.pop("files", {})
+            message = {"op": "result", "task": task["task"], "ok": True, "result": result}
+        except Exception as e:
+            message = {"op": "result", "task": task["task"], "ok": False, "error": str(e) or type(e).__name__}
+        finally:
+            finished.set()
+        try:
+            if cancel.is_set():
+                self.log(f"{task['kind']} task {task['task']} taken back by the coordinator; stopped.")
+                return
+            self.log(f"{task['kind']} task {task['task']} {'done' if message['ok'] else 'failed'} "
+                     f"in {time.time() - started:.2f} sec")
+            try:
+                self.request(message, blobs=files)
+            except OSError:
+                self.log(f"Could not report task {task['task']}; the coordinator will re-queue it.")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SwiftAlign worker: runs chunk and merge tasks for a coordinator")
+    parser.add_argument("coordinator", help="HOST:PORT given to swiftalign --coordinator")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="Most MAFFT threads per task")
+    parser.add_argument("--jobs", type=int, default=1, help="Tasks run at the same time")
+    parser.add_argument("--token", default=os.environ.get("SWIFTALIGN_TOKEN"),
+                        help="Shared secret of the coordinator (default: $SWIFTALIGN_TOKEN)")
+    parser.add_argument("--name", default=None, help="Worker name in the coordinator's log")
+    parser.add_argument("--linger", type=float, default=LINGER_SECONDS,
+                        help="Seconds to keep retrying an unreachable coordinator before exiting")
+    args = parser.parse_args()
+
+    from SwiftAlign.hybrid_msa import run_task
+    worker = Worker(parse_address(args.coordinator, "127.0.0.1"), run_task, args.jobs, args.threads, args.token,
+                    args.name, args.linger)
+    print(f"SwiftAlign worker {worker.name} serving {args.coordinator} with {args.jobs} job(s) x {args.threads} threads")
+    print(f"Finished {worker.run()} tasks.")
+
+
+if __name__ == "__main__":
+    main()
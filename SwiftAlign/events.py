@@ -0,0 +1,154 @@
+"""
+Structured run events for SwiftAlign.
+
+Log lines, timed spans, subprocess resource usage and counters are buffered in
+memory. Log lines are appended to the log file in batches instead of one open
+per message, and the complete event list can be exported as JSON Lines or as a
+Chrome trace (chrome://tracing or https://ui.perfetto.dev) to see where a run
+spends its time and where cores sit idle.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+FLUSH_LINES = 200
+FLUSH_SECONDS = 2.0
+
+
+class EventLog:
+    """Thread-safe buffer of run events with batched log-file writes."""
+
+    def __init__(self, flush_lines=FLUSH_LINES, flush_seconds=FLUSH_SECONDS, record=True):
+        self.flush_lines = flush_lines
+        self.flush_seconds = flush_seconds
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.pending = {}
+        self.last_flush = time.time()
+        self.reset(record)
+
+    def reset(self, record=True):
+        """Drop recorded events (pending log lines are written first) and restart the clock.
+
+        With record=False only log lines are kept, so long-lived library use does not accumulate events.
+        """
+        self.flush()
+        with self.lock:
+            self.origin = time.time()
+            self.events = []
+            self.record = record
+
+    def now(self):
+        return time.time() - self.origin
+
+    def _append(self, event):
+        event.setdefault("ts", self.now())
+        event["thread"] = threading.current_thread().name
+        with self.lock:
+            if self.record:
+                self.events.append(event)
+
+    # ---- log lines ----
+    def line(self, message, path=None):
+        """Record a log message and queue it for the log file at path."""
+        self._append({"kind": "log", "message": message})
+        if not path:
+            return
+        with self.lock:
+            self.pending.setdefault(path, []).append(message)
+            queued = sum(len(lines) for lines in self.pending.values())
+            due = queued >= self.flush_lines or time.time() - self.last_flush >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Append all queued log lines to their files."""
+        with self.lock:
+            pending, self.pending, self.last_flush = self.pending, {}, time.time()
+            for path, lines in pending.items():
+                with open(path, "a") as handle:
+                    handle.write("\n".join(lines) + "\n")
+
+    # ---- spans and counters ----
+    def _spans(self):
+        if not hasattr(self.local, "spans"):
+            self.local.spans = []
+        return self.local.spans
+
+    @contextmanager
+    def span(self, name, category, **fields):
+        """Time a block; subprocesses run inside it are charged to it."""
+        span = {"kind": "span", "name": name, "cat": category, "ts": self.now(), "subprocesses": 0,
+                "child_cpu_sec": 0.0, "child_peak_rss_mb": 0.0}
+        span.update(fields)
+        stack = self._spans()
+        stack.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span["error"] = repr(e)
+            raise
+        finally:
+            stack.pop()
+            span["dur"] = self.now() - span["ts"]
+            self._append(span)
+
+    def annotate(self, **fields):
+        """Add fields to the innermost open span of this thread."""
+        stack = self._spans()
+        if stack:
+            stack[-1].update(fields)
+
+    def process(self, cmd, started, returncode, cpu_sec=None, peak_rss_mb=None):
+        """Record one finished subprocess and charge its usage to the open spans of this thread."""
+        self._append({"kind": "process", "name": os.path.basename(str(cmd[0])), "cmd": " ".join(map(str, cmd)),
+                      "ts": started, "dur": self.now() - started, "returncode": returncode,
+                      "cpu_sec": cpu_sec, "peak_rss_mb": peak_rss_mb})
+        for span in self._spans():
+            span["subprocesses"] += 1
+            if cpu_sec is not None:
+                span["child_cpu_sec"] += cpu_sec
+                span["child_peak_rss_mb"] = max(span["child_peak_rss_mb"], peak_rss_mb)
+
+    def counter(self, name, **values):
+        self._append({"kind": "counter", "name": name, **values})
+
+    # ---- export ----
+    def snapshot(self):
+        with self.lock:
+            return sorted(self.events, key=lambda event: event["ts"])
+
+    def write_jsonl(self, path):
+        """One JSON object per event, ordered by start time (seconds since the run started)."""
+        with open(path, "w") as handle:
+            for event in self.snapshot():
+                handle.write(json.dumps(event, default=str) + "\n")
+
+    def write_chrome_trace(self, path):
+        """Chrome trace-event JSON: spans and subprocesses per thread, core usage as a counter track."""
+        threads = {}
+        trace = []
+        for event in self.snapshot():
+            tid = threads.setdefault(event["thread"], len(threads))
+            args = {k: v for k, v in event.items() if k not in ("kind", "name", "cat", "ts", "dur", "thread")}
+            entry = {"pid": 1, "tid": tid, "ts": round(event["ts"] * 1e6)}
+            if event["kind"] in ("span", "process"):
+                entry.update(ph="X", name=str(event["name"]), cat=event.get("cat", "process"),
+                             dur=round(event["dur"] * 1e6), args=args)
+            elif event["kind"] == "counter":
+                entry.update(ph="C", name=event["name"], args=args)
+            else:
+                entry.update(ph="i", s="t", name=event["message"][:120], cat="log")
+            trace.append(entry)
+        for name, tid in threads.items():
+            trace.append({"ph": "M", "pid": 1, "tid": tid, "name": "thread_name", "args": {"name": name}})
+        with open(path, "w") as handle:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, handle)
+
+
+EVENTS = EventLog(record=False)
+atexit.register(EVENTS.flush)
@@ -8,21 +8,56 @@ Department of Medical Biochemistry
 """
 
 import argparse
+import functools
+import json
+import logging
+import math
 import os
+import socket
 import subprocess
+import tempfile
+import threading
 import time
-from Bio import SeqIO, AlignIO
-from multiprocessing import Pool, Manager
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from Bio import AlignIO
 import numpy as np
 import shutil
 import sys
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+if __package__ in (None, ""):
+    # Running as a plain script (python3 SwiftAlign/hybrid_msa.py): make the package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from SwiftAlign.alignment import Alignment
+from SwiftAlign.anchors import ANCHOR_K, chain_anchors, find_anchors, segment_bounds
+from SwiftAlign.cache import AlignmentCache, file_digest, make_key
+from SwiftAlign.dedup import all_records, expand_alignment, find_duplicates, parse_identity
+from SwiftAlign.distributed import Coordinator, RemoteError, parse_address
+from SwiftAlign.events import EVENTS
+from SwiftAlign.planner import RuntimeModel, parse_duration, sampled_divergence
+from SwiftAlign.processes import ProcessSupervisor
+from SwiftAlign.ingest import byte_ranges, input_compression, load_fasta, open_input, read_ranges, scan_fasta, sequence_lengths
+from SwiftAlign.sketch import sketch_index, sketch_sequence, cluster_sketches, group_signatures, guide_tree, similarity
+
+# -------------------- Errors --------------------
+class SwiftAlignError(Exception):
+    """An alignment step failed; the command line reports it and exits with status 1."""
 
 # -------------------- Logging --------------------
+LOGGER = logging.getLogger("SwiftAlign")
+ECHO_LOG = False    # print log messages to stdout; switched on by main()
+
 def log(message, log_file=None):
-    print(message)
-    if log_file:
-        with open(log_file, "a") as f:
-            f.write(message + "\n")
+    # Log-file writes are batched by the event log; EVENTS.flush() forces them out
+    if ECHO_LOG:
+        print(message)
+    LOGGER.info(message)
+    EVENTS.line(message, log_file)
 
 # -------------------- Header --------------------
 def print_header():
@@ -46,6 +81,7 @@ def print_footer():
 # -------------------- Find Binary --------------------
 BIN_DIR = os.path.join(os.path.dirname(__file__), "..", "bin")
 
+@functools.lru_cache(maxsize=None)
 def find_binary(name):
     local_path = os.path.join(BIN_DIR, name)
     if os.path.exists(local_path):
@@ -57,6 +93,7 @@ def find_binary(name):
 
 # -------------------- Binary Version Detection --------------------
 MUSCLE_VERSION = None
+BINARY_VERSIONS = {}
 
 def log_binary_versions(log_file=None):
     global MUSCLE_VERSION
@@ -68,6 +105,7 @@ def log_binary_versions(log_file=None):
             output = result.stdout.strip() or result.stderr.strip()
             version_info = output.splitlines()[0] if output else "Unknown"
             log(f"{bin_name.upper()} version: {version_info}", log_file)
+            BINARY_VERSIONS[bin_name] = version_info
             if bin_name == "muscle":
                 try:
                     MUSCLE_VERSION = int(version_info.split()[1].split('.')[0])
@@ -76,19 +114,391 @@ def log_binary_versions(log_file=None):
         except Exception:
             log(f"Warning: Could not determine {bin_name} version.", log_file)
 
+# -------------------- Stage Report --------------------
+RSS_DIVISOR = 1024 ** 2 if sys.platform == "darwin" else 1024   # ru_maxrss is bytes on macOS, KiB on Linux
+
+def self_peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / RSS_DIVISOR if resource else None
+
+class StageReport:
+    """Wall time of each pipeline stage, with CPU time and peak memory of the subprocesses it ran."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.info = {}
+        self.stages = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    # The current stage is per thread, so concurrent runs (batch mode, the Python API) charge their own stages;
+    # job threads inherit the stage of the scheduler that started them through charge()
+    @property
+    def current(self):
+        return getattr(self.local, "stage", None)
+
+    @contextmanager
+    def charge(self, name):
+        previous, self.local.stage = self.current, name
+        try:
+            yield
+        finally:
+            self.local.stage = previous
+
+    @contextmanager
+    def stage(self, name, timings=None):
+        # timings, if given, also receives this run's own wall time of the stage
+        with self.lock:
+            entry = self.stages.setdefault(name, {"wall_sec": 0.0, "subprocesses": 0, "child_cpu_sec": 0.0,
+                                                  "child_peak_rss_mb": 0.0})
+        start = time.time()
+        try:
+            with self.charge(name), EVENTS.span(name, "stage"):
+                yield entry
+        finally:
+            with self.lock:
+                entry["wall_sec"] += time.time() - start
+                # ru_maxrss is process-wide and never falls, so this is not the stage's own peak
+                entry["peak_rss_so_far_mb"] = self_peak_rss_mb()
+            if timings is not None:
+                timings[name] = timings.get(name, 0.0) + time.time() - start
+
+    def add_child(self, cpu_sec, peak_rss_mb):
+        with self.lock:
+            entry = self.stages.get(self.current)
+            if entry is not None:
+                entry["subprocesses"] += 1
+                entry["child_cpu_sec"] += cpu_sec
+                entry["child_peak_rss_mb"] = max(entry["child_peak_rss_mb"], peak_rss_mb)
+
+    def write(self, path):
+        data = dict(self.info, total_wall_sec=time.time() - self.started, peak_rss_mb=self_peak_rss_mb(),
+                    binaries=BINARY_VERSIONS, stages=self.stages)
+        with open(path, "w") as handle:
+            json.dump(data, handle, indent=2)
+
+STAGE_REPORT = StageReport()
+
+# -------------------- Subprocesses --------------------
+SUPERVISOR = ProcessSupervisor()
+CANCEL_SCOPE = threading.local()
+STRATEGY_CLOCK = threading.local()
+
+class JobCancelled(SwiftAlignError):
+    pass
+
+@contextmanager
+def cancel_scope(events):
+    # Commands started inside are stopped once any of these events is set (another job of the graph failed)
+    saved = current_cancel_events()
+    CANCEL_SCOPE.events = tuple(events)
+    try:
+        yield
+    finally:
+        CANCEL_SCOPE.events = saved
+
+def current_cancel_events():
+    return getattr(CANCEL_SCOPE, "events", ())
+
+class StrategyClock:
+    # seconds and method become the run time and MAFFT method of the strategy that produced a job's
+    # output (None when no strategy ran, e.g. for single-sequence chunks)
+    def __init__(self):
+        self.seconds = None
+        self.method = None
+
+@contextmanager
+def strategy_clock():
+    clock = StrategyClock()
+    saved = getattr(STRATEGY_CLOCK, "clock", None)
+    STRATEGY_CLOCK.clock = clock
+    try:
+        yield clock
+    finally:
+        STRATEGY_CLOCK.clock = saved
+
+def record_strategy_time(seconds, method):
+    clock = getattr(STRATEGY_CLOCK, "clock", None)
+    if clock is not None:
+        clock.seconds, clock.method = seconds, method
+
+def kill_active_processes():
+    SUPERVISOR.kill_all()
+
+def run_command(cmd, stdout=None, input_data=None, timeout=None, cancel=None):
+    """subprocess.run(cmd, check=True) that charges the child's rusage to the current stage and job.
+
+    The whole process group is stopped (SIGTERM, then SIGKILL) after timeout seconds or once the
+    cancel event is set; subprocess.TimeoutExpired is raised in both cases. When the job graph the
+    command belongs to is cancelled (another job failed, or Ctrl-C), JobCancelled is raised instead.
+    """
+    scope = current_cancel_events()
+    if any(event.is_set() for event in scope):
+        raise JobCancelled(f"Not starting {os.path.basename(cmd[0])}: the run is stopping.")
+    started = EVENTS.now()
+    returncode = cpu_sec = peak_rss_mb = None
+    try:
+        returncode, usage, stopped = SUPERVISOR.run(cmd, stdout, input_data, timeout,
+                                                    scope + ((cancel,) if cancel is not None else ()))
+        if usage is not None:
+            cpu_sec, peak_rss_mb = usage.ru_utime + usage.ru_stime, usage.ru_maxrss / RSS_DIVISOR
+            STAGE_REPORT.add_child(cpu_sec, peak_rss_mb)
+    finally:
+        EVENTS.process(cmd, started, returncode, cpu_sec, peak_rss_mb)
+    if (stopped or returncode) and any(event.is_set() for event in scope):
+        raise JobCancelled(f"Stopped {os.path.basename(cmd[0])}: the run is stopping.")
+    if stopped:
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd)
+    return returncode
+
+# -------------------- Scheduling --------------------
+Job = namedtuple("Job", ["name", "deps", "run", "cores", "priority"], defaults=((), None, None, 0))
+
+class CoreBudget:
+    # Counting semaphore over CPU cores; may be shared by several job graphs.
+    # With a pool, every job graph runs on that long-lived executor instead of a fresh one.
+    # With a remote coordinator, chunk and merge MAFFT runs go to cluster workers and cores count worker
+    # cores in flight; local is then the budget of this node's cores for the work that stays here.
+    def __init__(self, cores, pool=None, remote=None, local=None):
+        self.cores = max(1, cores)
+        self.free = self.cores
+        self.cond = threading.Condition()
+        self.pool = pool
+        self.remote = remote
+        self.local = local or self
+
+    def try_acquire(self, want):
+        with self.cond:
+            granted = max(0, min(max(1, want), self.free))
+            self.free -= granted
+            return granted
+
+    def resize(self, cores):
+        # Jobs already running keep their cores; a shrunk budget admits new ones once enough are back
+        with self.cond:
+            cores = max(1, cores)
+            self.free += cores - self.cores
+            self.cores = cores
+            self.cond.notify_all()
+
+    def release(self, cores):
+        with self.cond:
+            self.free += cores
+            self.cond.notify_all()
+
+    def notify(self, *_):
+        with self.cond:
+            self.cond.notify_all()
+
+def run_job_graph(jobs, budget, results=None, admit=None):
+    # Runs each job as soon as its dependencies are done and cores are free.
+    # job.run(cores, inputs) receives the results of job.deps in order.
+    # admit(job), if given, may hold a ready job back until a later pass (backpressure).
+    # The first failure stops the commands of the jobs still running instead of waiting for them.
+    results = dict(results or {})
+    pending = {job.name: job for job in jobs}
+    running = {}
+    failure = None
+
+    stage = STAGE_REPORT.current or "job"
+    cancelled = threading.Event()
+    scope = current_cancel_events() + (cancelled,)
+
+    def execute(job, cores, inputs):
+        try:
+            with cancel_scope(scope), STAGE_REPORT.charge(stage):
+                with EVENTS.span(f"{stage} {job.name}", stage, cores=cores):
+                    return job.run(cores, inputs)
+        finally:
+            budget.release(cores)
+            EVENTS.counter("cores", busy=budget.cores - budget.free)
+
+    pool = budget.pool or ThreadPoolExecutor(max_workers=budget.cores)
+    try:
+        try:
+            while running or (pending and failure is None):
+                for future in [f for f in running if f.done()]:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except BaseException as e:
+                        failure = failure or e
+                        cancelled.set()
+                ready = sorted((job for job in pending.values() if all(d in results for d in job.deps)),
+                               key=lambda job: -job.priority)
+                while ready and failure is None:
+                    job = ready[0]
+                    want = job.cores or max(1, budget.free // len(ready))
+                    cores = budget.try_acquire(want)
+                    if not cores:
+                        break
+                    ready.pop(0)
+                    if admit is not None and not admit(job):
+                        budget.release(cores)
+                        continue
+                    del pending[job.name]
+                    EVENTS.counter("cores", busy=budget.cores - budget.free)
+                    future = pool.submit(execute, job, cores, [results[d] for d in job.deps])
+                    running[future] = job.name
+                    future.add_done_callback(budget.notify)
+                with budget.cond:
+                    if running and not any(f.done() for f in running) and not (ready and budget.free):
+                        budget.cond.wait()
+                    elif not running and pending and failure is None and not budget.free:
+                        budget.cond.wait()
+        except BaseException:
+            # The scheduler itself was interrupted (e.g. Ctrl-C): stop the running commands so the pool can exit
+            cancelled.set()
+            kill_active_processes()
+            raise
+    finally:
+        if pool is not budget.pool:
+            pool.shutdown(wait=True)
+    if failure is not None:
+        raise failure
+    return results
+
+class InflightWindow:
+    # Backpressure for --max_inflight: a leaf job (one without dependencies, i.e. a chunk alignment) may
+    # start only while fewer than size aligned chunks or partial merges are waiting to be merged. Only
+    # results descending from admitted leaves count; chunks served from the cache or manifest do not
+    def __init__(self, size):
+        self.size = size
+        self.open = 0
+        self.counted = set()
+        self.lock = threading.Lock()
+
+    def admit(self, job):
+        if job.deps:
+            return True
+        with self.lock:
+            if self.open >= self.size:
+                return False
+            self.open += 1
+            self.counted.add(job.name)
+            return True
+
+    def merged(self, node, inputs):
+        # A merge turns its open inputs into one open result
+        with self.lock:
+            consumed = [name for name in inputs if name in self.counted]
+            if consumed:
+                self.counted.difference_update(consumed)
+                self.counted.add(node)
+                self.open -= len(consumed) - 1
+
+# -------------------- Cost Model --------------------
+# Relative cost of one MAFFT job, in pairwise residue comparisons. FFT-NS-2 ('auto') only
+# compares k-mer profiles, while the *-INS-i methods run full iterative pairwise alignment.
+# 'muscle' is one MUSCLE refinement iteration.
+METHOD_COST = {"auto": 0.05, "ginsi": 1.0, "linsi": 1.0, "einsi": 1.5, "muscle": 0.02}
+
+def estimate_job_cost(seq_count, total_length, method):
+    mean_length = total_length / max(seq_count, 1)
+    pairs = max(seq_count * (seq_count - 1) / 2, 1)
+    return METHOD_COST.get(method, 1.0) * pairs * mean_length
+
+def assign_threads(costs, threads):
+    # Threads proportional to each job's share of the total cost (at least one each);
+    # cores left over after rounding down go to the jobs with the largest remainders
+    total = sum(costs) or 1.0
+    shares = [threads * c / total for c in costs]
+    assigned = [max(1, math.floor(share)) for share in shares]
+    spare = threads - sum(assigned)
+    for i in sorted(range(len(costs)), key=lambda i: assigned[i] - shares[i]):
+        if spare <= 0:
+            break
+        if shares[i] > assigned[i]:
+            assigned[i] += 1
+            spare -= 1
+    return [min(threads, t) for t in assigned]
+
+class JobProgress:
+    # Thread-safe completion counter; the ETA comes from core-seconds spent per unit of predicted cost
+    def __init__(self, total_jobs, total_cost, cores, log_file=None):
+        self.total_jobs = total_jobs
+        self.total_cost = total_cost
+        self.cores = cores
+        self.log_file = log_file
+        self.lock = threading.Lock()
+        self.done = 0
+        self.done_cost = 0.0
+        self.ran_cost = 0.0
+        self.core_seconds = 0.0
+
+    def seconds_per_cost(self):
+        return self.core_seconds / self.ran_cost if self.ran_cost else 0.0
+
+    def finish(self, name, cost, threads, elapsed, detail="", strategy_seconds=None, strategy_cost=None):
+        # strategy_seconds, when known, is how long the strategy that succeeded ran and strategy_cost the cost
+        # of the method it ran; attempts abandoned on a timeout are left out of the rate, and a fallback's time
+        # is not divided by the requested method's cost, so neither distorts the next time limits
+        with self.lock:
+            self.done += 1
+            self.done_cost += cost
+            self.ran_cost += cost if strategy_cost is None else strategy_cost
+            self.core_seconds += (elapsed if strategy_seconds is None else strategy_seconds) * threads
+            remaining = (self.total_cost - self.done_cost) * self.seconds_per_cost() / self.cores
+            log(f"[{self.done}/{self.total_jobs}] Completed {name} in {elapsed:.2f} sec "
+                f"({detail}threads={threads}, predicted cost={cost:.3g}), ETA: {remaining:.2f} sec", self.log_file)
+
+# Core-seconds per cost unit assumed before any job has finished; deliberately pessimistic
+DEFAULT_SECONDS_PER_COST = 2e-5
+
+class StrategyTimeouts:
+    # Time limit of one MAFFT strategy: factor x its predicted wall time, never below floor seconds.
+    # Predictions use the rate measured by JobProgress once jobs have finished.
+    def __init__(self, factor, floor, progress=None):
+        self.factor = factor
+        self.floor = floor
+        self.progress = progress
+
+    def limit(self, seq_count, total_length, method, threads):
+        if not self.factor:
+            return None
+        rate = self.progress.seconds_per_cost() if self.progress is not None and self.progress.done else 0.0
+        predicted = (rate or DEFAULT_SECONDS_PER_COST) * estimate_job_cost(seq_count, total_length, method) / max(threads, 1)
+        return max(self.floor, self.factor * predicted)
+
+    def limits(self, seq_count, total_length, methods, threads):
+        # The last strategy is the last resort and always runs to completion
+        return {method: self.limit(seq_count, total_length, method, threads) if method != methods[-1] else None
+                for method in methods}
+
 # -------------------- Sequence Type Detection --------------------
-def detect_sequence_type(fasta_file, log_file=None):
-    seqs = list(SeqIO.parse(fasta_file, "fasta"))
-    dna_bases = set("ATGCNatgcn")
-    total_bases = sum(len(seq.seq) for seq in seqs)
-    dna_count = sum(sum(1 for b in seq.seq if b in dna_bases) for seq in seqs)
+def detect_sequence_type(fasta_file, log_file=None, threads=1):
+    try:
+        index = load_fasta(fasta_file, threads)
+    except ValueError as e:
+        raise SwiftAlignError(str(e)) from e
+    if index.store is not None:
+        source = "stdin" if fasta_file == "-" else fasta_file
+        log(f"Read {len(index)} sequences from {source}; {index.total_residues} residues held in memory in "
+            f"{index.store.nbytes / 2 ** 20:.1f} MiB ({8 * index.store.nbytes / max(index.total_residues, 1):.2f} "
+            f"bits per residue)", log_file)
+    total_bases = index.classified_residues
+    dna_count = index.dna_residues()
     seq_type = "dna" if total_bases == 0 or dna_count / total_bases > 0.85 else "protein"
-    log(f"Sequence type detected: {seq_type.upper()}", log_file)
-    return seq_type, seqs
+    log(f"Sequence type detected: {seq_type.upper()}" + (" (sampled)" if index.sampled else ""), log_file)
+    return seq_type, index
+
+# -------------------- Deduplication --------------------
+def collapse_duplicates(seqs, identity=None, log_file=None):
+    start = time.time()
+    try:
+        dedup = find_duplicates(seqs, identity)
+    except ValueError as e:
+        raise SwiftAlignError(f"--dedup_identity: {e}") from e
+    exact = int(dedup.exact.sum())
+    near = len(seqs) - len(dedup.representatives) - exact
+    log(f"Deduplication: {len(dedup.representatives)} of {len(seqs)} sequences kept "
+        f"({exact} exact and {near} near duplicates collapsed, {time.time() - start:.2f} sec)", log_file)
+    return dedup
 
 # -------------------- Automatic Parameter Optimization --------------------
 def auto_optimize_parameters(seqs, seq_type, mode="accurate", log_file=None):
-    lengths = [len(seq.seq) for seq in seqs]
+    lengths = sequence_lengths(seqs)
     mean_length = np.mean(lengths)
     std_length = np.std(lengths)
     divergence = std_length / mean_length if mean_length > 0 else 0
@@ -114,34 +524,163 @@ def auto_optimize_parameters(seqs, seq_type, mode="accurate", log_file=None):
     return mafft_method, gap_open, gap_extend, muscle_max_iter
 
 # -------------------- Chunking --------------------
-def chunk_fasta(seqs, chunk_size, log_file=None):
+# A chunk is a set of byte ranges of the input; its FASTA text is piped to MAFFT on demand
+ChunkSpec = namedtuple("ChunkSpec", ["name", "source", "ranges", "seq_count", "residues"])
+
+def chunk_fasta(seqs, chunk_size, log_file=None, groups=None, workdir="."):
+    if groups is None:
+        groups = [range(i, min(i + chunk_size, len(seqs))) for i in range(0, len(seqs), chunk_size)]
     chunks = []
-    for i in range(0, len(seqs), chunk_size):
-        chunk_file = f"chunk_{i//chunk_size}.fasta"
-        SeqIO.write(seqs[i:i+chunk_size], chunk_file, "fasta")
-        chunks.append(chunk_file)
+    for idx, group in enumerate(groups):
+        records = [seqs[i] for i in group]
+        chunks.append(ChunkSpec(os.path.join(workdir, f"chunk_{idx}"), seqs.source, byte_ranges(records), len(records),
+                                sum(r.length for r in records)))
     log(f"Total chunks created: {len(chunks)}", log_file)
     return chunks
 
+def read_chunk(chunk):
+    return read_ranges(chunk.source, chunk.ranges)
+
+def similarity_chunks(seqs, seq_type, chunk_size, log_file=None):
+    start = time.time()
+    signatures = sketch_index(seqs, seq_type)
+    groups = cluster_sketches(signatures, chunk_size)
+    tree = guide_tree(group_signatures(signatures, groups))
+    cohesion = np.mean([similarity(signatures[g], signatures[g[0]]).mean() for g in groups]) if groups else 0.0
+    log(f"Similarity chunking: {len(groups)} clusters, mean within-cluster similarity {cohesion:.3f} "
+        f"({time.time() - start:.2f} sec)", log_file)
+    return groups, tree
+
+# -------------------- Alignment Cache --------------------
+def chunk_cache_key(chunk_data, mafft_method, gap_open, gap_extend):
+    return make_key("chunk", chunk_data, mafft_method, gap_open, gap_extend, BINARY_VERSIONS.get("mafft"))
+
+def merge_cache_key(left_file, right_file, mafft_method, gap_open, gap_extend):
+    return make_key("merge", file_digest(left_file), file_digest(right_file), mafft_method, gap_open, gap_extend,
+                    BINARY_VERSIONS.get("mafft"))
+
 # -------------------- MAFFT with fallback --------------------
-def run_mafft_with_fallback(mafft_cmd, output_file, chunk_file, log_file=None):
+def run_mafft_with_fallback(mafft_cmd, output_file, chunk_file, log_file=None, input_data=None, timeout=None, cancel=None):
     try:
-        subprocess.run(mafft_cmd, stdout=open(output_file, "w"), check=True)
+        with open(output_file, "wb") as out:
+            run_command(mafft_cmd, stdout=out, input_data=input_data, timeout=timeout, cancel=cancel)
         return True
+    except subprocess.TimeoutExpired:
+        if cancel is None or not cancel.is_set():
+            log(f"MAFFT timed out after {timeout:.0f} sec on {chunk_file} with command: {' '.join(mafft_cmd)}", log_file)
+        return False
     except subprocess.CalledProcessError:
         log(f"MAFFT failed on {chunk_file} with command: {' '.join(mafft_cmd)}", log_file)
         return False
 
-def run_mafft_chunk(args):
-    chunk_file, seq_type, mafft_method, gap_open, gap_extend, threads, idx, total_chunks, start_time, completed_counter, log_file = args
+class MafftRace:
+    # A cheap '--auto' run on the next spare core, next to an expensive strategy; it stands in for
+    # the remaining fallbacks if that strategy fails or runs out of time
+    def __init__(self, build_cmd, output_file, label, budget, log_file=None, input_data=None):
+        self.output_file = output_file
+        self.budget = budget
+        self.cancel = threading.Event()
+        self.started = False
+        self.ok = False
+        self.seconds = None
+        stage = STAGE_REPORT.current
+
+        def run():
+            cores = 0
+            with budget.cond:
+                while not self.cancel.is_set():
+                    cores = budget.try_acquire(1)
+                    if cores:
+                        self.started = True
+                        break
+                    budget.cond.wait(1.0)
+            if not cores:
+                return
+            try:
+                log(f"Racing MAFFT '--auto' on {cores} spare core(s) for {label}.", log_file)
+                started = time.time()
+                with STAGE_REPORT.charge(stage):
+                    self.ok = run_mafft_with_fallback(build_cmd("auto", cores), output_file, label, log_file,
+                                                      input_data, cancel=self.cancel)
+                self.seconds = time.time() - started
+            finally:
+                budget.release(cores)
+
+        self.thread = threading.Thread(target=run, name=f"race {label}", daemon=True)
+        self.thread.start()
+
+    def result(self):
+        # Waits for a race that has started; one still waiting for a core is called off instead
+        with self.budget.cond:
+            if not self.started:
+                self.cancel.set()
+                self.budget.cond.notify_all()
+        self.thread.join()
+        return self.ok
+
+    def stop(self):
+        self.cancel.set()
+        self.budget.notify()
+        self.thread.join()
+        if os.path.exists(self.output_file):
+            os.remove(self.output_file)
+
+def run_strategies(build_cmd, methods, output_file, label, log_file=None, input_data=None, limits=None,
+                   budget=None, race=False):
+    # Tries MAFFT strategies in order, each within its time limit; returns the method that wrote
+    # output_file, or None if every strategy failed
+    limits = limits or {}
+    racer = None
+    if race and budget is not None and methods[0] != "auto":
+        racer = MafftRace(build_cmd, f"{output_file}.race", label, budget, log_file, input_data)
+    tried = []
+    try:
+        for method in methods + [None]:
+            if racer is not None and tried:
+                if racer.result():
+                    record_strategy_time(racer.seconds, "auto")
+                    os.replace(racer.output_file, output_file)
+                    log(f"Using the racing '--auto' alignment for {label}.", log_file)
+                    EVENTS.annotate(method="auto", fallbacks=len(tried), raced=True)
+                    return "auto"
+                racer, tried = None, tried + (["auto"] if racer.started else [])
+            if method is None:
+                return None
+            if method in tried:
+                continue
+            tried.append(method)
+            EVENTS.annotate(target=label, method=method, fallbacks=len(tried) - 1)
+            log(f"Trying MAFFT method '{method}' on {label}...", log_file)
+            started = time.time()
+            if run_mafft_with_fallback(build_cmd(method), output_file, label, log_file, input_data, timeout=limits.get(method)):
+                record_strategy_time(time.time() - started, method)
+                return method
+    finally:
+        if racer is not None:
+            racer.stop()
+
+def store_if_requested(cache, cache_key, output_file, method, requested, label, log_file=None):
+    # Cache entries are keyed by the requested method, so a fallback's (or race winner's) output is not stored
+    if cache is None:
+        return
+    if method != requested:
+        log(f"Not caching {label}: aligned with fallback '{method}' instead of '{requested}'.", log_file)
+        return
+    cache.store(cache_key, output_file)
+
+def run_mafft_chunk(chunk, seq_type, mafft_method, gap_open, gap_extend, threads, log_file=None, cache=None,
+                    cache_key=None, timeouts=None, budget=None, race=False, chunk_data=None):
+    chunk_file = chunk.name
     output_file = f"{chunk_file}.aligned.fasta"
+    chunk_data = read_chunk(chunk) if chunk_data is None else chunk_data
 
-    seq_count = sum(1 for _ in SeqIO.parse(chunk_file, "fasta"))
-    if seq_count <= 1:
-        log(f"Skipping MAFFT for {chunk_file} (only {seq_count} sequence).", log_file)
-        return chunk_file
+    if chunk.seq_count <= 1:
+        log(f"Skipping MAFFT for {chunk_file} (only {chunk.seq_count} sequence).", log_file)
+        with open(output_file, "wb") as out:
+            out.write(chunk_data)
+        return output_file
 
-    def build_cmd(method):
+    def build_cmd(method, threads=threads):
         cmd = [find_binary("mafft"), "--thread", str(threads)]
         if method == "linsi":
             cmd += ["--localpair", "--maxiterate", "1000"]
@@ -153,83 +692,289 @@ def run_mafft_chunk(args):
             cmd.append("--auto")
         if gap_open is not None: cmd += ["--op", str(gap_open)]
         if gap_extend is not None: cmd += ["--ep", str(gap_extend)]
-        cmd.append(chunk_file)
+        cmd.append("-")
         return cmd
 
-    methods_to_try = [mafft_method, "ginsi", "linsi", "auto"]
-    tried = set()
-    success = False
-    for method in methods_to_try:
-        if method in tried: 
-            continue
-        tried.add(method)
-        cmd = build_cmd(method)
-        log(f"Trying MAFFT method '{method}' on {chunk_file}...", log_file)
-        if run_mafft_with_fallback(cmd, output_file, chunk_file, log_file):
-            success = True
-            break
-
-    if not success:
-        log(f"All MAFFT strategies failed for {chunk_file}. Exiting.", log_file)
-        sys.exit(1)
+    if budget is not None and budget.remote is not None:
+        params = dict(seq_type=seq_type, method=mafft_method, gap_open=gap_open, gap_extend=gap_extend, threads=threads,
+                      seq_count=chunk.seq_count, residues=chunk.residues, **remote_timeouts(timeouts))
+        method = run_remote(budget.remote, "chunk", chunk_file, output_file, params, {"chunk": chunk_data}, log_file)
+        store_if_requested(cache, cache_key, output_file, method, mafft_method, chunk_file, log_file)
+        return output_file
 
-    completed_counter.value += 1
-    elapsed = time.time() - start_time
-    avg_time = elapsed / completed_counter.value
-    remaining = (total_chunks - completed_counter.value) * avg_time
-    log(f"[{completed_counter.value}/{total_chunks}] Completed {chunk_file} in {elapsed:.2f} sec, ETA: {remaining:.2f} sec", log_file)
+    methods_to_try = list(dict.fromkeys([mafft_method, "ginsi", "linsi", "auto"]))
+    limits = timeouts.limits(chunk.seq_count, chunk.residues, methods_to_try, threads) if timeouts else None
+    method = run_strategies(build_cmd, methods_to_try, output_file, chunk_file, log_file, chunk_data, limits, budget, race)
+    if method is None:
+        raise SwiftAlignError(f"All MAFFT strategies failed for {chunk_file}.")
+    store_if_requested(cache, cache_key, output_file, method, mafft_method, chunk_file, log_file)
     return output_file
 
 # -------------------- Progressive Merge --------------------
-def progressive_merge(aligned_files, seq_type, mafft_method, gap_open, gap_extend, threads, log_file=None):
-    step = 1
-    while len(aligned_files) > 1:
-        merged_files = []
-        for i in range(0, len(aligned_files), 2):
-            if i+1 < len(aligned_files):
-                out_file = f"merged_{step}_{i//2}.fasta"
-
-                def build_cmd(method):
-                    cmd = [find_binary("mafft"), "--thread", str(threads), "--merge", aligned_files[i], aligned_files[i+1]]
-                    if method == "linsi":
-                        cmd.insert(1, "--localpair")
-                        cmd.insert(2, "--maxiterate")
-                        cmd.insert(3, "1000")
-                    elif method == "einsi":
-                        cmd.insert(1, "--genafpair")
-                        cmd.insert(2, "--maxiterate")
-                        cmd.insert(3, "1000")
-                    elif method == "ginsi":
-                        cmd.insert(1, "--globalpair")
-                        cmd.insert(2, "--maxiterate")
-                        cmd.insert(3, "1000")
-                    elif method == "auto":
-                        cmd.insert(1, "--auto")
-                    if gap_open: cmd += ["--op", str(gap_open)]
-                    if gap_extend: cmd += ["--ep", str(gap_extend)]
-                    return cmd
-
-                methods_to_try = [mafft_method, "ginsi", "linsi", "auto"]
-                success = False
-                for method in methods_to_try:
-                    log(f"Trying MAFFT merge method '{method}' on {aligned_files[i]} + {aligned_files[i+1]}...", log_file)
-                    cmd = build_cmd(method)
-                    if run_mafft_with_fallback(cmd, out_file, f"{aligned_files[i]}+{aligned_files[i+1]}", log_file):
-                        success = True
-                        break
-                if not success:
-                    log(f"All MAFFT merge strategies failed. Exiting.", log_file)
-                    sys.exit(1)
+def balanced_merge_tree(n):
+    nodes = list(range(n))
+    while len(nodes) > 1:
+        nodes = [(nodes[i], nodes[i+1]) if i+1 < len(nodes) else nodes[i] for i in range(0, len(nodes), 2)]
+    return nodes[0] if nodes else None
+
+def merge_levels(tree, n_leaves):
+    # Flatten a nested-tuple tree into levels of (node, left, right); leaves are 0..n-1,
+    # internal nodes are numbered from n in post-order so the root is the last node.
+    levels = []
+    next_id = n_leaves
+    stack = [(tree, False)]
+    results = []
+    while stack:
+        node, expanded = stack.pop()
+        if not isinstance(node, tuple):
+            results.append((node, 0))
+        elif not expanded:
+            stack.append((node, True))
+            stack.append((node[1], False))
+            stack.append((node[0], False))
+        else:
+            (right, right_h), (left, left_h) = results.pop(), results.pop()
+            height = max(left_h, right_h) + 1
+            while len(levels) < height:
+                levels.append([])
+            levels[height - 1].append((next_id, left, right))
+            results.append((next_id, height))
+            next_id += 1
+    return levels
+
+def merge_pair(left_file, right_file, out_file, mafft_method, gap_open, gap_extend, threads, log_file=None, cache=None,
+               timeouts=None, budget=None, race=False):
+    cache_key = None
+    if cache is not None:
+        cache_key = merge_cache_key(left_file, right_file, mafft_method, gap_open, gap_extend)
+        if cache.fetch(cache_key, out_file):
+            log(f"Cache hit for merge {left_file} + {right_file}", log_file)
+            return out_file
+    if budget is not None and budget.remote is not None:
+        params = dict(method=mafft_method, gap_open=gap_open, gap_extend=gap_extend, threads=threads,
+                      **remote_timeouts(timeouts))
+        method = run_remote(budget.remote, "merge", f"{left_file} + {right_file}", out_file, params,
+                            {"left": left_file, "right": right_file}, log_file)
+        store_if_requested(cache, cache_key, out_file, method, mafft_method, f"{left_file} + {right_file}", log_file)
+        return out_file
+
+    def build_cmd(method, threads=threads):
+        cmd = [find_binary("mafft"), "--thread", str(threads), "--merge", left_file, right_file]
+        if method == "linsi":
+            cmd.insert(1, "--localpair")
+            cmd.insert(2, "--maxiterate")
+            cmd.insert(3, "1000")
+        elif method == "einsi":
+            cmd.insert(1, "--genafpair")
+            cmd.insert(2, "--maxiterate")
+            cmd.insert(3, "1000")
+        elif method == "ginsi":
+            cmd.insert(1, "--globalpair")
+            cmd.insert(2, "--maxiterate")
+            cmd.insert(3, "1000")
+        elif method == "auto":
+            cmd.insert(1, "--auto")
+        if gap_open: cmd += ["--op", str(gap_open)]
+        if gap_extend: cmd += ["--ep", str(gap_extend)]
+        return cmd
+
+    methods_to_try = list(dict.fromkeys([mafft_method, "ginsi", "linsi", "auto"]))
+    limits = None
+    if timeouts is not None:
+        sides = [scan_fasta(left_file), scan_fasta(right_file)]
+        limits = timeouts.limits(sum(len(side) for side in sides), sum(side.total_residues for side in sides),
+                                 methods_to_try, threads)
+    method = run_strategies(build_cmd, methods_to_try, out_file, f"{left_file} + {right_file}", log_file,
+                            limits=limits, budget=budget, race=race)
+    if method is None:
+        raise SwiftAlignError(f"All MAFFT merge strategies failed for {left_file} + {right_file}.")
+    store_if_requested(cache, cache_key, out_file, method, mafft_method, f"{left_file} + {right_file}", log_file)
+    return out_file
 
-                merged_files.append(out_file)
-                os.remove(aligned_files[i])
-                os.remove(aligned_files[i+1])
+def pending_merges(levels, done):
+    # Walk down from the root: merges still to run, and the inputs (leaves or finished merges) they read
+    children = {node: (left, right) for level in levels for node, left, right in level}
+    todo, inputs = set(), set()
+    stack = [levels[-1][-1][0]]
+    while stack:
+        node = stack.pop()
+        if node in done or node not in children:
+            inputs.add(node)
+        else:
+            todo.add(node)
+            stack.extend(children[node])
+    return todo, inputs
+
+def progressive_merge(aligned_files, seq_type, mafft_method, gap_open, gap_extend, threads, log_file=None, merge_tree=None,
+                      budget=None, cache=None, manifest=None, workdir=".", timeouts=None, race=False, leaf_jobs=(),
+                      window=None):
+    # leaf_jobs produce the aligned files still missing (None) in aligned_files; they run in the same job
+    # graph, so each merge starts as soon as its two inputs exist, and window throttles them
+    if merge_tree is None:
+        merge_tree = balanced_merge_tree(len(aligned_files))
+    levels = merge_levels(merge_tree, len(aligned_files))
+    if not levels and not leaf_jobs:
+        return aligned_files[0]
+    done = manifest.artifacts("merges") if manifest else {}
+    todo = pending_merges(levels, done)[0] if levels else set()
+    if done:
+        log(f"Resuming merge tree: {len(done)} merges already complete, {len(todo)} to run.", log_file)
+    budget = budget or CoreBudget(threads)
+    lock = threading.Lock()
+    level_left = [len(level) for level in levels]
+    remaining = [len(aligned_files)]
+
+    def make_merge(step, node, deps, out_file):
+        def run(cores, inputs):
+            merged = merge_pair(inputs[0], inputs[1], out_file, mafft_method, gap_open, gap_extend, cores, log_file, cache,
+                                timeouts, budget, race)
+            if manifest is not None:
+                manifest.record("merges", merged, key=node)
+            os.remove(inputs[0])
+            os.remove(inputs[1])
+            if window is not None:
+                window.merged(node, deps)
+            with lock:
+                remaining[0] -= 1
+                level_left[step - 1] -= 1
+                if level_left[step - 1] == 0:
+                    log(f"Progressive merge step {step} complete. {remaining[0]} files remaining.", log_file)
+            return merged
+        return run
+
+    jobs = list(leaf_jobs)
+    for step, level in enumerate(levels, 1):
+        for i, (node, left, right) in enumerate(level):
+            if node in todo:
+                out_file = os.path.join(workdir, f"merged_{step}_{i}.fasta")
+                jobs.append(Job(node, (left, right), make_merge(step, node, (left, right), out_file), priority=-step))
             else:
-                merged_files.append(aligned_files[i])
-        aligned_files = merged_files
-        log(f"Progressive merge step {step} complete. {len(aligned_files)} files remaining.", log_file)
-        step += 1
-    return aligned_files[0]
+                level_left[step - 1] -= 1
+    results = {idx: path for idx, path in enumerate(aligned_files) if path is not None}
+    results.update(done)
+    results = run_job_graph(jobs, budget, results=results, admit=window.admit if window is not None else None)
+    return results[levels[-1][-1][0] if levels else 0]
+
+def streaming_leaf_order(tree):
+    # Leaves in the order that keeps the fewest aligned chunks and partial merges alive when every merge
+    # runs as soon as both inputs exist (the subtree needing more goes first), and that number
+    results = []
+    stack = [(tree, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if not isinstance(node, tuple):
+            results.append(([node], 1))
+        elif not expanded:
+            stack += [(node, True), (node[1], False), (node[0], False)]
+        else:
+            right, left = results.pop(), results.pop()
+            if right[1] > left[1]:
+                left, right = right, left
+            results.append((left[0] + right[0], max(left[1], right[1] + 1)))
+    return results[0] if results else ([], 0)
+
+# -------------------- Cluster Tasks --------------------
+MAX_REMOTE_TASKS = 256          # job threads that may wait on cluster tasks at once
+
+def remote_timeouts(timeouts):
+    # Workers apply the same strategy time limits, predicted with the default rate
+    return {"timeout_factor": timeouts.factor if timeouts else 0, "min_timeout": timeouts.floor if timeouts else 0}
+
+def run_remote(coordinator, kind, label, output_file, params, files, log_file=None):
+    # Runs a chunk or merge task on a cluster worker, which streams the aligned FASTA back to output_file;
+    # files are bytes or paths streamed to the worker. Returns the MAFFT method that produced the output
+    started = time.time()
+    try:
+        result = coordinator.run(kind, params, files, {"output": output_file})
+    except RemoteError as e:
+        raise SwiftAlignError(f"Cluster {kind} task for {label} failed: {e}") from e
+    log(f"Worker {result['worker']} aligned {label} in {time.time() - started:.2f} sec", log_file)
+    record_strategy_time(result.get("seconds"), result.get("method"))
+    return result.get("method")
+
+def start_coordinator(args, log_file=None):
+    host, port = parse_address(args.coordinator)
+    try:
+        coordinator = Coordinator(host, port, args.cluster_token, log=lambda message: log(message, log_file))
+    except OSError as e:
+        raise SwiftAlignError(f"Cannot listen on {args.coordinator}: {e}") from e
+    shown = f"{socket.gethostname() if host in ('', '0.0.0.0') else host}:{coordinator.address[1]}"
+    log(f"Coordinator listening on {shown}; start workers with: swiftalign-worker {shown}", log_file)
+    if not args.cluster_token:
+        log("Warning: no --cluster_token set; any host that can reach this port can pull tasks.", log_file)
+    return coordinator
+
+def cluster_budget(coordinator, threads, pool=None):
+    # Tasks in flight are bounded by the cores the workers register, not by this node's --threads, which
+    # still bounds the work that stays here. The pool only has to be wide enough for the threads that
+    # wait on cluster tasks
+    pool = pool or ThreadPoolExecutor(max_workers=MAX_REMOTE_TASKS, thread_name_prefix="job")
+    budget = CoreBudget(1, pool=pool, remote=coordinator, local=CoreBudget(threads, pool=pool))
+    coordinator.watch_capacity(budget.resize)
+    return budget
+
+def run_task(kind, params, files, workdir, cancel=None):
+    # Worker side of run_remote: the local MAFFT wrappers on the input files streamed to workdir.
+    # Setting cancel (the coordinator took the task back) stops the running MAFFT through the supervisor
+    timeouts = StrategyTimeouts(params["timeout_factor"], params["min_timeout"])
+    with strategy_clock() as clock, cancel_scope([cancel] if cancel is not None else []):
+        if kind == "chunk":
+            chunk = ChunkSpec(os.path.join(workdir, "chunk"), None, None, params["seq_count"], params["residues"])
+            with open(files["chunk"], "rb") as handle:
+                chunk_data = handle.read()
+            output = run_mafft_chunk(chunk, params["seq_type"], params["method"], params["gap_open"], params["gap_extend"],
+                                     params["threads"], timeouts=timeouts, chunk_data=chunk_data)
+        elif kind == "merge":
+            output = merge_pair(files["left"], files["right"], os.path.join(workdir, "merged.fasta"), params["method"],
+                                params["gap_open"], params["gap_extend"], params["threads"], timeouts=timeouts)
+        else:
+            raise SwiftAlignError(f"Unknown cluster task {kind!r}")
+    return {"method": clock.method, "seconds": clock.seconds, "files": {"output": output}}
+
+# -------------------- Run Manifest --------------------
+def run_fingerprint(args):
+    stat = os.stat(args.input) if args.input != "-" else None
+    return {"input": os.path.abspath(args.input) if stat else "-", "size": stat and stat.st_size,
+            "mtime_ns": stat and stat.st_mtime_ns,
+            "chunk_size": args.chunk_size, "chunking": args.chunking, "mode": args.mode,
+            "dedup": args.dedup, "dedup_identity": args.dedup_identity, "refine": args.refine,
+            "long_mode": args.long_mode, "long_threshold": args.long_threshold, "time_budget": args.time_budget}
+
+class RunManifest:
+    # Durable record of finished stages and their artifacts, rewritten atomically after every update
+    def __init__(self, path, fingerprint, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.resumed = False
+        self.data = {"fingerprint": fingerprint, "stages": {}}
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get("fingerprint") == fingerprint:
+                self.data = saved
+                self.resumed = True
+
+    def artifacts(self, stage):
+        entries = self.data["stages"].get(stage, {})
+        return {int(k) if k.isdigit() else k: v for k, v in entries.items() if os.path.exists(v)}
+
+    def done(self, stage, key="-"):
+        return self.artifacts(stage).get(key)
+
+    def record(self, stage, artifact, key="-"):
+        with self.lock:
+            self.data["stages"].setdefault(stage, {})[str(key)] = os.path.abspath(artifact)
+            self.save()
+
+    def save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.data, f, indent=1)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
 
 # -------------------- MUSCLE Refinement --------------------
 def run_muscle(input_fasta, output_fasta, max_iter=16, log_file=None):
@@ -238,78 +983,949 @@ def run_muscle(input_fasta, output_fasta, max_iter=16, log_file=None):
     cmd = [muscle_path, "-in", input_fasta, "-out", output_fasta, "-maxiters", str(max_iter)]
 
     try:
-        subprocess.run(cmd, check=True)
+        run_command(cmd)
         elapsed = time.time() - start
         log(f"MUSCLE refinement completed in {elapsed:.2f} sec", log_file)
     except subprocess.CalledProcessError as e:
-        log(f"Error running MUSCLE: {e}", log_file)
-        sys.exit(1)
+        raise SwiftAlignError(f"Error running MUSCLE: {e}") from e
+
+# -------------------- Windowed Realignment --------------------
+def read_alignment_rows(fasta_file):
+    index = scan_fasta(fasta_file)
+    return [(record.description, seq) for record, seq in index.iter_sequences()]
+
+def write_alignment_rows(rows, fasta_file):
+    with open(fasta_file, "wb") as out:
+        for header, row in rows:
+            out.write(b">" + header.encode() + b"\n" + row + b"\n")
+
+def gap_disagreement_windows(rows, n_reference, pad=5):
+    # Column windows where any added row's gap state differs from the reference majority
+    if len(rows) <= n_reference or not rows[0][1]:
+        return []
+    matrix = np.frombuffer(b"".join(row for _, row in rows), dtype=np.uint8).reshape(len(rows), -1)
+    gaps = matrix == ord("-")
+    reference_gap = gaps[:n_reference].mean(axis=0) >= 0.5
+    affected = (gaps[n_reference:] != reference_gap).any(axis=0)
+    affected = np.convolve(affected, np.ones(2 * pad + 1), mode="same") > 0
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], affected.astype(np.int8), [0]))))
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+def realign_window(rows, start, end, out_prefix, threads, log_file=None, program="mafft", max_iter=2):
+    # Realign columns [start, end) of every row with MAFFT or MUSCLE; returns the new block of each row
+    pieces = [row[start:end].replace(b"-", b"") for _, row in rows]
+    filled = [i for i, piece in enumerate(pieces) if piece]
+    if len(filled) < 2:
+        width = max((len(piece) for piece in pieces), default=0)
+        return [piece.ljust(width, b"-") for piece in pieces]
+    window_input = b"".join(b">%d\n%s\n" % (i, pieces[i]) for i in filled)
+    output_file = f"{out_prefix}.aligned.fasta"
+    if program == "muscle":
+        with open(f"{out_prefix}.fasta", "wb") as out:
+            out.write(window_input)
+        run_muscle(f"{out_prefix}.fasta", output_file, max_iter=max_iter, log_file=log_file)
+        os.remove(f"{out_prefix}.fasta")
+    else:
+        cmd = [find_binary("mafft"), "--thread", str(threads), "--auto", "--preservecase", "-"]
+        if not run_mafft_with_fallback(cmd, output_file, out_prefix, log_file, input_data=window_input):
+            raise SwiftAlignError(f"MAFFT failed to realign columns {start}-{end}.")
+    aligned = {int(header): row for header, row in read_alignment_rows(output_file)}
+    os.remove(output_file)
+    width = len(next(iter(aligned.values())))
+    return [aligned.get(i, b"-" * width) for i in range(len(rows))]
+
+def realign_windows(rows, windows, budget, workdir, log_file=None, realign=realign_window):
+    # Realign non-overlapping column windows concurrently and stitch them back into every row
+    def make_window_job(k, start, end):
+        return Job(k, run=lambda cores, _: realign(rows, start, end, os.path.join(workdir, f"window_{k}"), cores, log_file),
+                   cores=1, priority=end - start)
+    blocks = run_job_graph([make_window_job(k, s, e) for k, (s, e) in enumerate(windows)], budget)
+    stitched = []
+    for i, (header, row) in enumerate(rows):
+        parts, pos = [], 0
+        for k, (start, end) in enumerate(windows):
+            parts += [row[pos:start], blocks[k][i]]
+            pos = end
+        parts.append(row[pos:])
+        stitched.append((header, b"".join(parts)))
+    return stitched
+
+# -------------------- Partitioned Refinement --------------------
+MIN_WINDOW = 50
+ANCHOR_CONSERVATION = 0.9
+AUTO_SKIP_VARIABLE = 0.02       # 'auto' skips refinement when fewer columns than this are gapped or variable
+AUTO_WHOLE_SECONDS = 120        # ... and refines the whole alignment at once when that is predicted to be this quick
+
+def refinement_cost(seq_count, total_length, max_iter):
+    return estimate_job_cost(seq_count, total_length, "muscle") * max_iter
+
+def alignment_matrix(rows):
+    return np.frombuffer(b"".join(row for _, row in rows), dtype=np.uint8).reshape(len(rows), -1)
+
+def conserved_columns(matrix, conservation=ANCHOR_CONSERVATION):
+    # Gap-free columns whose most frequent residue (ignoring case) reaches the conservation threshold
+    gapless = ~(matrix == ord("-")).any(axis=0)
+    upper = matrix & 0xDF
+    top = np.zeros(matrix.shape[1], dtype=np.int64)
+    for value in np.unique(upper[:, gapless]):
+        top = np.maximum(top, (upper == value).sum(axis=0))
+    return gapless & (top >= conservation * matrix.shape[0])
+
+def anchor_windows(anchors, target_width):
+    # Column windows of at least target_width, each ending just after a conserved anchor column
+    width = anchors.size
+    positions = np.flatnonzero(anchors)
+    windows, start = [], 0
+    while start < width:
+        later = positions[positions >= start + target_width - 1]
+        end = int(later[0]) + 1 if later.size else width
+        if width - end < MIN_WINDOW:
+            end = width
+        windows.append((start, end))
+        start = end
+    return windows
+
+def sketch_subgroups(rows, seq_type, n_groups):
+    # Cluster rows by k-mer sketch into about n_groups subgroups, with a guide tree over the subgroups
+    signatures = np.stack([sketch_sequence(row.replace(b"-", b""), seq_type) for _, row in rows])
+    groups = cluster_sketches(signatures, math.ceil(len(rows) / n_groups))
+    return groups, guide_tree(group_signatures(signatures, groups))
+
+def refine_alignment(merged_file, output_file, strategy, seq_type, max_iter, budget, workdir, log_file=None,
+                     seconds_per_cost=0.0, max_seconds=None, merge_params=("auto", None, None)):
+    # Refine the merged alignment with MUSCLE, whole or in parts; returns the refined file,
+    # or merged_file itself when refinement is skipped
+    start = time.time()
+    if strategy == "none":
+        log("Skipping refinement.", log_file)
+        return merged_file
+    if strategy == "muscle":
+        # Whole-alignment MUSCLE only needs the residue count, so the alignment is not loaded
+        index = scan_fasta(merged_file)
+        gap_share = index.residue_counts[ord("-")] / max(index.classified_residues, 1)
+        n_rows, residues = len(index), int(index.total_residues * (1.0 - gap_share))
+    else:
+        rows = read_alignment_rows(merged_file)
+        matrix = alignment_matrix(rows)
+        anchors = conserved_columns(matrix)
+        n_rows, residues = len(rows), int((matrix != ord("-")).sum())
+    whole = refinement_cost(n_rows, residues, max_iter) * (seconds_per_cost or DEFAULT_SECONDS_PER_COST)
+    if strategy == "auto":
+        variable = 1.0 - anchors.mean() if anchors.size else 0.0
+        strategy = "none" if variable < AUTO_SKIP_VARIABLE else "muscle" if whole <= AUTO_WHOLE_SECONDS else "windows"
+        log(f"Refinement plan: {strategy} ({variable:.1%} variable columns, whole-alignment MUSCLE predicted "
+            f"{whole:.0f} sec)", log_file)
+        if strategy == "none":
+            return merged_file
+    if strategy == "subgroups" and n_rows < 4:
+        strategy = "muscle"
+
+    if strategy == "windows":
+        parts = anchor_windows(anchors, max(MIN_WINDOW, math.ceil(matrix.shape[1] / (2 * budget.cores))))
+    elif strategy == "subgroups":
+        parts, tree = sketch_subgroups(rows, seq_type, max(2, budget.cores))
+    else:
+        parts = [None]
+    predicted = whole / min(len(parts), budget.cores)
+    if max_seconds and predicted > max_seconds:
+        capped = math.floor(max_iter * max_seconds / predicted)
+        if capped < 1:
+            log(f"Skipping refinement: predicted {predicted:.0f} sec exceeds --refine_max_seconds {max_seconds:.0f}.", log_file)
+            return merged_file
+        log(f"Capping MUSCLE at {capped} iterations (predicted {predicted:.0f} sec for {max_iter}).", log_file)
+        max_iter = capped
+
+    if strategy == "windows":
+        log(f"Refining {len(parts)} column windows separated by conserved anchor columns.", log_file)
+        realign = functools.partial(realign_window, program="muscle", max_iter=max_iter)
+        write_alignment_rows(realign_windows(rows, parts, budget, workdir, log_file, realign=realign), output_file)
+    elif strategy == "subgroups":
+        log(f"Refining {len(parts)} sequence subgroups, then re-merging them along their guide tree.", log_file)
+        # A private directory, so the re-merge cannot overwrite the main merge's merged_*.fasta files
+        subgroup_dir = os.path.join(workdir, "subgroups")
+        os.makedirs(subgroup_dir, exist_ok=True)
+
+        def make_subgroup_job(k, group):
+            def run(cores, _):
+                unaligned = os.path.join(subgroup_dir, f"subgroup_{k}.fasta")
+                refined = os.path.join(subgroup_dir, f"subgroup_{k}.refined.fasta")
+                # Rows are named by their position, so the merged rows can be put back in input order
+                write_alignment_rows([(str(i), rows[i][1].replace(b"-", b"")) for i in group], unaligned)
+                run_muscle(unaligned, refined, max_iter=max_iter, log_file=log_file)
+                os.remove(unaligned)
+                return refined
+            return Job(k, run=run, cores=1, priority=len(group))
+
+        refined = run_job_graph([make_subgroup_job(k, group) for k, group in enumerate(parts)], budget)
+        merged = progressive_merge([refined[k] for k in range(len(parts))], seq_type, *merge_params, budget.cores, log_file,
+                                   merge_tree=tree, budget=budget, workdir=subgroup_dir)
+        merged_rows = sorted(read_alignment_rows(merged), key=lambda row: int(row[0]))
+        write_alignment_rows([(rows[int(position)][0], row) for position, row in merged_rows], output_file)
+        shutil.rmtree(subgroup_dir, ignore_errors=True)
+    else:
+        # One single-threaded job, so MUSCLE takes its core from the shared budget like every other job
+        muscle = Job("muscle", run=lambda cores, _: run_muscle(merged_file, output_file, max_iter, log_file), cores=1)
+        run_job_graph([muscle], budget)
+        return output_file
+    log(f"Partitioned refinement completed in {time.time() - start:.2f} sec", log_file)
+    return output_file
+
+# -------------------- Long-Sequence Mode --------------------
+SEGMENT_LENGTH = 2000           # target residues per segment, measured on the first sequence
+EXACT_SEGMENT_LENGTH = 5000     # longer segments (no anchors nearby) are aligned with FFT-NS-2
+
+def use_long_mode(seqs, long_mode, threshold):
+    if long_mode != "auto":
+        return long_mode == "on"
+    return len(seqs) > 1 and float(np.median(sequence_lengths(seqs))) >= threshold
+
+def align_long_sequences(seqs, seq_type, mafft_method, gap_open, gap_extend, budget, workdir, output_file, log_file=None,
+                         cache=None, timeouts=None, segment_length=SEGMENT_LENGTH):
+    # Cut the sequences at the collinear anchors most of them share, align the segments concurrently and concatenate
+    # them; sequences without those anchors are added to the result with MAFFT --add. Returns the number of
+    # segments, or None (nothing aligned) when the anchors give fewer than two
+    start = time.time()
+    records = list(seqs)
+    residues = [seqs.sequence(record) for record in records]
+    positions, members = find_anchors(residues, seq_type)
+    anchors = chain_anchors(positions, ANCHOR_K[seq_type])
+    bounds = segment_bounds([len(residues[i]) for i in members], anchors, segment_length)
+    n_segments = bounds.shape[1] - 1
+    if n_segments < 2:
+        log(f"Long-sequence mode: no collinear anchors shared by most of the {len(records)} sequences; "
+            f"using chunked alignment instead.", log_file)
+        return None
+    outsiders = sorted(set(range(len(records))) - set(members.tolist()))
+    log(f"Long-sequence mode: {anchors.shape[1]} collinear anchors shared by {len(members)} of {len(records)} "
+        f"sequences; aligning {n_segments} segments", log_file)
+
+    def make_segment_job(j):
+        pieces = [residues[i][bounds[m, j]:bounds[m, j + 1]] for m, i in enumerate(members)]
+        filled = [m for m, piece in enumerate(pieces) if piece]
+        longest = max((len(piece) for piece in pieces), default=0)
+        method = mafft_method if longest <= EXACT_SEGMENT_LENGTH else "auto"
+        data = b"".join(b">%d\n%s\n" % (m, pieces[m]) for m in filled)
+
+        def run(cores, _):
+            if len(filled) < 2:
+                return [piece.ljust(longest, b"-") for piece in pieces]
+            segment = ChunkSpec(os.path.join(workdir, f"segment_{j}"), None, None, len(filled), sum(map(len, pieces)))
+            key = chunk_cache_key(data, method, gap_open, gap_extend) if cache is not None else None
+            if cache is None or not cache.fetch(key, f"{segment.name}.aligned.fasta"):
+                run_mafft_chunk(segment, seq_type, method, gap_open, gap_extend, cores, log_file, cache, key, timeouts,
+                                budget, chunk_data=data)
+            aligned = {int(header): row for header, row in read_alignment_rows(f"{segment.name}.aligned.fasta")}
+            os.remove(f"{segment.name}.aligned.fasta")
+            width = len(next(iter(aligned.values())))
+            return [aligned.get(m, b"-" * width) for m in range(len(members))]
+        return Job(j, run=run, priority=estimate_job_cost(len(filled), sum(map(len, pieces)), method))
+
+    blocks = run_job_graph([make_segment_job(j) for j in range(n_segments)], budget)
+    # Rows are named by input position until the end, so the added sequences can be put back in input order
+    rows = [(str(i), b"".join(blocks[j][m] for j in range(n_segments))) for m, i in enumerate(members.tolist())]
+    if outsiders:
+        log(f"Adding {len(outsiders)} sequences without the shared anchors to the segmented alignment.", log_file)
+        core_file, outsider_file = os.path.join(workdir, "long_core.fasta"), os.path.join(workdir, "long_outsiders.fasta")
+        added_file = os.path.join(workdir, "long_added.fasta")
+        write_alignment_rows(rows, core_file)
+        write_alignment_rows([(str(i), residues[i]) for i in outsiders], outsider_file)
+        add = Job("add", run=lambda cores, _: run_mafft_add(outsider_file, core_file, added_file, cores, log_file=log_file),
+                  cores=budget.local.cores)
+        run_job_graph([add], budget.local)
+        rows = read_alignment_rows(added_file)
+        for path in (core_file, outsider_file, added_file):
+            os.remove(path)
+        if sorted(int(header) for header, _ in rows) != list(range(len(records))):
+            raise SwiftAlignError("MAFFT --add returned an unexpected alignment for the sequences without anchors.")
+    rows = sorted(rows, key=lambda row: int(row[0]))
+    write_alignment_rows([(record.description, row) for record, (_, row) in zip(records, rows)], output_file)
+    log(f"Long-sequence alignment completed in {time.time() - start:.2f} sec", log_file)
+    return n_segments
+
+# -------------------- Incremental Add Mode --------------------
+def run_mafft_add(batch_file, reference_fasta, output_file, threads, fragments=False, keeplength=False, log_file=None):
+    cmd = [find_binary("mafft"), "--thread", str(threads), "--preservecase",
+           "--addfragments" if fragments else "--add", batch_file, reference_fasta]
+    if keeplength:
+        cmd.insert(3, "--keeplength")
+    if not run_mafft_with_fallback(cmd, output_file, batch_file, log_file):
+        raise SwiftAlignError(f"MAFFT could not add {batch_file} to the reference alignment.")
+
+def gap_columns(matrix):
+    # The gap pattern of every column of an alignment matrix, one bytes object per column
+    return [column.tobytes() for column in np.packbits(matrix == ord("-"), axis=0).T]
+
+def reference_columns(block, reference_gaps):
+    # Which columns of the reference rows of a batch's MAFFT --add output are the reference's own columns;
+    # the others are gap-only insertions MAFFT opened for the added sequences. Returns None when the
+    # reference rows were changed in any other way
+    gap_only = (block == ord("-")).all(axis=0)
+    mask = np.zeros(block.shape[1], dtype=bool)
+    i = 0
+    for j, column in enumerate(gap_columns(block)):
+        if i < len(reference_gaps) and column == reference_gaps[i]:
+            mask[j] = True
+            i += 1
+        elif not gap_only[j]:
+            return None
+    return mask if i == len(reference_gaps) else None
+
+def merge_added_batches(reference_rows, batches):
+    # Stack the added rows of every batch under the reference rows. batches holds (rows, mask) pairs, mask marking
+    # the reference's own columns in the batch output. Reference columns are shared; the insertion columns the
+    # batches opened at the same place (before reference column g, or at the end for g = width) are overlaid
+    # left-aligned in one slot as wide as the widest of them, so every residue is kept
+    width = len(reference_rows[0][1])
+    slots, counts = [], []
+    for rows, mask in batches:
+        slot = np.cumsum(mask) - mask
+        slots.append(slot)
+        counts.append(np.bincount(slot[~mask], minlength=width + 1))
+    inserted = np.max(counts, axis=0) if counts else np.zeros(width + 1, dtype=np.int64)
+    before = np.concatenate(([0], np.cumsum(inserted)))
+    slot_start = np.arange(width + 1) + before[:-1]
+    column_position = np.arange(width) + before[1:-1]
+
+    merged_width = width + int(before[-1])
+    reference = np.full((len(reference_rows), merged_width), ord("-"), dtype=np.uint8)
+    reference[:, column_position] = alignment_matrix(reference_rows)
+    merged = [(header, row.tobytes()) for (header, _), row in zip(reference_rows, reference)]
+    for (rows, mask), slot, count in zip(batches, slots, counts):
+        if not rows:
+            continue
+        batch_before = np.concatenate(([0], np.cumsum(count)))
+        # an insertion column goes to its slot's start plus its place in the batch's own slot
+        target = slot_start[slot] + np.arange(len(mask)) - (slot + batch_before[slot])
+        target[mask] = column_position[slot[mask]]
+        block = np.full((len(rows), merged_width), ord("-"), dtype=np.uint8)
+        block[:, target] = alignment_matrix(rows)
+        merged += [(header, row.tobytes()) for (header, _), row in zip(rows, block)]
+    return merged, int(before[-1])
+
+MAX_LISTED_TRUNCATIONS = 20
+
+def run_add_pipeline(args, workdir, log_file=None):
+    start_time = time.time()
+    reference = args.input
+    if input_compression(reference) is not None:
+        # MAFFT --add needs the reference as a file
+        reference = os.path.join(workdir, "reference_input")
+        with open_input(args.input, args.threads) as source, open(reference, "wb") as out:
+            shutil.copyfileobj(source, out)
+    if args.reference_format != "fasta":
+        converted = os.path.join(workdir, "reference.fasta")
+        AlignIO.convert(reference, args.reference_format, converted, "fasta")
+        reference = converted
+    reference_rows = read_alignment_rows(reference)
+    if not reference_rows:
+        raise SwiftAlignError(f"The reference alignment {args.input} has no sequences.")
+    width = len(reference_rows[0][1])
+    log(f"Reference alignment: {len(reference_rows)} sequences, {width} columns", log_file)
+    # Without --keeplength each batch may open insertion columns; they are told apart from the reference's own
+    # columns by gap pattern, which MAFFT --add leaves unchanged
+    reference_gaps = None if args.keeplength else gap_columns(alignment_matrix(reference_rows))
+
+    seq_type, new_seqs = detect_sequence_type(args.add, log_file, args.threads)
+    batches = chunk_fasta(new_seqs, args.chunk_size, log_file, workdir=workdir)
+    budget = CoreBudget(args.threads)
+    costs = [estimate_job_cost(len(reference_rows) + b.seq_count, b.residues + b.seq_count * width, "auto") for b in batches]
+    batch_threads = assign_threads(costs, args.threads)
+    progress = JobProgress(len(batches), sum(costs), args.threads, log_file)
+
+    def make_add_job(k, batch):
+        def run(cores, _):
+            started = time.time()
+            batch_file, output_file = f"{batch.name}.fasta", f"{batch.name}.added.fasta"
+            with open(batch_file, "wb") as out:
+                out.write(read_chunk(batch))
+            run_mafft_add(batch_file, reference, output_file, cores, args.add_fragments, args.keeplength, log_file)
+            rows = read_alignment_rows(output_file)
+            added = rows[len(reference_rows):]
+            mask = None
+            if len(added) == batch.seq_count and len({len(row) for _, row in rows}) == 1:
+                if not args.keeplength:
+                    mask = reference_columns(alignment_matrix(rows[:len(reference_rows)]), reference_gaps)
+                elif len(rows[0][1]) == width:
+                    mask = np.ones(width, dtype=bool)
+            if mask is None:
+                raise SwiftAlignError(f"MAFFT --add returned an unexpected alignment for {batch.name}.")
+            # --keeplength deletes residues that fall in columns the reference has no place for; without it none may go
+            input_residues = [len(seq) - seq.count(b"-") for _, seq in scan_fasta(batch_file).iter_sequences()]
+            kept_residues = [len(row) - row.count(b"-") for _, row in added]
+            truncated = [(header.partition(" ")[0], kept, expected)
+                         for (header, _), kept, expected in zip(added, kept_residues, input_residues) if kept < expected]
+            if truncated and not args.keeplength:
+                name, kept, expected = truncated[0]
+                raise SwiftAlignError(f"MAFFT --add lost residues of {name} ({kept} of {expected} kept) in {batch.name}.")
+            os.remove(batch_file)
+            os.remove(output_file)
+            progress.finish(batch.name, costs[k], cores, time.time() - started, f"n={batch.seq_count}, ")
+            return added, mask, truncated
+        return Job(k, run=run, cores=batch_threads[k], priority=costs[k])
+
+    with STAGE_REPORT.stage("add_mafft"):
+        results = run_job_graph([make_add_job(k, batch) for k, batch in enumerate(batches)], budget)
+    rows, inserted = merge_added_batches(reference_rows, [results[k][:2] for k in range(len(batches))])
+    if inserted:
+        log(f"The added sequences opened {inserted} insertion columns relative to the reference.", log_file)
+    truncated = [entry for k in range(len(batches)) for entry in results[k][2]]
+    if truncated:
+        log(f"Warning: --keeplength dropped residues of {len(truncated)} added sequences that fall in reference "
+            f"insertion columns:", log_file)
+        for name, kept, expected in truncated[:MAX_LISTED_TRUNCATIONS]:
+            log(f"  {name}: {kept} of {expected} residues kept", log_file)
+        if len(truncated) > MAX_LISTED_TRUNCATIONS:
+            log(f"  ... and {len(truncated) - MAX_LISTED_TRUNCATIONS} more", log_file)
+
+    if args.refine_added:
+        windows = gap_disagreement_windows(rows, len(reference_rows))
+        log(f"Refining {len(windows)} windows ({sum(e - s for s, e in windows)} columns) affected by the new sequences.", log_file)
+        with STAGE_REPORT.stage("refine"):
+            rows = realign_windows(rows, windows, budget, workdir, log_file)
+
+    final_fasta = os.path.join(workdir, "added_final.fasta")
+    with STAGE_REPORT.stage("convert"):
+        write_alignment_rows(rows, final_fasta)
+        convert_format(final_fasta, args.output, args.format, log_file)
+    os.remove(final_fasta)
+
+    total_runtime = time.time() - start_time
+    log("\n=== SwiftAlign Summary Report ===", log_file)
+    log(f"Reference sequences: {len(reference_rows)}", log_file)
+    log(f"Sequences added: {len(new_seqs)} in {len(batches)} batches", log_file)
+    log(f"Final number of sequences: {len(rows)}", log_file)
+    log(f"Alignment length: {len(rows[0][1]) if rows else 0} residues", log_file)
+    log(f"Total runtime: {total_runtime:.2f} sec ({total_runtime/60:.2f} min)", log_file)
+    log("================================", log_file)
 
 # -------------------- Convert Format --------------------
-def convert_format(input_fasta, output_file, out_format, log_file=None):
-    alignment = AlignIO.read(input_fasta, "fasta")
-    AlignIO.write(alignment, output_file, out_format)
+def convert_format(input_fasta, output_file, out_format, log_file=None, scratch_dir=None):
+    # Streams the output from a uint8 matrix (memory-mapped in scratch_dir when large) instead of SeqRecords
+    alignment = Alignment.from_fasta(input_fasta, scratch_dir)
+    alignment.write(output_file, out_format)
     log(f"Alignment saved in {out_format} format at: {output_file}", log_file)
     return alignment
 
-# -------------------- Main Pipeline --------------------
-def main():
-    print_header()
+# -------------------- Time-Budget Planner --------------------
+Plan = namedtuple("Plan", ["mafft_method", "merge_method", "chunk_size", "refine", "muscle_max_iter", "divergence",
+                           "predicted"])
+MIN_PLAN_CHUNK = 25
+
+def predict_stages(lengths, seq_type, divergence, model, cores, method, merge_method, chunk_size, refine, max_iter):
+    # Predicted wall seconds of the chunk, merge and refinement stages for one choice of settings,
+    # assuming equal chunks, a balanced merge tree and all cores busy
+    n, total = len(lengths), float(np.sum(lengths))
+    mean_length = total / max(n, 1)
+    nodes = max(1, math.ceil(n / chunk_size))
+    size = n / nodes
+    chunks = nodes * model.predict(seq_type, estimate_job_cost(size, size * mean_length, method), divergence)
+    merges = 0.0
+    while nodes > 1:
+        pairs = nodes // 2
+        nodes -= pairs
+        size = n / nodes
+        merges += pairs * model.predict(seq_type, estimate_job_cost(size, size * mean_length, merge_method), divergence)
+    refinement = 0.0
+    if refine != "none":
+        refinement = model.predict(seq_type, refinement_cost(n, total, max_iter), divergence)
+        if refine in ("windows", "subgroups"):
+            refinement /= cores
+    return {"chunk_mafft": chunks / cores, "merge": merges / cores, "refine": refinement}
+
+def plan_run(seqs, seq_type, mafft_method, muscle_max_iter, args, model, log_file=None):
+    # The best settings predicted to finish within --time_budget. Settings are given up in order of
+    # their effect on quality: chunk size first, then refinement depth, the merge method and the MAFFT method
+    lengths = sequence_lengths(seqs)
+    divergence = sampled_divergence(seqs, seq_type)
+    methods = dict.fromkeys([mafft_method, "ginsi", "auto"] if mafft_method != "auto" else ["auto"])
+    refines = [("none", 0)]
+    if args.refine != "none":
+        light = max(2, muscle_max_iter // 4)
+        refines = [(args.refine, muscle_max_iter), (args.refine, light)]
+        refines += [("windows", light)] if args.refine in ("muscle", "auto") else []
+        refines += [("none", 0)]
+    floor = min(args.chunk_size, MIN_PLAN_CHUNK)
+    chunk_sizes = sorted({args.chunk_size, max(floor, args.chunk_size // 2), max(floor, args.chunk_size // 4)}, reverse=True)
+    fastest = None
+    for method in methods:
+        for merge_method in dict.fromkeys([method, "auto"]):
+            for refine, max_iter in dict.fromkeys(refines):
+                for chunk_size in chunk_sizes:
+                    predicted = predict_stages(lengths, seq_type, divergence, model, args.threads, method, merge_method,
+                                               chunk_size, refine, max_iter)
+                    plan = Plan(method, merge_method, chunk_size, refine, max_iter, divergence, predicted)
+                    if sum(predicted.values()) <= args.time_budget:
+                        log_plan(plan, args.time_budget, log_file)
+                        return plan
+                    if fastest is None or sum(predicted.values()) < sum(fastest.predicted.values()):
+                        fastest = plan
+    log(f"Warning: no settings are predicted to finish within {args.time_budget:.0f} sec; using the fastest plan.", log_file)
+    log_plan(fastest, args.time_budget, log_file)
+    return fastest
+
+def log_plan(plan, time_budget, log_file=None):
+    predicted = plan.predicted
+    log(f"Time budget {time_budget:.0f} sec (sampled k-mer divergence {plan.divergence:.3f}): MAFFT {plan.mafft_method}, "
+        f"merges {plan.merge_method}, chunk size {plan.chunk_size}, refinement {plan.refine}"
+        f"{f' ({plan.muscle_max_iter} iterations)' if plan.refine != 'none' else ''}", log_file)
+    log(f"  Predicted: {sum(predicted.values()):.0f} sec (chunks {predicted['chunk_mafft']:.0f}, "
+        f"merges {predicted['merge']:.0f}, refinement {predicted['refine']:.0f})", log_file)
+
+# -------------------- Batch Mode --------------------
+BATCH_SUFFIXES = (".fasta", ".fa", ".fas", ".fna", ".faa", ".ffn")
+COMPRESSED_SUFFIXES = (".gz", ".bgz", ".zst")
+FORMAT_SUFFIX = {"fasta": ".fasta", "clustal": ".aln", "phylip": ".phy"}
+
+def strip_compression(name):
+    return next((name[:-len(suffix)] for suffix in COMPRESSED_SUFFIXES if name.lower().endswith(suffix)), name)
+
+def batch_inputs(source, output_dir, out_format):
+    # (input, output) pairs from a directory of FASTA files, or from a manifest with one input per line,
+    # optionally followed by a tab and its output path (relative paths: inputs to the manifest, outputs to output_dir)
+    if os.path.isdir(source):
+        entries = [(os.path.join(source, name), None) for name in sorted(os.listdir(source))
+                   if strip_compression(name).lower().endswith(BATCH_SUFFIXES)]
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source) as handle:
+            fields = [line.rstrip("\n").split("\t") for line in handle if line.strip() and not line.startswith("#")]
+        entries = [(os.path.join(base, f[0].strip()), os.path.join(output_dir, f[1].strip()) if len(f) > 1 else None)
+                   for f in fields]
+    pairs, seen = [], set()
+    for path, output in entries:
+        output = output or os.path.join(output_dir, os.path.splitext(strip_compression(os.path.basename(path)))[0] + FORMAT_SUFFIX[out_format])
+        if output in seen:
+            raise SwiftAlignError(f"Two batch inputs would both be written to {output}.")
+        seen.add(output)
+        pairs.append((path, output))
+    if not pairs:
+        raise SwiftAlignError(f"No FASTA inputs found in {source}.")
+    return pairs
+
+def run_batch(args, workdir, log_file=None, remote=None):
+    # One pipeline run per input; all runs share one core budget and worker pool, so the jobs of
+    # small inputs fill the cores a single input would leave idle
+    start_time = time.time()
+    inputs = batch_inputs(args.input, args.output, args.format)
+    os.makedirs(args.output, exist_ok=True)
+    concurrent = min(len(inputs), args.batch_jobs or args.threads)
+    log(f"Batch: {len(inputs)} inputs, up to {concurrent} at a time on {args.threads} shared cores", log_file)
+
+    def align_one(k, budget):
+        path, output = inputs[k]
+        stem = os.path.splitext(os.path.basename(output))[0]
+        run_dir = os.path.join(workdir, f"{k}_{stem}")
+        if args.resume and os.path.exists(output) and not os.path.exists(run_dir):
+            return {"status": "done"}
+        os.makedirs(run_dir, exist_ok=True)
+        run_args = argparse.Namespace(**dict(vars(args), input=path, output=output, manifest=None))
+        run_log = os.path.join(os.path.dirname(output), f"{stem}.log") if log_file else None
+        try:
+            summary = run_pipeline(run_args, run_dir, run_log, budget)
+        except Exception as e:
+            # One bad input must not stop the others; its workspace is kept for --resume
+            log(f"Batch input {path} failed: {e}", log_file)
+            return {"status": "failed", "error": str(e)}
+        shutil.rmtree(run_dir, ignore_errors=True)
+        log(f"Batch input {path}: {summary['sequences']} sequences, {summary['alignment_length']} columns "
+            f"in {summary['runtime_sec']:.2f} sec", log_file)
+        return dict(summary, status="ok")
+
+    pool_size = args.threads if remote is None else max(args.threads, MAX_REMOTE_TASKS)
+    with ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="job") as pool, \
+            ThreadPoolExecutor(max_workers=concurrent, thread_name_prefix="batch") as drivers:
+        budget = CoreBudget(args.threads, pool=pool) if remote is None else cluster_budget(remote, args.threads, pool)
+        try:
+            results = list(drivers.map(lambda k: align_one(k, budget), range(len(inputs))))
+        except BaseException:
+            kill_active_processes()
+            raise
+
+    summary_file = os.path.join(args.output, "batch_summary.tsv")
+    columns = ["status", "sequences", "alignment_length", "chunks", "runtime_sec", "error"]
+    with open(summary_file, "w") as out:
+        out.write("\t".join(["input", "output"] + columns) + "\n")
+        for (path, output), result in zip(inputs, results):
+            out.write("\t".join([path, output] + [str(result.get(c, "")) for c in columns]) + "\n")
+    failed = sum(result["status"] == "failed" for result in results)
+    total_runtime = time.time() - start_time
+
+    log("\n=== SwiftAlign Batch Summary ===", log_file)
+    log(f"Inputs: {len(inputs)} ({failed} failed)", log_file)
+    log(f"Sequences aligned: {sum(result.get('sequences', 0) for result in results)}", log_file)
+    log(f"Per-input summary: {summary_file}", log_file)
+    log(f"Total runtime: {total_runtime:.2f} sec ({total_runtime/60:.2f} min)", log_file)
+    log("================================", log_file)
+    if failed:
+        raise SwiftAlignError(f"{failed} of {len(inputs)} batch inputs failed; see {summary_file}.")
 
+# -------------------- Main Pipeline --------------------
+def build_parser():
     parser = argparse.ArgumentParser(description="SwiftAlign: Hybrid MSA with Auto-Parameter Optimization + MAFFT Fallbacks")
-    parser.add_argument("-i", "--input", required=True, help="Input FASTA file")
-    parser.add_argument("-o", "--output", required=True, help="Output alignment file")
+    parser.add_argument("-i", "--input", required=True,
+                        help="Input FASTA file, plain or gzip/BGZF/zstd-compressed, or - for stdin "
+                             "(with --batch: directory or manifest of inputs)")
+    parser.add_argument("-o", "--output", required=True, help="Output alignment file (with --batch: output directory)")
     parser.add_argument("--format", default="fasta", choices=["fasta", "clustal", "phylip"])
     parser.add_argument("--chunk_size", type=int, default=200, help="Sequences per chunk")
+    parser.add_argument("--chunking", default="order", choices=["order", "similarity"],
+                        help="Chunk assignment: 'order' slices the input, 'similarity' clusters k-mer sketches")
     parser.add_argument("--threads", type=int, default=4, help="CPU threads for MAFFT")
     parser.add_argument("--mode", default="accurate", choices=["fast", "accurate"],
                         help="Alignment mode: 'fast' for speed, 'accurate' for quality")
     parser.add_argument("--log_file", default="swiftalign.log", help="Optional log file")
+    parser.add_argument("--add", default=None,
+                        help="Add the sequences in this FASTA to the existing alignment given with -i")
+    parser.add_argument("--reference_format", default="fasta", choices=["fasta", "clustal", "phylip"],
+                        help="Format of the existing alignment in --add mode")
+    parser.add_argument("--add_fragments", action="store_true", help="Use MAFFT --addfragments for short or partial sequences")
+    parser.add_argument("--keeplength", action="store_true",
+                        help="Keep the reference columns fixed in --add mode (MAFFT --keeplength); residues of added "
+                             "sequences that fall in insertions are dropped")
+    parser.add_argument("--refine_added", action="store_true",
+                        help="Realign only the column windows where added sequences disagree with the reference gaps")
+    parser.add_argument("--batch", action="store_true",
+                        help="Align every FASTA file in the -i directory or manifest on one shared core budget")
+    parser.add_argument("--batch_jobs", type=int, default=None,
+                        help="Batch inputs in progress at the same time (default: --threads)")
+    parser.add_argument("--dedup", action="store_true", help="Align each distinct sequence once and re-expand duplicates")
+    parser.add_argument("--dedup_identity", type=parse_identity, default=None,
+                        help="Also collapse equal-length sequences at or above this identity in (0, 1] (e.g. 0.99); "
+                             "implies --dedup")
+    parser.add_argument("--cache_dir", default=None, help="Reuse aligned chunks and merges from this cache directory")
+    parser.add_argument("--cache_max_gb", type=float, default=5.0, help="Size cap of the cache before LRU eviction")
+    parser.add_argument("--workdir", default=None, help="Run workspace for intermediate files (kept after the run)")
+    parser.add_argument("--tmpdir", default=None, help="Parent directory of the automatic workspace, e.g. /dev/shm")
+    parser.add_argument("--resume", action="store_true", help="Resume an interrupted run in --workdir from its manifest")
+    parser.add_argument("--manifest", default=None, help="Run manifest path (default: <workdir>/manifest.json)")
+    parser.add_argument("--strategy_timeout_factor", type=float, default=10.0,
+                        help="Stop a MAFFT strategy after this many times its predicted run time and fall back (0 = no limit)")
+    parser.add_argument("--min_strategy_timeout", type=float, default=300.0, help="Lower bound of a strategy time limit (sec)")
+    parser.add_argument("--race", action="store_true",
+                        help="Race a cheap MAFFT --auto run on spare cores against expensive strategies")
+    parser.add_argument("--long_mode", default="auto", choices=["auto", "on", "off"],
+                        help="Align long sequences in segments between shared k-mer anchors ('auto': above --long_threshold)")
+    parser.add_argument("--long_threshold", type=int, default=20000,
+                        help="Median sequence length at which --long_mode auto switches on")
+    parser.add_argument("--refine", default="muscle", choices=["muscle", "windows", "subgroups", "auto", "none"],
+                        help="MUSCLE refinement: whole alignment, column windows between conserved anchors, "
+                             "sequence subgroups re-merged by MAFFT, chosen by predicted cost, or none")
+    parser.add_argument("--refine_max_seconds", type=float, default=None,
+                        help="Cap MUSCLE iterations (or skip refinement) when refinement is predicted to take longer")
+    parser.add_argument("--max_inflight", type=int, default=None,
+                        help="Bounded mode: align chunks in merge order, at most this many waiting to be merged "
+                             "(memory is only bounded for uncompressed file input; compressed and stdin input stay in memory)")
+    parser.add_argument("--coordinator", default=None,
+                        help="[HOST:]PORT to serve chunk and merge tasks to swiftalign-worker processes on other nodes")
+    parser.add_argument("--cluster_token", default=os.environ.get("SWIFTALIGN_TOKEN"),
+                        help="Shared secret workers must present (default: $SWIFTALIGN_TOKEN)")
+    parser.add_argument("--time_budget", type=parse_duration, default=None,
+                        help="Wall-time target (e.g. 3600, 90m, 2h); method, chunk size, merges and refinement are planned to fit")
+    parser.add_argument("--runtime_model", default=None,
+                        help="Runtime model file fitted to earlier runs (default: <cache_dir>/runtime_model.json)")
+    parser.add_argument("--report_json", default=None,
+                        help="Write per-stage wall time, CPU time and peak memory to this JSON file")
+    parser.add_argument("--events_prefix", nargs="?", const="", default=None,
+                        help="Record run events and write <prefix>.events.jsonl and <prefix>.trace.json "
+                             "(without a prefix: <workdir>/run)")
+    return parser
+
+def main():
+    global ECHO_LOG
+    ECHO_LOG = True
+    print_header()
+
+    parser = build_parser()
     args = parser.parse_args()
+    if args.resume and not (args.workdir or args.manifest):
+        parser.error("--resume requires the --workdir of the interrupted run")
+    if args.input == "-" and (args.resume or args.batch):
+        parser.error("-i - (stdin) cannot be combined with --resume or --batch")
+    if args.batch and args.add:
+        parser.error("--batch cannot be combined with --add")
+    if args.coordinator and args.add:
+        parser.error("--coordinator cannot be combined with --add")
 
     log_file = args.log_file
+    # Events are only kept in memory when they will be exported
+    EVENTS.reset(record=args.events_prefix is not None)
     log(f"SwiftAlign pipeline started at {time.ctime()}", log_file)
     log_binary_versions(log_file)
 
-    seq_type, seqs = detect_sequence_type(args.input, log_file)
-    mafft_method, gap_open, gap_extend, muscle_max_iter = auto_optimize_parameters(seqs, seq_type, args.mode, log_file)
-    chunks = chunk_fasta(seqs, args.chunk_size, log_file)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="swiftalign_", dir=args.tmpdir)
+    os.makedirs(workdir, exist_ok=True)
+    log(f"Workspace: {workdir}", log_file)
+    events_prefix = args.events_prefix or (os.path.join(workdir, "run") if args.events_prefix == "" else None)
+    keep_workdir = bool(args.workdir) or (events_prefix is not None and os.path.dirname(events_prefix) == workdir)
+    STAGE_REPORT.info.update(input=args.input, mode=args.mode, chunk_size=args.chunk_size, chunking=args.chunking,
+                             threads=args.threads)
+
+    def stopped():
+        # The workspace is only worth keeping once a run manifest records something to resume
+        if has_manifest(args, workdir):
+            log(f"Run stopped; intermediate files kept in {workdir} (continue with --workdir {workdir} --resume)", log_file)
+            return
+        log("Run stopped before anything could be resumed.", log_file)
+        if not keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    remote = None
+    try:
+        remote = start_coordinator(args, log_file) if args.coordinator else None
+        if args.add:
+            run_add_pipeline(args, workdir, log_file)
+        elif args.batch:
+            run_batch(args, workdir, log_file, remote)
+        else:
+            run_pipeline(args, workdir, log_file, CoreBudget(args.threads) if remote is None else
+                         cluster_budget(remote, args.threads))
+    except SwiftAlignError as e:
+        log(f"Error: {e}", log_file)
+        stopped()
+        sys.exit(1)
+    except BaseException:
+        stopped()
+        raise
+    finally:
+        if remote is not None:
+            remote.close()
+        if events_prefix:
+            EVENTS.write_jsonl(f"{events_prefix}.events.jsonl")
+            EVENTS.write_chrome_trace(f"{events_prefix}.trace.json")
+            log(f"Run events written to {events_prefix}.events.jsonl and {events_prefix}.trace.json", log_file)
+        EVENTS.flush()
+    if args.report_json:
+        STAGE_REPORT.write(args.report_json)
+        log(f"Stage report written to {args.report_json}", log_file)
+    if not args.workdir:
+        if keep_workdir:
+            log(f"Workspace {workdir} kept for the run events.", log_file)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    EVENTS.flush()
+
+    print_footer()
+
+def has_manifest(args, workdir):
+    # A run manifest at --manifest, or anywhere in the workspace (batch inputs keep theirs in subdirectories)
+    if args.manifest:
+        return os.path.exists(args.manifest)
+    return any("manifest.json" in files for _, _, files in os.walk(workdir))
 
-    manager = Manager()
-    completed_counter = manager.Value('i', 0)
+def run_pipeline(args, workdir, log_file=None, budget=None):
     start_time = time.time()
+    manifest = RunManifest(args.manifest or os.path.join(workdir, "manifest.json"), run_fingerprint(args), resume=args.resume)
+    if args.resume:
+        log("Resuming from run manifest." if manifest.resumed else "No matching run manifest found; starting a fresh run.", log_file)
 
-    pool = Pool(processes=args.threads)
-    task_args = [(chunk, seq_type, mafft_method, gap_open, gap_extend, 1, idx+1, len(chunks), start_time, completed_counter, log_file)
-                  for idx, chunk in enumerate(chunks)]
-    results = [pool.apply_async(run_mafft_chunk, (ta,)) for ta in task_args]
-    pool.close()
-    pool.join()
-    aligned_chunks = [r.get() for r in results]
+    with STAGE_REPORT.stage("ingest"):
+        seq_type, seqs = detect_sequence_type(args.input, log_file, args.threads)
+        all_seqs, dedup = seqs, None
+        if args.dedup or args.dedup_identity is not None:
+            dedup = collapse_duplicates(all_seqs, args.dedup_identity, log_file)
+            seqs = all_seqs.subset(dedup.representatives)
+        mafft_method, gap_open, gap_extend, muscle_max_iter = auto_optimize_parameters(seqs, seq_type, args.mode, log_file)
+    long_mode = use_long_mode(seqs, args.long_mode, args.long_threshold)
 
-    merged_file = progressive_merge(aligned_chunks, seq_type, mafft_method, gap_open, gap_extend, args.threads, log_file)
+    model_path = args.runtime_model or (os.path.join(args.cache_dir, "runtime_model.json") if args.cache_dir else None)
+    model = RuntimeModel(model_path) if args.time_budget or model_path else None
+    plan, timings = None, {}
+    if args.time_budget and long_mode:
+        log("Long-sequence mode: --time_budget only caps refinement.", log_file)
+    elif args.time_budget:
+        with STAGE_REPORT.stage("plan"):
+            if "plan" in manifest.data:
+                plan = Plan(*manifest.data["plan"])
+                log_plan(plan, args.time_budget, log_file)
+            else:
+                plan = plan_run(seqs, seq_type, mafft_method, muscle_max_iter, args, model, log_file)
+                manifest.data["plan"] = plan
+        mafft_method, muscle_max_iter = plan.mafft_method, plan.muscle_max_iter
+    chunk_size = plan.chunk_size if plan else args.chunk_size
+    merge_method = plan.merge_method if plan else mafft_method
+    divergence = plan.divergence if plan else None
+    if model is not None and divergence is None:
+        # Unplanned runs still add their chunk jobs to the model, at the divergence they were measured on
+        divergence = sampled_divergence(seqs, seq_type)
+    STAGE_REPORT.info.update(sequences=len(all_seqs), unique_sequences=len(seqs), seq_type=seq_type,
+                             residues=all_seqs.total_residues, mafft_method=mafft_method, long_mode=long_mode,
+                             plan=plan._asdict() if plan else None)
+    cache = AlignmentCache(args.cache_dir, int(args.cache_max_gb * 1024 ** 3)) if args.cache_dir else None
 
-    temp_muscle = "muscle_final_temp.fasta"
-    run_muscle(merged_file, temp_muscle, max_iter=muscle_max_iter, log_file=log_file)
+    budget = budget or CoreBudget(args.threads)
+    seconds_per_cost = 0.0
+    merged_file = manifest.done("merged")
+    if merged_file is not None:
+        log(f"Merged alignment already complete: {merged_file}", log_file)
+        num_chunks = manifest.data.get("chunk_count", 0)
+    elif long_mode:
+        long_file = os.path.join(workdir, "long_merged.fasta")
+        timeouts = StrategyTimeouts(args.strategy_timeout_factor, args.min_strategy_timeout)
+        with STAGE_REPORT.stage("segments"):
+            num_chunks = align_long_sequences(seqs, seq_type, mafft_method, gap_open, gap_extend, budget, workdir,
+                                              long_file, log_file, cache, timeouts)
+        if num_chunks is None:
+            long_mode = STAGE_REPORT.info["long_mode"] = False
+        else:
+            merged_file, manifest.data["chunk_count"] = long_file, num_chunks
+            manifest.record("merged", merged_file)
+    if merged_file is None:
+        with STAGE_REPORT.stage("chunking"):
+            groups, merge_tree = None, None
+            if args.chunking == "similarity":
+                groups, merge_tree = similarity_chunks(seqs, seq_type, chunk_size, log_file)
+            chunks = chunk_fasta(seqs, chunk_size, log_file, groups=groups, workdir=workdir)
+            num_chunks = manifest.data["chunk_count"] = len(chunks)
+            merge_tree = merge_tree if merge_tree is not None else balanced_merge_tree(len(chunks))
+            levels = merge_levels(merge_tree, len(chunks))
+            needed = pending_merges(levels, manifest.artifacts("merges"))[1] if levels else {0}
+            aligned_chunks = [manifest.done("chunks", idx) if idx in needed else None for idx in range(len(chunks))]
+            to_align = [idx for idx in range(len(chunks)) if idx in needed and aligned_chunks[idx] is None]
+            if manifest.resumed:
+                log(f"Resuming chunk alignment: {len(chunks) - len(to_align)} of {len(chunks)} chunks need no work.", log_file)
 
-    alignment = convert_format(temp_muscle, args.output, args.format, log_file)
+            cache_keys = {}
+            if cache is not None:
+                cached = 0
+                for idx in list(to_align):
+                    cache_keys[idx] = chunk_cache_key(read_chunk(chunks[idx]), mafft_method, gap_open, gap_extend)
+                    if cache.fetch(cache_keys[idx], f"{chunks[idx].name}.aligned.fasta"):
+                        aligned_chunks[idx] = f"{chunks[idx].name}.aligned.fasta"
+                        manifest.record("chunks", aligned_chunks[idx], key=idx)
+                        to_align.remove(idx)
+                        cached += 1
+                log(f"Cache: {cached} of {len(chunks)} chunks already aligned", log_file)
+
+        costs = {idx: estimate_job_cost(chunks[idx].seq_count, chunks[idx].residues, mafft_method) for idx in to_align}
+        job_threads = dict(zip(to_align, assign_threads([costs[idx] for idx in to_align], args.threads)))
+        progress = JobProgress(len(to_align), sum(costs.values()), args.threads, log_file)
+        timeouts = StrategyTimeouts(args.strategy_timeout_factor, args.min_strategy_timeout, progress)
+
+        def make_chunk_job(idx):
+            chunk = chunks[idx]
+            def run(cores, _):
+                started = time.time()
+                with strategy_clock() as clock:
+                    out = run_mafft_chunk(chunk, seq_type, mafft_method, gap_open, gap_extend, cores, log_file,
+                                          cache, cache_keys.get(idx), timeouts, budget, args.race)
+                manifest.record("chunks", out, key=idx)
+                # Only the strategy that produced the output, charged at the cost of the method it ran
+                ran_cost = estimate_job_cost(chunk.seq_count, chunk.residues, clock.method) if clock.method else None
+                progress.finish(chunk.name, costs[idx], cores, time.time() - started,
+                                f"n={chunk.seq_count}, residues={chunk.residues}, method={clock.method or mafft_method}, ",
+                                clock.seconds, ran_cost)
+                if model is not None and clock.seconds is not None:
+                    model.observe(seq_type, ran_cost, divergence, clock.seconds * cores)
+                return out
+            return Job(idx, run=run, cores=job_threads[idx], priority=costs[idx])
+
+        if args.max_inflight:
+            # Bounded mode: chunks are aligned in merge-tree order, at most a window of them ahead of the merges
+            order, needed_window = streaming_leaf_order(merge_tree)
+            window = InflightWindow(max(args.max_inflight, needed_window))
+            if window.size > args.max_inflight:
+                log(f"Raising --max_inflight to {window.size}, the least this merge tree can run in.", log_file)
+            log(f"Bounded mode: at most {window.size} aligned chunks waiting to be merged.", log_file)
+            if seqs.store is not None:
+                log(f"Warning: compressed or stdin input stays in memory ({seqs.store.nbytes / 2 ** 20:.1f} MiB); "
+                    f"only the aligned chunks are bounded.", log_file)
+            position = {leaf: k for k, leaf in enumerate(order)}
+            leaf_jobs = [make_chunk_job(idx)._replace(priority=-(len(levels) + 1 + position[idx])) for idx in to_align]
+            with STAGE_REPORT.stage("chunk_merge", timings):
+                merged_file = progressive_merge(aligned_chunks, seq_type, merge_method, gap_open, gap_extend, args.threads,
+                                                log_file, merge_tree=merge_tree, budget=budget, cache=cache,
+                                                manifest=manifest, workdir=workdir, timeouts=timeouts, race=args.race,
+                                                leaf_jobs=leaf_jobs, window=window)
+        else:
+            with STAGE_REPORT.stage("chunk_mafft", timings):
+                results = run_job_graph([make_chunk_job(idx) for idx in to_align], budget)
+            for idx in to_align:
+                aligned_chunks[idx] = results[idx]
+        if progress.done:
+            seconds_per_cost = progress.seconds_per_cost()
+            log(f"Cost model: {seconds_per_cost:.3g} core-sec per cost unit over {progress.done} chunk jobs", log_file)
+
+        if not args.max_inflight:
+            with STAGE_REPORT.stage("merge", timings):
+                merged_file = progressive_merge(aligned_chunks, seq_type, merge_method, gap_open, gap_extend, args.threads,
+                                                log_file, merge_tree=merge_tree, budget=budget, cache=cache,
+                                                manifest=manifest, workdir=workdir, timeouts=timeouts, race=args.race)
+        manifest.record("merged", merged_file)
+
+    refine = plan.refine if plan else args.refine
+    refine_max_seconds = args.refine_max_seconds
+    if args.time_budget:
+        # Refinement gets whatever the budget has left, whatever the plan predicted
+        remaining = max(1.0, args.time_budget - (time.time() - start_time))
+        refine_max_seconds = min(refine_max_seconds or remaining, remaining)
+    if long_mode and refine == "muscle":
+        log("Long-sequence mode: skipping whole-alignment MUSCLE (use --refine windows to refine in parts).", log_file)
+        refine = "none"
+    temp_muscle = manifest.done("refine")
+    if temp_muscle is None:
+        with STAGE_REPORT.stage("refine", timings):
+            temp_muscle = refine_alignment(merged_file, os.path.join(workdir, "muscle_final_temp.fasta"), refine,
+                                           seq_type, muscle_max_iter, budget.local, workdir, log_file, seconds_per_cost,
+                                           refine_max_seconds, (merge_method, gap_open, gap_extend))
+        manifest.record("refine", temp_muscle)
+
+    expansion = dedup
+    if expansion is None and args.chunking == "similarity" and not long_mode:
+        # Similarity chunks leave the rows in cluster order; expansion matches them back to their input positions
+        expansion = all_records(len(all_seqs))
+    final_fasta = temp_muscle
+    if expansion is not None:
+        final_fasta = os.path.join(workdir, "expanded_final.fasta")
+        with STAGE_REPORT.stage("expand"):
+            try:
+                expand_alignment(temp_muscle, all_seqs, expansion, final_fasta)
+            except ValueError as e:
+                raise SwiftAlignError(str(e)) from e
+        if dedup is not None:
+            log(f"Re-expanded {len(all_seqs) - len(seqs)} collapsed sequences into the alignment.", log_file)
+    with STAGE_REPORT.stage("convert"):
+        alignment = convert_format(final_fasta, args.output, args.format, log_file, workdir)
+        stats = alignment.column_stats()
 
     os.remove(merged_file)
-    os.remove(temp_muscle)
+    if temp_muscle != merged_file:
+        os.remove(temp_muscle)
+    if final_fasta != temp_muscle:
+        os.remove(final_fasta)
+    manifest.remove()
 
     total_runtime = time.time() - start_time
     num_sequences = len(alignment)
     alignment_length = alignment.get_alignment_length()
+    STAGE_REPORT.info.update(chunks=num_chunks, alignment_length=alignment_length, gap_fraction=stats["gap_fraction"])
 
     log("\n=== SwiftAlign Summary Report ===", log_file)
-    log(f"Input sequences (approx.): {len(seqs)}", log_file)
-    log(f"Total chunks processed: {len(chunks)}", log_file)
+    log(f"Input sequences (approx.): {len(all_seqs)}", log_file)
+    if dedup is not None:
+        log(f"Unique sequences aligned: {len(seqs)}", log_file)
+    log(f"Total chunks processed: {num_chunks}", log_file)
+    if cache is not None:
+        evicted = cache.prune()
+        log(f"Cache hits: {cache.hits}, misses: {cache.misses}, evicted: {evicted}", log_file)
     log(f"Final number of sequences: {num_sequences}", log_file)
     log(f"Alignment length: {alignment_length} residues", log_file)
+    log(f"Gap fraction: {stats['gap_fraction']:.1%}", log_file)
+    log(f"Gap-free columns: {stats['gap_free_columns']}, fully conserved: {stats['conserved_columns']}", log_file)
+    log(f"Mean column identity: {stats['mean_identity']:.1%}", log_file)
     log(f"Total runtime: {total_runtime:.2f} sec ({total_runtime/60:.2f} min)", log_file)
+    if plan is not None:
+        log(f"Time budget: {args.time_budget:.0f} sec, predicted {sum(plan.predicted.values()):.0f} sec, "
+            f"actual {total_runtime:.0f} sec", log_file)
+        predicted = plan.predicted
+        if "chunk_merge" in timings:
+            predicted = {"chunk_merge": predicted["chunk_mafft"] + predicted["merge"], "refine": predicted["refine"]}
+        for name, seconds in predicted.items():
+            log(f"  {name}: predicted {seconds:.1f} sec, actual {timings.get(name, 0.0):.1f} sec", log_file)
+    if model is not None:
+        model.save()
     log("================================", log_file)
-
-    print_footer()
+    return {"sequences": num_sequences, "alignment_length": alignment_length, "chunks": num_chunks,
+            "runtime_sec": round(total_runtime, 3)}
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,566 @@
+"""
+Streaming FASTA ingestion for SwiftAlign.
+
+The input is read in large byte blocks and classified with NumPy lookup
+tables. Only record offsets, residue counts and a residue histogram are
+kept; sequences are re-read from disk on demand.
+
+Input that cannot be re-read (stdin, or gzip, BGZF and zstd files) is
+decompressed once while it is indexed, and its sequences are kept in memory
+in a PackedFasta: DNA is packed two bits per base (four for IUPAC codes),
+with runs of other characters and of lowercase bases stored as exceptions.
+BGZF blocks are decompressed in parallel.
+"""
+
+import gzip
+import io
+import sys
+import threading
+import zlib
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from queue import Queue
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed for .zst input
+    zstandard = None
+
+BLOCK_SIZE = 1 << 22            # 4 MiB per read
+SAMPLE_BYTES = 1 << 26          # classify every residue of the first 64 MiB ...
+SAMPLE_SLICE = 1 << 16          # ... then only the first 64 KiB of each block
+
+NEWLINE = ord("\n")
+HEADER = ord(">")
+WHITESPACE = b" \t\r\n"
+
+IS_RESIDUE = np.ones(256, dtype=bool)
+IS_RESIDUE[list(WHITESPACE)] = False
+
+DNA_TABLE = np.zeros(256, dtype=bool)
+DNA_TABLE[list(b"ATGCNatgcn")] = True
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+BGZF_READAHEAD = 64             # BGZF blocks (up to 64 KiB each) decompressed ahead of the reader
+
+UPPER = np.arange(256, dtype=np.uint8)
+UPPER[ord("a"):ord("z") + 1] -= 32
+
+NUCLEOTIDES = np.frombuffer(b"ACGT", dtype=np.uint8)
+IUPAC = np.frombuffer(b"ACGTRYSWKMBDHVN-", dtype=np.uint8)
+ALPHABETS = {2: NUCLEOTIDES, 4: IUPAC}
+CODES = {bits: np.full(256, 255, dtype=np.uint8) for bits in ALPHABETS}
+for bits, alphabet in ALPHABETS.items():
+    CODES[bits][alphabet] = np.arange(alphabet.size, dtype=np.uint8)
+RUN_BYTES = 17                  # start, end and value of one exception run
+
+FastaRecord = namedtuple("FastaRecord", ["id", "description", "offset", "seq_offset", "end", "length"])
+
+
+class FastaIndex:
+    """Lightweight view of a FASTA file: record offsets, lengths and residue composition.
+
+    For input that was read from a stream, store holds the sequences and offsets refer to
+    the FASTA text the store renders (one line per sequence).
+    """
+
+    def __init__(self, path, records, residue_counts, sampled=False, store=None):
+        self.path = path
+        self.records = list(records)
+        self.residue_counts = residue_counts
+        self.sampled = sampled
+        self.store = store
+        self.lengths = np.fromiter((r.length for r in self.records), dtype=np.int64, count=len(self.records))
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __getitem__(self, item):
+        return self.records[item]
+
+    @property
+    def total_residues(self):
+        return int(self.lengths.sum())
+
+    @property
+    def classified_residues(self):
+        return int(self.residue_counts.sum())
+
+    def dna_residues(self):
+        return int(self.residue_counts[DNA_TABLE].sum())
+
+    @property
+    def source(self):
+        """What read_ranges reads the records from: the store, or the file path."""
+        return self.store if self.store is not None else self.path
+
+    def subset(self, indices):
+        """Return a FastaIndex restricted to the given record positions."""
+        return FastaIndex(self.path, [self.records[i] for i in indices], self.residue_counts, self.sampled, self.store)
+
+    def open(self):
+        """Handle to pass to sequence() for many reads (a no-op context for stored sequences)."""
+        return nullcontext() if self.store is not None else open(self.path, "rb")
+
+    def raw_bytes(self, records):
+        """Read the raw FASTA text of records, coalescing adjacent byte ranges."""
+        return read_ranges(self.source, byte_ranges(records))
+
+    def sequence(self, record, handle=None):
+        """Residues of one record as bytes, with line breaks removed."""
+        if self.store is not None:
+            return self.store.sequence(record)
+        if handle is None:
+            with open(self.path, "rb") as handle:
+                return self.sequence(record, handle)
+        handle.seek(record.seq_offset)
+        return handle.read(record.end - record.seq_offset).translate(None, WHITESPACE)
+
+    def iter_sequences(self):
+        """Yield (record, residues) pairs in index order."""
+        with self.open() as handle:
+            for record in self.records:
+                yield record, self.sequence(record, handle)
+
+
+def byte_ranges(records):
+    """Coalesced (start, end) byte ranges covering the FASTA text of records."""
+    ranges = []
+    for record in records:
+        if ranges and ranges[-1][1] == record.offset:
+            ranges[-1] = (ranges[-1][0], record.end)
+        else:
+            ranges.append((record.offset, record.end))
+    return ranges
+
+
+def read_ranges(path, ranges):
+    """Concatenate byte ranges of a FASTA file (or PackedFasta), ending each range with a newline."""
+    if isinstance(path, PackedFasta):
+        return path.read_ranges(ranges)
+    parts = []
+    with open(path, "rb") as handle:
+        for start, end in ranges:
+            handle.seek(start)
+            data = handle.read(end - start)
+            parts.append(data if data.endswith(b"\n") else data + b"\n")
+    return b"".join(parts)
+
+
+def _make_record(offset, title, seq_offset, end, length):
+    title = title.rstrip(b"\r").decode(errors="replace")
+    parts = title.split(None, 1)
+    return FastaRecord(parts[0] if parts else "", title, offset, seq_offset, end, length)
+
+
+def scan_fasta(path, block_size=BLOCK_SIZE, sample_bytes=SAMPLE_BYTES):
+    """Index a FASTA file in one streaming pass without materializing sequences."""
+    offsets, titles, seq_offsets, lengths = [], [], [], []
+    counts = np.zeros(256, dtype=np.int64)
+    classified = 0
+    sampled = False
+    pending_title = None        # header text of a header line that spans blocks
+    at_line_start = True
+    base = 0
+
+    with open(path, "rb") as handle:
+        while True:
+            buf = handle.read(block_size)
+            if not buf:
+                break
+            arr = np.frombuffer(buf, dtype=np.uint8)
+            n = arr.size
+            newlines = np.flatnonzero(arr == NEWLINE)
+
+            gt = np.flatnonzero(arr == HEADER)
+            if gt.size:
+                line_start = np.empty(gt.size, dtype=bool)
+                line_start[1:] = arr[gt[1:] - 1] == NEWLINE
+                line_start[0] = at_line_start if gt[0] == 0 else arr[gt[0] - 1] == NEWLINE
+                starts = gt[line_start]
+            else:
+                starts = gt
+
+            # Header spans [start, newline] are excluded from residue counts
+            span_starts, span_ends = [], []
+            if pending_title is not None:
+                end = int(newlines[0]) if newlines.size else n - 1
+                span_starts.append(0)
+                span_ends.append(end + 1)
+                if newlines.size:
+                    titles[-1] = pending_title + buf[:end]
+                    seq_offsets[-1] = base + end + 1
+                    pending_title = None
+                else:
+                    pending_title += buf
+            end_idx = np.searchsorted(newlines, starts)
+            for start, j in zip(starts.tolist(), end_idx.tolist()):
+                offsets.append(base + start)
+                lengths.append(0)
+                if j < newlines.size:
+                    end = int(newlines[j])
+                    titles.append(buf[start + 1:end])
+                    seq_offsets.append(base + end + 1)
+                else:
+                    end = n - 1
+                    titles.append(b"")
+                    seq_offsets.append(None)
+                    pending_title = buf[start + 1:]
+                span_starts.append(start)
+                span_ends.append(end + 1)
+
+            diff = np.zeros(n + 1, dtype=np.int32)
+            diff[span_starts] += 1
+            diff[span_ends] -= 1
+            residue = IS_RESIDUE[arr] & (np.cumsum(diff[:n]) == 0)
+
+            first_rec = len(offsets) - starts.size - 1
+            if starts.size:
+                marks = np.zeros(n, dtype=np.int32)
+                marks[starts] = 1
+                owner = np.cumsum(marks)[residue]
+                per_record = np.bincount(owner, minlength=starts.size + 1)
+            else:
+                per_record = np.array([np.count_nonzero(residue)])
+            for k, count in enumerate(per_record.tolist()):
+                if count and first_rec + k >= 0:
+                    lengths[first_rec + k] += count
+
+            residues = arr[residue]
+            if classified >= sample_bytes:
+                residues = residues[:SAMPLE_SLICE]
+                sampled = True
+            counts += np.bincount(residues, minlength=256)
+            classified += residues.size
+
+            at_line_start = buf.endswith(b"\n")
+            base += n
+
+    ends = offsets[1:] + [base]
+    records = []
+    for offset, title, seq_offset, end, length in zip(offsets, titles, seq_offsets, ends, lengths):
+        records.append(_make_record(offset, title, seq_offset if seq_offset is not None else end, end, length))
+    return FastaIndex(path, records, counts, sampled)
+
+
+def sequence_lengths(seqs):
+    """Residue counts for a FastaIndex or a list of SeqRecords."""
+    if isinstance(seqs, FastaIndex):
+        return seqs.lengths
+    return np.array([len(seq.seq) for seq in seqs], dtype=np.int64)
+
+
+# ---- packed in-memory sequences ----
+def _runs(mask, values=None):
+    """(starts, ends) of the runs of True in mask; with values, runs also end where the value changes and their values are added."""
+    idx = np.flatnonzero(mask)
+    breaks = np.diff(idx) != 1
+    if values is not None:
+        breaks |= values[idx[1:]] != values[idx[:-1]]
+    first = np.concatenate([[0], np.flatnonzero(breaks) + 1]) if idx.size else idx
+    starts = idx[first]
+    ends = np.concatenate([idx[first[1:] - 1], idx[-1:]]) + 1 if idx.size else idx
+    if values is None:
+        return starts, ends
+    return starts, ends, values[starts]
+
+
+class PackedBlock:
+    """Concatenated residues of consecutive records, packed 2 or 4 bits per base where that is smaller."""
+
+    def __init__(self, residues):
+        self.size = residues.size
+        upper = UPPER[residues]
+        lowercase = residues != upper
+        self.lower = _runs(lowercase) if lowercase.any() else None
+        # Cheapest encoding: 2 bits with runs of non-ACGT bytes as exceptions, 4 bits for IUPAC codes, or raw bytes
+        self.bits, self.data, self.exceptions = 8, residues, None
+        best = residues.size
+        lower_bytes = RUN_BYTES * self.lower[0].size if self.lower is not None else 0
+        for bits in (2, 4):
+            codes = CODES[bits][upper]
+            missing = codes == 255
+            count = int(missing.sum())
+            if count * RUN_BYTES >= best:
+                continue
+            exceptions = _runs(missing, upper) if count else None
+            size = -(-residues.size * bits // 8) + lower_bytes + RUN_BYTES * (exceptions[0].size if count else 0)
+            if size < best:
+                codes[missing] = 0
+                per_byte = 8 // bits
+                codes = np.concatenate([codes, np.zeros(-residues.size % per_byte, dtype=np.uint8)])
+                packed = np.zeros(codes.size // per_byte, dtype=np.uint8)
+                for k in range(per_byte):
+                    packed |= codes[k::per_byte] << (8 - bits * (k + 1))
+                self.bits, self.data, self.exceptions, best = bits, packed, exceptions, size
+        if self.bits == 8:
+            self.lower = None
+
+    @property
+    def nbytes(self):
+        runs = [array for group in (self.lower, self.exceptions) if group is not None for array in group]
+        return self.data.nbytes + sum(array.nbytes for array in runs)
+
+    def slice(self, start, end):
+        """Residues start:end of the block as bytes."""
+        if self.bits == 8:
+            return self.data[start:end].tobytes()
+        per_byte = 8 // self.bits
+        first = start // per_byte
+        packed = self.data[first:-(-end // per_byte)]
+        shifts = np.arange(8 - self.bits, -1, -self.bits, dtype=np.uint8)
+        codes = (packed[:, None] >> shifts) & ((1 << self.bits) - 1)
+        out = ALPHABETS[self.bits][codes.ravel()[start - first * per_byte:end - first * per_byte]]
+        for runs, apply in ((self.exceptions, None), (self.lower, 0x20)):
+            if runs is None:
+                continue
+            lo, hi = np.searchsorted(runs[1], start, side="right"), np.searchsorted(runs[0], end)
+            for k in range(lo, hi):
+                a, b = max(int(runs[0][k]), start) - start, min(int(runs[1][k]), end) - start
+                if apply is None:
+                    out[a:b] = runs[2][k]
+                else:
+                    out[a:b] |= apply
+        return out.tobytes()
+
+
+class PackedFasta:
+    """Titles and packed sequences of FASTA text read from a stream, served as one-line-per-sequence FASTA."""
+
+    def __init__(self):
+        self.titles = []
+        self.blocks = []
+        self.slots = []             # (block, start, length) of each record's residues
+        self.offsets = []
+
+    def add_block(self, records, residues):
+        """Store one batch of (offset, title, length) records and their concatenated residues."""
+        block = len(self.blocks)
+        self.blocks.append(PackedBlock(residues))
+        start = 0
+        for offset, title, length in records:
+            self.titles.append(title)
+            self.slots.append((block, start, length))
+            self.offsets.append(offset)
+            start += length
+
+    def finish(self):
+        self.offsets = np.array(self.offsets, dtype=np.int64)
+        return self
+
+    @property
+    def nbytes(self):
+        return sum(block.nbytes for block in self.blocks)
+
+    def _slot(self, offset):
+        return int(np.searchsorted(self.offsets, offset))
+
+    def residues(self, slot):
+        block, start, length = self.slots[slot]
+        return self.blocks[block].slice(start, start + length)
+
+    def sequence(self, record):
+        return self.residues(self._slot(record.offset))
+
+    def read_ranges(self, ranges):
+        parts = []
+        for start, end in ranges:
+            for slot in range(self._slot(start), self._slot(end)):
+                parts += [b">", self.titles[slot], b"\n", self.residues(slot), b"\n"]
+        return b"".join(parts)
+
+
+# ---- compressed and piped input ----
+def input_compression(path):
+    """'stdin', 'gzip', 'bgzf', 'zstd', or None for a plain file."""
+    if path == "-":
+        return "stdin"
+    with open(path, "rb") as handle:
+        return _compression(handle.read(18))
+
+
+def _compression(head):
+    if head.startswith(ZSTD_MAGIC):
+        return "zstd"
+    if not head.startswith(GZIP_MAGIC):
+        return None
+    # BGZF: gzip members with a 'BC' extra subfield carrying the block size
+    if len(head) >= 16 and head[3] & 4 and head[12:14] == b"BC":
+        return "bgzf"
+    return "gzip"
+
+
+class _ChunkReader(io.RawIOBase):
+    """Readable file object over an iterator of byte chunks."""
+
+    def __init__(self, chunks, close=None):
+        self.chunks = chunks
+        self.pending = b""
+        self.on_close = close
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            self.pending = next(self.chunks, b"")
+            if not self.pending:
+                return 0
+        n = min(len(buffer), len(self.pending))
+        buffer[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+    def close(self):
+        if not self.closed and self.on_close is not None:
+            self.on_close()
+        super().close()
+
+
+def _bgzf_payloads(handle):
+    while True:
+        header = handle.read(12)
+        if not header:
+            return
+        extra = handle.read(int.from_bytes(header[10:12], "little"))
+        size, k = None, 0
+        while k + 4 <= len(extra):
+            length = int.from_bytes(extra[k + 2:k + 4], "little")
+            if extra[k:k + 2] == b"BC":
+                size = int.from_bytes(extra[k + 4:k + 6], "little") + 1
+            k += 4 + length
+        if header[:2] != GZIP_MAGIC or size is None:
+            raise ValueError("Corrupt BGZF block (no block size).")
+        body = handle.read(size - 12 - len(extra))
+        yield body[:-8]
+
+
+def _bgzf_chunks(handle, pool):
+    # Blocks are independent deflate streams: keep BGZF_READAHEAD of them decompressing at once
+    futures = deque()
+    for payload in _bgzf_payloads(handle):
+        futures.append(pool.submit(zlib.decompress, payload, -15))
+        if len(futures) >= BGZF_READAHEAD:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
+def _prefetch(stream, block_size, depth=4):
+    # Decompress on a background thread so it overlaps with indexing
+    queue = Queue(depth)
+    stop = threading.Event()
+
+    def fill():
+        try:
+            while not stop.is_set():
+                data = stream.read(block_size)
+                queue.put(data)
+                if not data:
+                    return
+        except BaseException as e:
+            queue.put(e)
+
+    threading.Thread(target=fill, name="decompress", daemon=True).start()
+    while True:
+        data = queue.get()
+        if isinstance(data, BaseException):
+            raise data
+        if not data:
+            return
+        yield data
+
+
+def open_input(path, threads=1, block_size=BLOCK_SIZE):
+    """Binary file object over the FASTA text of path ('-' is stdin), decompressing gzip, BGZF and zstd."""
+    handle = sys.stdin.buffer if path == "-" else open(path, "rb")
+    if not hasattr(handle, "peek"):
+        handle = io.BufferedReader(handle)
+    compression = _compression(handle.peek(18)[:18])
+    if compression is None:
+        return handle
+    if compression == "bgzf":
+        pool = ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="bgzf")
+
+        def close():
+            pool.shutdown(wait=False)
+            handle.close()
+
+        return io.BufferedReader(_ChunkReader(_bgzf_chunks(handle, pool), close), block_size)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError(f"{path} is zstd-compressed; install the 'zstandard' package to read it.")
+        stream = zstandard.ZstdDecompressor().stream_reader(handle, read_across_frames=True)
+    else:
+        stream = gzip.GzipFile(fileobj=handle)
+    return io.BufferedReader(_ChunkReader(_prefetch(stream, block_size), handle.close), block_size)
+
+
+def scan_stream(handle, path, block_size=BLOCK_SIZE, sample_bytes=SAMPLE_BYTES):
+    """Index FASTA text read from a stream, keeping its sequences in a PackedFasta.
+
+    Offsets refer to the text the store renders: each record as its header line plus one line of residues.
+    """
+    store = PackedFasta()
+    records = []
+    counts = np.zeros(256, dtype=np.int64)
+    state = {"offset": 0, "classified": 0, "sampled": False}
+
+    def flush(text):
+        # text holds whole records, each without its leading '>'
+        batch, residues = [], []
+        for piece in text.split(b"\n>"):
+            title, _, body = piece.partition(b"\n")
+            title, seq = title.rstrip(b"\r"), body.translate(None, WHITESPACE)
+            offset = state["offset"]
+            state["offset"] = offset + len(title) + len(seq) + 3
+            records.append(_make_record(offset, title, offset + len(title) + 2, state["offset"], len(seq)))
+            batch.append((offset, title, len(seq)))
+            residues.append(seq)
+        arr = np.frombuffer(b"".join(residues), dtype=np.uint8)
+        store.add_block(batch, arr)
+        if state["classified"] >= sample_bytes:
+            arr = arr[:SAMPLE_SLICE]
+            state["sampled"] = True
+        counts[:] += np.bincount(arr, minlength=256)
+        state["classified"] += arr.size
+
+    # Skip any text before the first header
+    last = b"\n"
+    while True:
+        buf = handle.read(block_size)
+        if not buf:
+            return FastaIndex(path, records, counts, False, store.finish())
+        first = 0 if last == b"\n" and buf.startswith(b">") else buf.find(b"\n>") + 1
+        last = buf[-1:]
+        if first or buf.startswith(b">"):
+            break
+    pending = [buf[first + 1:]]
+    while buf:
+        buf = handle.read(block_size)
+        cut = buf.rfind(b"\n>")
+        if cut >= 0:
+            flush(b"".join(pending) + buf[:cut])
+            pending = [buf[cut + 2:]]
+        elif buf.startswith(b">") and pending[-1].endswith(b"\n"):
+            flush(b"".join(pending))
+            pending = [buf[1:]]
+        else:
+            pending.append(buf)
+    flush(b"".join(pending))
+    return FastaIndex(path, records, counts, state["sampled"], store.finish())
+
+
+def load_fasta(path, threads=1):
+    """FastaIndex of path: scanned in place for plain files, read into a PackedFasta for stdin and compressed input."""
+    if path != "-" and input_compression(path) is None:
+        return scan_fasta(path)
+    with open_input(path, threads) as handle:
+        return scan_stream(handle, path)
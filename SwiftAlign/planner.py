@@ -0,0 +1,114 @@
+"""
+Runtime model for SwiftAlign's time-budget planner.
+
+The core-seconds of a MAFFT job are modelled as
+
+    rate * cost ** exponent * exp(slope * divergence)
+
+per sequence type, where cost is the job's predicted pairwise-comparison cost
+(sequence count, length and method) and divergence is a k-mer (Mash) distance
+estimated from a sample of the input. The three coefficients are fitted by
+least squares in log space to the jobs of earlier runs, which are kept in a
+small JSON file; until enough jobs have been seen the built-in defaults apply.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+
+import numpy as np
+
+from SwiftAlign.sketch import DNA_K, PROTEIN_K, sketch_sequence, similarity
+
+DEFAULT_RATE = 2e-5             # core-seconds per cost unit; matches the scheduler's pessimistic default
+DEFAULT_SLOPE = 1.0
+MIN_SAMPLES = 8                 # jobs of one sequence type needed before the model is fitted
+MAX_SAMPLES = 500               # most recent jobs kept per sequence type
+MIN_DIVERGENCE_SPREAD = 0.05    # divergence range needed before its slope is fitted
+DIVERGENCE_SAMPLE = 48          # sequences sketched for the divergence estimate
+
+DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(text):
+    """Seconds from '900', '90s', '30m', '2h' or '1.5d'."""
+    match = re.fullmatch(r"\s*([0-9]*\.?[0-9]+)\s*([smhd]?)\s*", str(text).lower())
+    if not match:
+        raise ValueError(f"Invalid duration: {text!r}")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def sampled_divergence(seqs, seq_type, sample=DIVERGENCE_SAMPLE):
+    """Mean pairwise Mash distance between up to sample evenly spaced sequences of a FastaIndex."""
+    if len(seqs) < 2:
+        return 0.0
+    picks = np.unique(np.linspace(0, len(seqs) - 1, min(sample, len(seqs))).astype(int))
+    signatures = np.stack([sketch_sequence(seqs.sequence(seqs[int(i)]), seq_type) for i in picks])
+    k = DNA_K if seq_type == "dna" else PROTEIN_K
+    distances = []
+    for i in range(len(picks) - 1):
+        jaccard = similarity(signatures[i + 1:], signatures[i])
+        with np.errstate(divide="ignore"):
+            mash = -np.log(2 * jaccard / (1 + jaccard)) / k
+        distances.append(np.minimum(mash, 1.0))
+    return float(np.concatenate(distances).mean())
+
+
+class RuntimeModel:
+    """Fitted core-seconds per MAFFT job, persisted across runs in an optional JSON file."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.samples = {}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as handle:
+                    self.samples = json.load(handle).get("samples", {})
+            except (OSError, ValueError):
+                self.samples = {}
+        self.coefficients = {seq_type: self.fit(seq_type) for seq_type in self.samples}
+
+    def fit(self, seq_type):
+        """(log rate, exponent, slope) from the recorded jobs of seq_type, or the defaults."""
+        samples = np.array(self.samples.get(seq_type, []), dtype=float).reshape(-1, 3)
+        samples = samples[(samples[:, 0] > 0) & (samples[:, 2] > 0)]
+        if len(samples) < MIN_SAMPLES or np.ptp(np.log(samples[:, 0])) < 1.0:
+            if len(samples):
+                return math.log(float(np.median(samples[:, 2] / samples[:, 0]))), 1.0, DEFAULT_SLOPE
+            return math.log(DEFAULT_RATE), 1.0, DEFAULT_SLOPE
+        # log(core_sec) = log(rate) + exponent * log(cost) + slope * divergence; the slope keeps its default
+        # until the recorded inputs differ enough in divergence, and is never negative
+        log_cost, divergence, log_seconds = np.log(samples[:, 0]), samples[:, 1], np.log(samples[:, 2])
+        slope = DEFAULT_SLOPE
+        if np.ptp(divergence) >= MIN_DIVERGENCE_SPREAD:
+            design = np.column_stack([np.ones(len(samples)), log_cost, divergence])
+            slope = max(float(np.linalg.lstsq(design, log_seconds, rcond=None)[0][2]), 0.0)
+        design = np.column_stack([np.ones(len(samples)), log_cost])
+        (log_rate, exponent), *_ = np.linalg.lstsq(design, log_seconds - slope * divergence, rcond=None)
+        return float(log_rate), float(np.clip(exponent, 0.5, 2.0)), slope
+
+    def predict(self, seq_type, cost, divergence=0.0):
+        """Predicted core-seconds of one job."""
+        log_rate, exponent, slope = self.coefficients.get(seq_type) or self.fit(seq_type)
+        return math.exp(log_rate + slope * divergence) * max(cost, 1.0) ** exponent
+
+    def observe(self, seq_type, cost, divergence, core_seconds):
+        with self.lock:
+            samples = self.samples.setdefault(seq_type, [])
+            samples.append([cost, divergence, core_seconds])
+            del samples[:-MAX_SAMPLES]
+
+    def save(self):
+        """Refit and write the recorded jobs back to the model file."""
+        with self.lock:
+            self.coefficients = {seq_type: self.fit(seq_type) for seq_type in self.samples}
+            if not self.path:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as handle:
+                json.dump({"samples": self.samples}, handle)
+            os.replace(tmp, self.path)
@@ -0,0 +1,174 @@
+"""
+Asyncio supervision of the external commands SwiftAlign runs.
+
+Every MAFFT and MUSCLE process is started on one event loop running on a
+daemon thread. The loop feeds each command's stdin through a non-blocking
+pipe and notices its exit, time limit or cancellation, so no watcher thread
+is needed per command; the job thread that asked for a command only waits on
+its future. Commands lead their own process group, so a stop signal also
+reaches MAFFT's helper processes.
+
+asyncio's own child watchers reap children with waitpid and drop their
+resource usage, which the stage report needs. Processes are therefore started
+with subprocess.Popen on the loop and reaped with os.wait4 once their pidfd
+becomes readable, or by a blocking wait4 in the loop's executor where pidfds
+are not available.
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+import threading
+
+KILL_GRACE_SECONDS = 5          # between SIGTERM and SIGKILL when a command is stopped
+POLL_SECONDS = 0.2              # how often the cancel events of a running command are checked
+PIPE_CHUNK = 1 << 16
+
+
+def kill_process_group(proc, sig=signal.SIGKILL):
+    """Signal the process group led by proc (just proc where there are no process groups)."""
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, sig)
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _write_all(pipe, data):
+    try:
+        pipe.write(data)
+    except BrokenPipeError:
+        pass
+    finally:
+        pipe.close()
+
+
+class ProcessSupervisor:
+    """Runs commands on a background event loop and reports their exit status and resource usage."""
+
+    def __init__(self):
+        self.loop = None
+        self.lock = threading.Lock()
+        self.active = set()
+
+    def _event_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name="process supervisor", daemon=True).start()
+            return self.loop
+
+    def run(self, cmd, stdout=None, input_data=None, timeout=None, cancel=()):
+        """Run cmd to completion from any thread; returns (returncode, rusage or None, stopped).
+
+        The process group is stopped (SIGTERM, then SIGKILL) after timeout seconds or once any of the
+        cancel events is set, and stopped is then True.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._run(cmd, stdout, input_data, timeout, tuple(cancel)),
+                                                  self._event_loop())
+        try:
+            return future.result()
+        except BaseException:
+            # Interrupted while waiting (e.g. Ctrl-C): the task kills the command
+            future.cancel()
+            raise
+
+    def kill_all(self):
+        """SIGKILL the process groups of all running commands."""
+        with self.lock:
+            procs = list(self.active)
+        for proc in procs:
+            kill_process_group(proc)
+
+    async def _run(self, cmd, stdout, input_data, timeout, cancel):
+        loop = asyncio.get_running_loop()
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE if input_data is not None else None, stdout=stdout,
+                                start_new_session=os.name == "posix")
+        with self.lock:
+            self.active.add(proc)
+        feeder = loop.create_task(self._feed(proc.stdin, input_data)) if input_data is not None else None
+        exited = loop.create_task(self._reap(proc))
+        deadline = loop.time() + timeout if timeout is not None else None
+        stopped = False
+        try:
+            while not exited.done():
+                wait = POLL_SECONDS if cancel else None
+                if deadline is not None:
+                    wait = min(wait or timeout, max(deadline - loop.time(), 0.0))
+                await asyncio.wait({exited}, timeout=wait)
+                if not exited.done() and (any(event.is_set() for event in cancel)
+                                          or (deadline is not None and loop.time() >= deadline)):
+                    stopped = True
+                    await self._stop(proc, exited)
+            usage = exited.result()
+            if stopped:
+                kill_process_group(proc)   # helpers that outlived the group leader
+            return proc.returncode, usage, stopped
+        except asyncio.CancelledError:
+            kill_process_group(proc)
+            await asyncio.shield(exited)
+            raise
+        finally:
+            if feeder is not None:
+                feeder.cancel()
+            with self.lock:
+                self.active.discard(proc)
+
+    async def _stop(self, proc, exited):
+        kill_process_group(proc, signal.SIGTERM)
+        await asyncio.wait({exited}, timeout=KILL_GRACE_SECONDS)
+        if not exited.done():
+            kill_process_group(proc)
+            await asyncio.wait({exited})
+
+    async def _feed(self, pipe, data):
+        loop = asyncio.get_running_loop()
+        if os.name != "posix":
+            await loop.run_in_executor(None, _write_all, pipe, data)
+            return
+        fd = pipe.fileno()
+        os.set_blocking(fd, False)
+        view = memoryview(data)
+        writable = asyncio.Event()
+        loop.add_writer(fd, writable.set)
+        try:
+            while view:
+                await writable.wait()
+                writable.clear()
+                try:
+                    view = view[os.write(fd, view[:PIPE_CHUNK]):]
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    break      # the command exited without reading all of its input
+        finally:
+            loop.remove_writer(fd)
+            pipe.close()
+
+    async def _reap(self, proc):
+        loop = asyncio.get_running_loop()
+        if not hasattr(os, "wait4"):
+            await loop.run_in_executor(None, proc.wait)
+            return None
+        pidfd = None
+        if hasattr(os, "pidfd_open"):
+            try:
+                pidfd = os.pidfd_open(proc.pid)
+            except OSError:
+                pass
+        if pidfd is None:
+            _, status, usage = await loop.run_in_executor(None, os.wait4, proc.pid, 0)
+        else:
+            readable = asyncio.Event()
+            loop.add_reader(pidfd, readable.set)
+            try:
+                await readable.wait()
+            finally:
+                loop.remove_reader(pidfd)
+                os.close(pidfd)
+            _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+        return usage
@@ -0,0 +1,140 @@
+"""
+k-mer sketches for SwiftAlign.
+
+Sequences are summarized by one-permutation MinHash signatures (the minimum
+k-mer hash in each of a fixed number of bins). Signatures give cheap Jaccard
+similarity estimates for grouping related sequences into chunks and for
+building a cluster-level guide tree for the merge phase.
+"""
+
+import numpy as np
+
+SKETCH_SIZE = 128
+DNA_K = 21
+PROTEIN_K = 5
+EMPTY = np.iinfo(np.uint64).max
+
+INVALID = 255
+DNA_CODES = np.full(256, INVALID, dtype=np.uint8)
+for _code, _bases in enumerate(("Aa", "Cc", "Gg", "Tt")):
+    DNA_CODES[[ord(b) for b in _bases]] = _code
+PROTEIN_CODES = np.full(256, INVALID, dtype=np.uint8)
+for _code, _residue in enumerate("ACDEFGHIKLMNPQRSTVWY"):
+    PROTEIN_CODES[[ord(_residue), ord(_residue.lower())]] = _code
+
+
+def mix64(x):
+    """splitmix64 finalizer, vectorized over a uint64 array."""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _encode_kmers(seq, seq_type, k, canonical):
+    """Codes of all k-mer start positions and a mask of those without invalid residues."""
+    table, bits = (DNA_CODES, 2) if seq_type == "dna" else (PROTEIN_CODES, 5)
+    codes = table[np.frombuffer(seq, dtype=np.uint8)]
+    n = codes.size - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=bool)
+
+    invalid = np.concatenate(([0], np.cumsum(codes == INVALID)))
+    valid = (invalid[k:] - invalid[:-k]) == 0
+    values = np.where(codes == INVALID, 0, codes).astype(np.uint64)
+
+    shift = np.uint64(bits)
+    forward = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        forward = (forward << shift) | values[j:j + n]
+    if canonical and seq_type == "dna":
+        reverse = np.zeros(n, dtype=np.uint64)
+        for j in range(k):
+            reverse |= (np.uint64(3) - values[j:j + n]) << np.uint64(2 * j)
+        forward = np.minimum(forward, reverse)
+    return forward, valid
+
+
+def kmer_codes(seq, seq_type="dna", k=None):
+    """Integer codes of every valid k-mer in seq (canonical for DNA)."""
+    k = k or (DNA_K if seq_type == "dna" else PROTEIN_K)
+    codes, valid = _encode_kmers(seq, seq_type, k, canonical=True)
+    return codes[valid]
+
+
+def kmer_positions(seq, seq_type="dna", k=None):
+    """Forward-strand codes of every valid k-mer in seq, with their start positions."""
+    k = k or (DNA_K if seq_type == "dna" else PROTEIN_K)
+    codes, valid = _encode_kmers(seq, seq_type, k, canonical=False)
+    return codes[valid], np.flatnonzero(valid)
+
+
+def sketch_sequence(seq, seq_type="dna", k=None, size=SKETCH_SIZE):
+    """One-permutation MinHash signature of a single sequence."""
+    signature = np.full(size, EMPTY, dtype=np.uint64)
+    hashes = mix64(kmer_codes(seq, seq_type, k))
+    if hashes.size:
+        np.minimum.at(signature, (hashes % np.uint64(size)).astype(np.intp), hashes)
+    return signature
+
+
+def sketch_index(index, seq_type="dna", k=None, size=SKETCH_SIZE):
+    """Signature matrix (one row per record) for a FastaIndex."""
+    signatures = np.empty((len(index), size), dtype=np.uint64)
+    for row, (_, seq) in enumerate(index.iter_sequences()):
+        signatures[row] = sketch_sequence(seq, seq_type, k, size)
+    return signatures
+
+
+def similarity(signatures, signature):
+    """Estimated Jaccard similarity of each row of signatures to one signature."""
+    filled = (signatures != EMPTY) | (signature != EMPTY)
+    shared = (signatures == signature) & (signature != EMPTY)
+    return shared.sum(axis=1) / np.maximum(filled.sum(axis=1), 1)
+
+
+def cluster_sketches(signatures, chunk_size):
+    """Greedy leader clustering into groups of at most chunk_size similar sequences."""
+    unassigned = np.arange(len(signatures))
+    groups = []
+    while unassigned.size:
+        seed = unassigned[0]
+        scores = similarity(signatures[unassigned], signatures[seed])
+        order = np.argsort(-scores, kind="stable")
+        take = np.zeros(unassigned.size, dtype=bool)
+        take[order[:chunk_size]] = True
+        groups.append(sorted(unassigned[take].tolist()))
+        unassigned = unassigned[~take]
+    return groups
+
+
+def group_signatures(signatures, groups):
+    """Signature of each group's union of k-mers (element-wise minimum)."""
+    return np.stack([signatures[group].min(axis=0) for group in groups])
+
+
+def guide_tree(signatures):
+    """UPGMA tree over signatures, as nested tuples of row indices."""
+    n = len(signatures)
+    if n == 0:
+        return None
+    dist = np.empty((n, n))
+    for i in range(n):
+        dist[i] = 1.0 - similarity(signatures, signatures[i])
+    np.fill_diagonal(dist, np.inf)
+    nodes = list(range(n))
+    sizes = np.ones(n)
+    active = np.ones(n, dtype=bool)
+    for _ in range(n - 1):
+        i, j = np.unravel_index(np.argmin(dist), dist.shape)
+        i, j = min(i, j), max(i, j)
+        merged = (sizes[i] * dist[i] + sizes[j] * dist[j]) / (sizes[i] + sizes[j])
+        merged[~active] = np.inf
+        dist[i], dist[:, i] = merged, merged
+        dist[i, i] = np.inf
+        dist[j], dist[:, j] = np.inf, np.inf
+        nodes[i] = (nodes[i], nodes[j])
+        sizes[i] += sizes[j]
+        active[j] = False
+    return nodes[0]
@@ -0,0 +1,172 @@
+"""
+Timed SwiftAlign runs over a grid of synthetic datasets and settings.
+
+Every combination of dataset, --chunk_size, --threads and --mode is run in a
+separate process with --report_json, and the per-stage wall time, CPU time
+and peak memory are collected into one results file. A results file can be
+saved as a baseline; later runs compared against it exit non-zero when a
+stage gets slower or larger than the tolerance allows.
+
+    python -m benchmarks.run_benchmarks --n 200,1000 --chunk_sizes 50,200 --threads 4 \
+        --save_baseline benchmarks/baselines/local.json
+    python -m benchmarks.run_benchmarks --n 200,1000 --chunk_sizes 50,200 --threads 4 \
+        --baseline benchmarks/baselines/local.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_family, write_fasta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_list(text, cast=str):
+    return [cast(item) for item in text.split(",") if item]
+
+
+def dataset_name(seq_type, n, length, divergence):
+    return f"{seq_type}-n{n}-L{length}-d{divergence}"
+
+
+def run_key(dataset, chunk_size, threads, mode):
+    return f"{dataset}/chunk{chunk_size}-t{threads}-{mode}"
+
+
+def run_pipeline(fasta, chunk_size, threads, mode, workdir, tag):
+    """Run SwiftAlign once and return (wall seconds, stage report)."""
+    report = os.path.join(workdir, f"{tag}.report.json")
+    cmd = [sys.executable, "-m", "SwiftAlign.hybrid_msa", "-i", fasta, "-o", os.path.join(workdir, f"{tag}.aln"),
+           "--chunk_size", str(chunk_size), "--threads", str(threads), "--mode", mode,
+           "--log_file", os.path.join(workdir, f"{tag}.log"), "--report_json", report]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+    start = time.time()
+    subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, check=True)
+    wall = time.time() - start
+    with open(report) as handle:
+        return wall, json.load(handle)
+
+
+def summarize(walls, reports):
+    """Median wall times and maximum peak memory over repeated runs of one configuration."""
+    stages = {}
+    for name in reports[0]["stages"]:
+        entries = [report["stages"][name] for report in reports if name in report["stages"]]
+        stages[name] = {
+            "wall_sec": statistics.median(entry["wall_sec"] for entry in entries),
+            "child_cpu_sec": statistics.median(entry["child_cpu_sec"] for entry in entries),
+            "child_peak_rss_mb": max(entry["child_peak_rss_mb"] for entry in entries),
+            "peak_rss_so_far_mb": max(entry["peak_rss_so_far_mb"] or 0 for entry in entries),
+        }
+    return {"wall_sec": statistics.median(walls), "repeats": len(walls),
+            "chunks": reports[0].get("chunks"), "alignment_length": reports[0].get("alignment_length"),
+            "stages": stages}
+
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.5):
+    """Regression messages for runs that got slower or larger than baseline * (1 + tolerance)."""
+    regressions = []
+    for key, run in results["runs"].items():
+        base = baseline["runs"].get(key)
+        if base is None:
+            continue
+        checks = [("total wall", run["wall_sec"], base["wall_sec"], min_seconds)]
+        for name, stage in run["stages"].items():
+            base_stage = base["stages"].get(name)
+            if base_stage is None:
+                continue
+            checks.append((f"{name} wall", stage["wall_sec"], base_stage["wall_sec"], min_seconds))
+            checks.append((f"{name} memory", stage["child_peak_rss_mb"], base_stage["child_peak_rss_mb"], 1.0))
+        for label, value, reference, floor in checks:
+            if reference >= floor and value > reference * (1 + tolerance):
+                regressions.append(f"{key}: {label} {value:.2f} vs baseline {reference:.2f} "
+                                   f"(+{100 * (value / reference - 1):.0f}%)")
+    return regressions
+
+
+def print_table(results):
+    stages = list(dict.fromkeys(name for run in results["runs"].values() for name in run["stages"]))
+    header = f"{'run':<52} {'total':>8} " + " ".join(f"{name:>12}" for name in stages)
+    print(header)
+    print("-" * len(header))
+    for key, run in results["runs"].items():
+        cells = " ".join(f"{run['stages'][name]['wall_sec']:>12.2f}" if name in run["stages"] else f"{'-':>12}"
+                         for name in stages)
+        print(f"{key:<52} {run['wall_sec']:>8.2f} {cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SwiftAlign over synthetic families and settings")
+    parser.add_argument("--types", default="dna,protein", help="Comma-separated sequence types")
+    parser.add_argument("--n", default="200,1000", help="Comma-separated sequence counts")
+    parser.add_argument("--lengths", default="400", help="Comma-separated root lengths")
+    parser.add_argument("--divergence", default="0.1", help="Comma-separated divergences")
+    parser.add_argument("--clades", type=int, default=4)
+    parser.add_argument("--chunk_sizes", default="50,200", help="Comma-separated --chunk_size values")
+    parser.add_argument("--threads", default="4", help="Comma-separated --threads values")
+    parser.add_argument("--modes", default="fast,accurate", help="Comma-separated --mode values")
+    parser.add_argument("--repeats", type=int, default=1, help="Runs per configuration (medians are reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="Keep datasets, outputs and reports here")
+    parser.add_argument("--output", default="benchmark_results.json", help="Results file")
+    parser.add_argument("--baseline", default=None, help="Compare against this results file")
+    parser.add_argument("--save_baseline", default=None, help="Also save the results as a baseline here")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before a run counts as a regression")
+    parser.add_argument("--min_seconds", type=float, default=0.5, help="Ignore stages faster than this in the baseline")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="swiftalign_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    results = {"machine": {"platform": platform.platform(), "python": platform.python_version(),
+                           "cpu_count": os.cpu_count()},
+               "started": time.strftime("%Y-%m-%dT%H:%M:%S"), "runs": {}}
+
+    datasets = itertools.product(parse_list(args.types), parse_list(args.n, int), parse_list(args.lengths, int),
+                                 parse_list(args.divergence, float))
+    for seq_type, n, length, divergence in datasets:
+        name = dataset_name(seq_type, n, length, divergence)
+        fasta = os.path.join(workdir, f"{name}.fasta")
+        if not os.path.exists(fasta):
+            write_fasta(generate_family(n, length, divergence, seq_type, args.clades, args.seed), fasta)
+        settings = itertools.product(parse_list(args.chunk_sizes, int), parse_list(args.threads, int),
+                                     parse_list(args.modes))
+        for chunk_size, threads, mode in settings:
+            key = run_key(name, chunk_size, threads, mode)
+            walls, reports = [], []
+            for repeat in range(args.repeats):
+                tag = key.replace("/", "_") + f"_r{repeat}"
+                wall, report = run_pipeline(fasta, chunk_size, threads, mode, workdir, tag)
+                walls.append(wall)
+                reports.append(report)
+            results["runs"][key] = summarize(walls, reports)
+            print(f"{key}: {results['runs'][key]['wall_sec']:.2f} sec", flush=True)
+
+    for path in filter(None, [args.output, args.save_baseline]):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as handle:
+            json.dump(results, handle, indent=2)
+    print()
+    print_table(results)
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            regressions = compare(results, json.load(handle), args.tolerance, args.min_seconds)
+        print()
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.baseline}:")
+            for message in regressions:
+                print(f"  {message}")
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
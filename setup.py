@@ -47,11 +47,13 @@ setup(
     author="Beckley Brown",
     author_email="brownbeckley94@gmail.com",
     description="Hybrid multiple sequence alignment tool combining MAFFT + MUSCLE",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "tests"]),
     entry_points={
         "console_scripts": [
             "swiftalign=SwiftAlign.hybrid_msa:main",
+            "swiftalign-worker=SwiftAlign.distributed:main",
         ],
     },
+    extras_require={"zstd": ["zstandard"]},
     python_requires=">=3.8",
 )
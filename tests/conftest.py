@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Make the SwiftAlign package importable when pytest is run from tests/
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,24 @@
+from Bio import AlignIO
+
+from SwiftAlign.alignment import Alignment
+
+# -------------------- Tests --------------------
+def test_writers_match_biopython(tmp_path):
+    fasta = tmp_path / "aln.fasta"
+    rows = [("s1 first (copy)", "ACGT-acgtA" * 11), ("s2", "ACGTTACG-A" * 11), ("s3:x", "-CGTTACGTA" * 11)]
+    fasta.write_text("".join(f">{title}\n{row[:70]}\n{row[70:]}\n" for title, row in rows))
+    for memmap_bytes in (0, 1 << 20):
+        alignment = Alignment.from_fasta(str(fasta), str(tmp_path), memmap_bytes=memmap_bytes)
+        for out_format in ("fasta", "clustal", "phylip"):
+            alignment.write(str(tmp_path / "ours"), out_format)
+            AlignIO.write(AlignIO.read(str(fasta), "fasta"), str(tmp_path / "theirs"), out_format)
+            assert (tmp_path / "ours").read_text() == (tmp_path / "theirs").read_text()
+
+def test_column_stats(tmp_path):
+    fasta = tmp_path / "aln.fasta"
+    fasta.write_text(">a\nAC-T\n>b\nac-A\n>c\nAG-T\n")
+    stats = Alignment.from_fasta(str(fasta)).column_stats()
+    assert stats["alignment_length"] == 4 and stats["sequences"] == 3
+    assert stats["gap_fraction"] == 0.25
+    assert stats["gap_free_columns"] == 3 and stats["conserved_columns"] == 1
+    assert abs(stats["mean_identity"] - (1 + 2 / 3 + 2 / 3) / 3) < 1e-9
@@ -0,0 +1,54 @@
+import numpy as np
+
+from SwiftAlign.anchors import chain_anchors, find_anchors, longest_increasing, segment_bounds
+
+# -------------------- Tests --------------------
+def _family(seed=3, count=3):
+    rng = np.random.default_rng(seed)
+    root = np.frombuffer(b"ACGT", dtype=np.uint8)[rng.integers(0, 4, 6000)]
+    seqs = []
+    for _ in range(count):
+        seq = root.copy()
+        sites = rng.random(seq.size) < 0.01
+        seq[sites] = np.frombuffer(b"ACGT", dtype=np.uint8)[rng.integers(0, 4, int(sites.sum()))]
+        cut = int(rng.integers(1000, 5000))
+        seqs.append(seq[:cut].tobytes() + b"TTT"[: int(rng.integers(0, 4))] + seq[cut:].tobytes())
+    return seqs
+
+def test_longest_increasing():
+    values = np.array([3, 1, 4, 1, 5, 9, 2, 6])
+    chain = longest_increasing(values)
+    assert len(chain) == 4 and (np.diff(values[chain]) > 0).all()
+    assert longest_increasing(np.array([], dtype=np.int64)).size == 0
+
+def test_anchor_segments_are_collinear_and_shared():
+    seqs = _family()
+    positions, members = find_anchors(seqs, "dna")
+    assert members.tolist() == [0, 1, 2]
+    anchors = chain_anchors(positions, 21)
+    assert anchors.shape[0] == 3 and anchors.shape[1] > 10
+    assert (np.diff(anchors, axis=1) >= 21).all()
+    for j in range(anchors.shape[1]):
+        assert len({seq[p:p + 21] for seq, p in zip(seqs, anchors[:, j])}) == 1
+
+    bounds = segment_bounds([len(seq) for seq in seqs], anchors, 1000)
+    assert (bounds[:, 0] == 0).all() and bounds[:, -1].tolist() == [len(seq) for seq in seqs]
+    assert (np.diff(bounds, axis=1) > 0).all() and bounds.shape[1] - 1 >= 4
+    assert segment_bounds([10, 12], np.empty((2, 0), dtype=np.int64), 1000).tolist() == [[0, 10], [0, 12]]
+
+def test_outlier_sequences_do_not_remove_the_anchors():
+    rng = np.random.default_rng(5)
+    family = _family(count=12)
+    reverse = family[1][::-1].translate(bytes.maketrans(b"ACGT", b"TGCA"))
+    unrelated = np.frombuffer(b"ACGT", dtype=np.uint8)[rng.integers(0, 4, 6000)].tobytes()
+    partial = family[2][:1500]
+    seqs = family[:3] + [reverse] + family[3:] + [unrelated, partial]
+    positions, members = find_anchors(seqs, "dna")
+    assert members.tolist() == [0, 1, 2] + list(range(4, 13))
+    anchors = chain_anchors(positions, 21)
+    assert anchors.shape[0] == 12 and anchors.shape[1] > 10
+    for j in range(anchors.shape[1]):
+        assert len({seqs[i][p:p + 21] for i, p in zip(members, anchors[:, j])}) == 1
+
+    positions, members = find_anchors([unrelated, reverse], "dna")
+    assert positions.shape == (2, 0) and members.tolist() == [0, 1]
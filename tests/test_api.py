@@ -0,0 +1,60 @@
+import pytest
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+from SwiftAlign import api
+from SwiftAlign.api import Aligner, SwiftAlignError
+
+@pytest.fixture
+def fake_pipeline(monkeypatch):
+    # Stand-in for MAFFT/MUSCLE: pad every row to the longest and write them in reverse order
+    calls = []
+
+    def run_pipeline(args, workdir, log_file=None, budget=None):
+        calls.append((args, budget))
+        with open(args.input) as handle:
+            lines = handle.read().split()
+        rows = list(zip(lines[::2], lines[1::2]))
+        width = max(len(seq) for _, seq in rows)
+        with open(args.output, "w") as out:
+            for name, seq in reversed(rows):
+                out.write(f"{name}\n{seq.ljust(width, '-')}\n")
+
+    monkeypatch.setattr(api, "find_binary", lambda name: name)
+    monkeypatch.setattr(api, "log_binary_versions", lambda log_file=None: None)
+    monkeypatch.setattr(api, "run_pipeline", run_pipeline)
+    return calls
+
+# -------------------- Tests --------------------
+def test_aligner_reuses_pool_and_keeps_input_order(fake_pipeline, tmp_path):
+    records = [SeqRecord(Seq("ACGTAC"), id="a"), ("b", "ACGAC"), ("c", "ACG")]
+    with Aligner(threads=2, mode="fast", workdir=str(tmp_path)) as aligner:
+        alignment = aligner.align(records)
+        more = aligner.align_many([{"x": "AC", "y": "ACGT"}, {"z": "A", "w": "AA"}], chunk_size=10)
+    assert [record.id for record in alignment] == ["a", "b", "c"]
+    assert alignment.get_alignment_length() == 6
+    assert [[record.id for record in aln] for aln in more] == [["x", "y"], ["z", "w"]]
+    budgets = {id(budget) for _, budget in fake_pipeline}
+    assert len(budgets) == 1 and fake_pipeline[0][1].pool is aligner.pool
+    assert fake_pipeline[0][0].mode == "fast" and fake_pipeline[0][0].log_file is None
+    assert fake_pipeline[1][0].chunk_size == 10
+    assert list(tmp_path.iterdir()) == []
+
+def test_aligner_input_errors(fake_pipeline):
+    with pytest.raises(TypeError):
+        Aligner(output="x.fasta")
+    with Aligner(threads=1) as aligner:
+        with pytest.raises(SwiftAlignError):
+            aligner.align([])
+        with pytest.raises(SwiftAlignError):
+            aligner.align([("a", "AC"), ("a", "AG")])
+        single = aligner.align({"only": "ACGT"})
+    assert len(single) == 1 and str(single[0].seq) == "ACGT"
+    assert fake_pipeline == []
+
+def test_ids_with_whitespace_are_returned_unchanged(fake_pipeline):
+    records = [("a x", "ACGTAC"), ("a y", "ACG"), ("b\tz", "AC")]
+    with Aligner(threads=1) as aligner:
+        alignment = aligner.align(records)
+    assert [record.id for record in alignment] == ["a x", "a y", "b\tz"]
+    assert [str(record.seq) for record in alignment] == ["ACGTAC", "ACG---", "AC----"]
@@ -0,0 +1,27 @@
+import numpy as np
+
+from benchmarks.run_benchmarks import compare
+from benchmarks.synthetic import generate_family
+
+# -------------------- Tests --------------------
+def test_generate_family_controls_size_and_divergence():
+    family = generate_family(40, 300, 0.2, "dna", clades=2, seed=7)
+    assert family == generate_family(40, 300, 0.2, "dna", clades=2, seed=7)
+    assert len(family) == 40 and len({name for name, _ in family}) == 40
+    lengths = np.array([len(seq) for _, seq in family])
+    assert abs(lengths.mean() - 300) < 30
+    assert set(b"".join(seq for _, seq in family)) <= set(b"ACGT")
+
+    protein = generate_family(5, 100, 0.0, "protein", seed=1)
+    assert len({seq for _, seq in protein}) == 1
+
+def test_compare_flags_slower_stages():
+    def results(merge_wall, memory):
+        return {"runs": {"dna-n200/chunk50-t4-fast": {"wall_sec": 10.0, "stages": {
+            "merge": {"wall_sec": merge_wall, "child_peak_rss_mb": memory},
+            "convert": {"wall_sec": 0.1, "child_peak_rss_mb": 0.0}}}}}
+
+    baseline = results(4.0, 100.0)
+    assert compare(results(4.5, 110.0), baseline) == []
+    regressions = compare(results(6.0, 200.0), baseline)
+    assert len(regressions) == 2 and "merge wall" in regressions[0] and "merge memory" in regressions[1]
@@ -0,0 +1,31 @@
+import os
+import pickle
+
+from SwiftAlign.cache import AlignmentCache, make_key
+
+# -------------------- Tests --------------------
+def test_fetch_and_store(tmp_path):
+    cache = AlignmentCache(tmp_path / "cache")
+    src = tmp_path / "aligned.fasta"
+    src.write_text(">a\nAC-GT\n")
+    key = make_key("chunk", b"content", "linsi", 1.5, None, "v7.5")
+    assert not cache.fetch(key, tmp_path / "out.fasta")
+    cache.store(key, src)
+    assert cache.fetch(key, tmp_path / "out.fasta")
+    assert (tmp_path / "out.fasta").read_text() == ">a\nAC-GT\n"
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert make_key("chunk", b"content", "linsi", 1.5, None, "v7.5") != make_key("chunk", b"content", "einsi", 1.5, None, "v7.5")
+    assert pickle.loads(pickle.dumps(cache)).cache_dir == cache.cache_dir
+
+def test_prune_evicts_least_recently_used(tmp_path):
+    cache = AlignmentCache(tmp_path / "cache", max_bytes=250)
+    src = tmp_path / "entry.fasta"
+    src.write_bytes(b"A" * 100)
+    keys = [make_key(i) for i in range(3)]
+    for age, key in enumerate(keys):
+        cache.store(key, src)
+        os.utime(cache.path(key), (1000 + age, 1000 + age))
+    os.utime(cache.path(keys[0]))    # recently read
+    assert cache.prune() == 1
+    assert not os.path.exists(cache.path(keys[1]))
+    assert os.path.exists(cache.path(keys[0])) and os.path.exists(cache.path(keys[2]))
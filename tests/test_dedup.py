@@ -0,0 +1,59 @@
+import pytest
+from Bio import SeqIO
+
+from SwiftAlign import dedup as dedup_module
+from SwiftAlign.dedup import expand_alignment, find_duplicates, parse_identity
+from SwiftAlign.ingest import scan_fasta
+
+# -------------------- Helper Function --------------------
+def write_fasta(path, records):
+    path.write_text("".join(f">{name}\n{seq}\n" for name, seq in records))
+    return str(path)
+
+# -------------------- Tests --------------------
+def test_exact_and_near_duplicates(tmp_path):
+    records = [("a", "ACGTACGTAC"), ("b", "ACGTACGTAC"), ("c", "ACGTACGTAA"), ("d", "acgtacgtaa"), ("e", "TTTT")]
+    index = scan_fasta(write_fasta(tmp_path / "in.fasta", records))
+    exact_only = find_duplicates(index)
+    assert exact_only.representatives == [0, 2, 4]
+    near = find_duplicates(index, identity=0.9)
+    assert near.representatives == [0, 4]
+    assert near.rep_of.tolist() == [0, 0, 0, 0, 4]
+    assert near.exact.tolist() == [False, True, False, False, False]
+
+def test_leader_array_grows_past_its_initial_capacity(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup_module, "LEADER_CAPACITY", 2)
+    bases = ["AAAAAAAA", "CCCCCCCC", "GGGGGGGG", "TTTTTTTT", "ACACACAC"]
+    records = [(f"s{i}", seq) for i, seq in enumerate(bases)] + [("t", "TTTTTTTA"), ("u", "ACACACAA")]
+    index = scan_fasta(write_fasta(tmp_path / "in.fasta", records))
+    near = find_duplicates(index, identity=0.8)
+    assert near.representatives == [0, 1, 2, 3, 4]
+    assert near.rep_of.tolist() == [0, 1, 2, 3, 4, 3, 4]
+
+@pytest.mark.parametrize("value", ["0", "-0.5", "1.5", "nan"])
+def test_identity_must_be_a_fraction(value):
+    with pytest.raises(ValueError):
+        parse_identity(value)
+    assert parse_identity("1") == 1.0
+
+def test_expansion_restores_every_record_in_order(tmp_path):
+    records = [("a", "ACGTACGTAC"), ("b desc", "ACGTACGTAA"), ("e", "ACGAC"), ("f", "ACGTACGTAC")]
+    index = scan_fasta(write_fasta(tmp_path / "in.fasta", records))
+    dedup = find_duplicates(index, identity=0.9)
+    aligned = write_fasta(tmp_path / "aligned.fasta", [("e", "acg-----ac"), ("a", "acgtacgtac")])
+    expand_alignment(aligned, index, dedup, str(tmp_path / "out.fasta"))
+    out = list(SeqIO.parse(tmp_path / "out.fasta", "fasta"))
+    assert [r.description for r in out] == ["a", "b desc", "e", "f"]
+    assert [str(r.seq) for r in out] == ["acgtacgtac", "acgtacgtaa", "acg-----ac", "acgtacgtac"]
+
+def test_expansion_keys_rows_by_position_for_repeated_ids(tmp_path):
+    records = [("x", "ACGTACGTAC"), ("x", "TTGGCCAA"), ("y first", "ACGTACGTAC"), ("y second", "GGGG"), ("x", "TTGGCCAA")]
+    index = scan_fasta(write_fasta(tmp_path / "in.fasta", records))
+    dedup = find_duplicates(index)
+    assert dedup.representatives == [0, 1, 3]
+    # the aligner may emit the rows in any order
+    aligned = write_fasta(tmp_path / "aligned.fasta", [("y second", "GG-GG-----"), ("x", "TTGGCC--AA"), ("x", "ACGTACGTAC")])
+    expand_alignment(aligned, index, dedup, str(tmp_path / "out.fasta"))
+    out = list(SeqIO.parse(tmp_path / "out.fasta", "fasta"))
+    assert [r.description for r in out] == ["x", "x", "y first", "y second", "x"]
+    assert [str(r.seq) for r in out] == ["ACGTACGTAC", "TTGGCC--AA", "ACGTACGTAC", "GG-GG-----", "TTGGCC--AA"]
@@ -0,0 +1,123 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from SwiftAlign.distributed import Coordinator, RemoteError, Worker, request
+from SwiftAlign.hybrid_msa import cancel_scope, cluster_budget, run_command
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Stand-in for a remote node: a worker process whose handler upper-cases the task's text file
+WORKER_SCRIPT = """
+import os, sys, time
+from SwiftAlign.distributed import Worker
+
+def handler(kind, params, files, workdir, cancel):
+    if kind == "fail":
+        raise ValueError("bad input")
+    time.sleep(params.get("sleep", 0))
+    output = os.path.join(workdir, "output")
+    with open(files["text"]) as handle, open(output, "w") as out:
+        out.write(handle.read().upper())
+    return {"files": {"output": output}, "pid": os.getpid()}
+
+Worker(("127.0.0.1", int(sys.argv[1])), handler, jobs=2, token="secret", linger=2, log=lambda message: None).run()
+"""
+
+@pytest.fixture
+def coordinator():
+    coordinator = Coordinator("127.0.0.1", 0, token="secret", heartbeat=0.3)
+    yield coordinator
+    coordinator.close()
+
+def start_workers(tmp_path, port, count):
+    script = tmp_path / "worker.py"
+    script.write_text(WORKER_SCRIPT)
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    return [subprocess.Popen([sys.executable, str(script), str(port)], env=env) for _ in range(count)]
+
+# -------------------- Tests --------------------
+def test_local_worker_processes_share_the_queue(coordinator, tmp_path):
+    workers = start_workers(tmp_path, coordinator.address[1], 3)
+    try:
+        text = tmp_path / "text"
+        text.write_text("acgt" * 100000)
+        futures = [coordinator.submit("upper", {"sleep": 0.2}, {"text": f"acgt{i}".encode()},
+                                      {"output": str(tmp_path / f"out{i}")}) for i in range(12)]
+        futures.append(coordinator.submit("upper", {}, {"text": str(text)}, {"output": str(tmp_path / "big")}))
+        results = [future.result(timeout=60) for future in futures]
+        assert [(tmp_path / f"out{i}").read_text() for i in range(12)] == [f"ACGT{i}" for i in range(12)]
+        assert (tmp_path / "big").read_text() == "ACGT" * 100000
+        assert results[-1]["files"] == {"output": str(tmp_path / "big")}
+        assert len({result["pid"] for result in results}) > 1
+        assert not list(tmp_path.glob("*.part"))
+        with pytest.raises(RemoteError, match="bad input"):
+            coordinator.run("fail", {}, {})
+    finally:
+        for worker in workers:
+            worker.kill()
+            worker.wait()
+
+def test_tasks_of_dead_workers_are_requeued(coordinator, tmp_path):
+    address = coordinator.address
+    assert request(address, {"op": "pull", "worker": "w", "token": "wrong"})["op"] == "error"
+    output = tmp_path / "out"
+    future = coordinator.submit("upper", {}, {"text": b"acgt"}, {"output": str(output)})
+    # A worker takes the task and dies without a heartbeat or result
+    task = request(address, {"op": "pull", "worker": "ghost", "token": "secret"})
+    assert task["op"] == "task" and task["blobs"] == {"text": b"acgt"}
+    time.sleep(1.5)
+    assert request(address, {"op": "heartbeat", "worker": "ghost", "task": task["task"], "token": "secret"})["op"] == "cancel"
+
+    workers = start_workers(tmp_path, address[1], 1)
+    try:
+        future.result(timeout=60)
+        assert output.read_text() == "ACGT"
+    finally:
+        workers[0].kill()
+        workers[0].wait()
+    # A late result from the dead worker is ignored
+    late = {"op": "result", "worker": "ghost", "task": task["task"], "ok": True, "result": {}, "token": "secret"}
+    assert request(address, late, blobs={"output": b"x"})["op"] == "ok"
+    assert output.read_text() == "ACGT"
+    assert [path.name for path in tmp_path.iterdir() if path.name.startswith("out")] == ["out"]
+
+def test_remote_budget_follows_the_registered_worker_cores(coordinator):
+    budget = cluster_budget(coordinator, 2)
+    assert (budget.cores, budget.local.cores) == (1, 2)
+    for name, cores in (("a", 8), ("b", 16)):
+        assert request(coordinator.address, {"op": "pull", "worker": name, "cores": cores, "token": "secret"})["op"] == "wait"
+    assert budget.cores == budget.free == 24
+    assert budget.try_acquire(30) == 24
+    # Workers that stop polling take their cores with them
+    time.sleep(1.5)
+    assert budget.cores == 1 and budget.try_acquire(1) == 0
+    budget.release(24)
+    assert budget.free == 1
+
+def test_taken_back_tasks_stop_their_commands(coordinator):
+    started, messages = threading.Event(), []
+
+    def handler(kind, params, files, workdir, cancel):
+        with cancel_scope([cancel]):
+            started.set()
+            run_command([sys.executable, "-c", "import time; time.sleep(60)"])
+
+    worker = Worker(coordinator.address, handler, token="secret", linger=2, log=messages.append)
+    threading.Thread(target=worker.run, daemon=True).start()
+    coordinator.submit("sleep", {})
+    assert started.wait(30)
+    begin = time.time()
+    with coordinator.cond:
+        next(iter(coordinator.tasks.values()))["worker"] = "another worker"
+    while not any("taken back" in message for message in messages):
+        assert time.time() - begin < 20
+        time.sleep(0.05)
+    worker.stopping.set()
+    with coordinator.cond:
+        coordinator.tasks.clear()
+        coordinator.queue.clear()
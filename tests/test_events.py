@@ -0,0 +1,53 @@
+import json
+import sys
+
+import pytest
+
+from SwiftAlign.events import EventLog
+
+@pytest.fixture
+def recorded_events(monkeypatch):
+    # A fresh recording log in place of the global one, restored after the test
+    from SwiftAlign import hybrid_msa
+
+    events = EventLog()
+    monkeypatch.setattr(hybrid_msa, "EVENTS", events)
+    return events
+
+# -------------------- Tests --------------------
+def test_log_lines_are_batched(tmp_path):
+    events = EventLog(flush_lines=3, flush_seconds=3600)
+    log_file = tmp_path / "run.log"
+    events.line("one", str(log_file))
+    events.line("two", str(log_file))
+    assert not log_file.exists()
+    events.line("three", str(log_file))
+    assert log_file.read_text() == "one\ntwo\nthree\n"
+    events.line("four", str(log_file))
+    events.flush()
+    assert log_file.read_text().endswith("four\n")
+
+def test_job_spans_and_trace_export(tmp_path, recorded_events):
+    from SwiftAlign import hybrid_msa
+
+    events = recorded_events
+
+    def run(cores, _):
+        hybrid_msa.EVENTS.annotate(method="auto", fallbacks=1)
+        hybrid_msa.run_command([sys.executable, "-c", "pass"])
+        return cores
+
+    jobs = [hybrid_msa.Job(name, run=run, cores=1) for name in ("a", "b")]
+    assert hybrid_msa.run_job_graph(jobs, hybrid_msa.CoreBudget(2)) == {"a": 1, "b": 1}
+
+    events.write_jsonl(tmp_path / "run.events.jsonl")
+    records = [json.loads(line) for line in (tmp_path / "run.events.jsonl").read_text().splitlines()]
+    spans = [r for r in records if r["kind"] == "span"]
+    assert sorted(s["name"] for s in spans) == ["job a", "job b"]
+    assert all(s["subprocesses"] == 1 and s["fallbacks"] == 1 and s["child_peak_rss_mb"] > 0 for s in spans)
+    assert max(r["busy"] for r in records if r["kind"] == "counter") <= 2
+
+    events.write_chrome_trace(tmp_path / "run.trace.json")
+    trace = json.loads((tmp_path / "run.trace.json").read_text())["traceEvents"]
+    assert {e["ph"] for e in trace} >= {"X", "C", "M"}
+    assert sum(e["ph"] == "X" and e["cat"] == "process" for e in trace) == 2
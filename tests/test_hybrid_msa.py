@@ -1,5 +1,6 @@
 import os
 import subprocess
+import numpy as np
 import pytest
 from Bio import SeqIO
 
@@ -15,6 +16,69 @@ def run_swiftalign(input_file, output_file, extra_args=""):
     cmd = f"python3 ../SwiftAlign/hybrid_msa.py -i {input_file} -o {output_file} {extra_args}"
     subprocess.run(cmd, shell=True, check=True)
 
+# Stand-ins for MAFFT and MUSCLE: they pad every sequence to the longest one, so a whole run can be checked
+# without the real aligners. 'mafft --add' opens insertion columns at the end of the reference rows, or with
+# --keeplength keeps the reference width, cutting added rows as MAFFT does.
+FAKE_ALIGNER = """
+import os, sys, time
+
+def read(text):
+    records = []
+    for line in text.splitlines():
+        if line.startswith(">"):
+            records.append([line, ""])
+        elif records:
+            records[-1][1] += line.strip()
+    return records
+
+def pad(records, width=None):
+    width = width if width is not None else max((len(seq) for _, seq in records), default=0)
+    return "".join(f"{title}\\n{seq[:width].ljust(width, '-')}\\n" for title, seq in records)
+
+args = sys.argv[1:]
+if "--maxiterate" in args and os.environ.get("FAKE_SLOW_ITERATIVE"):
+    time.sleep(60)   # the iterative MAFFT strategies run into their time limit
+if os.path.basename(sys.argv[0]) == "muscle":
+    if "-version" in args:
+        print("muscle 5.1 (fake)")
+        sys.exit(0)
+    with open(args[args.index("-out") + 1], "w") as out:
+        out.write(pad(read(open(args[args.index("-in") + 1]).read())))
+elif "--version" in args:
+    sys.stderr.write("v7.999 (fake)\\n")
+elif "--merge" in args:
+    i = args.index("--merge")
+    sys.stdout.write(pad(read(open(args[i + 1]).read() + open(args[i + 2]).read())))
+elif "--add" in args or "--addfragments" in args:
+    reference = read(open(args[-1]).read())
+    added = read(open(args[args.index("--add" if "--add" in args else "--addfragments") + 1]).read())
+    sys.stdout.write(pad(reference + added, len(reference[0][1]) if "--keeplength" in args else None))
+else:
+    sys.stdout.write(pad(read(sys.stdin.read())))
+"""
+
+@pytest.fixture
+def fake_aligners(tmp_path, monkeypatch):
+    """Put fake mafft and muscle on PATH; returns the environment for CLI runs."""
+    import sys
+    from SwiftAlign import hybrid_msa
+
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name in ("mafft", "muscle"):
+        script = bin_dir / name
+        script.write_text(f"#!{sys.executable}\n" + FAKE_ALIGNER)
+        script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    hybrid_msa.find_binary.cache_clear()
+    yield dict(os.environ)
+    hybrid_msa.find_binary.cache_clear()
+
+def run_cli(env, cwd, *args):
+    import sys
+    script = os.path.join(TESTS_DIR, "..", "SwiftAlign", "hybrid_msa.py")
+    return subprocess.run([sys.executable, script, *map(str, args)], env=env, cwd=cwd, capture_output=True, text=True)
+
 # -------------------- Tests --------------------
 def test_basic_alignment():
     output_fasta = os.path.join(OUTPUT_DIR, "aligned_basic.fasta")
@@ -57,3 +121,523 @@ def test_log_file_creation():
         log_contents = f.read()
     assert "SwiftAlign" in log_contents
     assert "Hybrid MSA Summary Report" in log_contents
+
+def test_job_graph_respects_dependencies_and_core_budget():
+    import threading
+    import time
+    from SwiftAlign.hybrid_msa import CoreBudget, Job, run_job_graph
+
+    budget = CoreBudget(4)
+    lock = threading.Lock()
+    in_use = [0, 0]
+
+    def work(cores, inputs):
+        with lock:
+            in_use[0] += cores
+            in_use[1] = max(in_use[1], in_use[0])
+        time.sleep(0.02)
+        with lock:
+            in_use[0] -= cores
+        return sum(inputs) + 1
+
+    jobs = [Job("a", run=work), Job("b", run=work), Job("c", run=work),
+            Job("ab", ("a", "b"), work), Job("root", ("ab", "c"), work, cores=4)]
+    results = run_job_graph(jobs, budget)
+    assert results["root"] == 5
+    assert in_use[1] <= 4 and budget.free == 4
+
+def test_manifest_resume_skips_finished_merges(tmp_path):
+    from SwiftAlign.hybrid_msa import RunManifest, balanced_merge_tree, merge_levels, pending_merges
+
+    levels = merge_levels(balanced_merge_tree(4), 4)        # 4 + 5 -> 6, merges 4=(0,1), 5=(2,3)
+    artifact = tmp_path / "merged_1_0.fasta"
+    artifact.write_text(">a\nA\n")
+    fingerprint = {"input": "x.fasta", "chunk_size": 2}
+    manifest = RunManifest(str(tmp_path / "run.json"), fingerprint)
+    manifest.record("merges", str(artifact), key=4)
+
+    resumed = RunManifest(str(tmp_path / "run.json"), fingerprint, resume=True)
+    assert resumed.resumed and resumed.artifacts("merges") == {4: str(artifact)}
+    todo, inputs = pending_merges(levels, resumed.artifacts("merges"))
+    assert todo == {5, 6} and inputs == {4, 2, 3}
+    assert not RunManifest(str(tmp_path / "run.json"), {"input": "y.fasta"}, resume=True).resumed
+
+def test_thread_assignment_follows_cost():
+    from SwiftAlign.hybrid_msa import assign_threads, estimate_job_cost
+
+    big = estimate_job_cost(200, 200 * 1500, "einsi")
+    small = estimate_job_cost(12, 12 * 1500, "einsi")
+    assert big > small > estimate_job_cost(12, 12 * 1500, "auto")
+    assert assign_threads([big, small, small], 8)[0] >= 6
+    assert assign_threads([1.0, 1.0], 8) == [4, 4]
+    assert assign_threads([1.0] * 10, 4) == [1] * 10
+
+def test_windowed_realignment_stitches_rows(tmp_path):
+    from SwiftAlign.hybrid_msa import CoreBudget, gap_disagreement_windows, realign_windows
+
+    rows = [("r1", b"ACGTACGTAC"), ("r2", b"ACGTACGTAC"), ("new", b"ACG--CGTAC")]
+    windows = gap_disagreement_windows(rows, n_reference=2, pad=1)
+    assert windows == [(2, 6)]
+
+    def left_align(rows, start, end, prefix, cores, log_file):
+        pieces = [row[start:end].replace(b"-", b"") for _, row in rows]
+        return [piece.ljust(5, b"-") for piece in pieces]
+
+    stitched = realign_windows(rows, windows, CoreBudget(2), str(tmp_path), realign=left_align)
+    assert [row for _, row in stitched] == [b"ACGTAC-GTAC", b"ACGTAC-GTAC", b"ACGC---GTAC"]
+
+def test_stage_report_charges_subprocesses(tmp_path, monkeypatch):
+    import json
+    import sys
+    from SwiftAlign import hybrid_msa
+
+    monkeypatch.setattr(hybrid_msa, "STAGE_REPORT", hybrid_msa.StageReport())
+    report = hybrid_msa.STAGE_REPORT
+    with report.stage("chunk_mafft"):
+        with open(tmp_path / "out.txt", "wb") as out:
+            hybrid_msa.run_command([sys.executable, "-c", "import sys; sys.stdout.write(sys.stdin.read())"],
+                                   stdout=out, input_data=b"ACGT")
+        with pytest.raises(subprocess.CalledProcessError):
+            hybrid_msa.run_command([sys.executable, "-c", "raise SystemExit(3)"])
+    assert (tmp_path / "out.txt").read_bytes() == b"ACGT"
+    report.write(tmp_path / "report.json")
+    stage = json.loads((tmp_path / "report.json").read_text())["stages"]["chunk_mafft"]
+    assert stage["subprocesses"] == 2 and stage["child_peak_rss_mb"] > 0 and stage["wall_sec"] > 0
+    assert "peak_rss_mb" not in stage and stage["peak_rss_so_far_mb"] > 0
+
+def test_strategy_timeout_kills_process_group(tmp_path):
+    import sys
+    import time
+    from SwiftAlign.hybrid_msa import run_command
+
+    pid_file = tmp_path / "child.pid"
+    script = (f"import subprocess, sys; p = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)']); "
+              f"open({str(pid_file)!r}, 'w').write(str(p.pid)); p.wait()")
+    started = time.time()
+    with pytest.raises(subprocess.TimeoutExpired):
+        run_command([sys.executable, "-c", script], timeout=1.0)
+    assert time.time() - started < 10
+    child = int(pid_file.read_text())
+
+    def alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        stat = f"/proc/{pid}/stat"
+        return not (os.path.exists(stat) and open(stat).read().rsplit(")", 1)[1].split()[0] == "Z")
+
+    deadline = time.time() + 5
+    while alive(child) and time.time() < deadline:
+        time.sleep(0.05)
+    assert not alive(child)
+
+def test_failed_job_stops_the_commands_of_running_jobs():
+    import sys
+    import threading
+    import time
+    from SwiftAlign import hybrid_msa
+
+    def slow(cores, _):
+        hybrid_msa.run_command([sys.executable, "-c", "import time; time.sleep(60)"])
+
+    def bad(cores, _):
+        time.sleep(0.5)
+        raise hybrid_msa.SwiftAlignError("chunk failed")
+
+    started = time.time()
+    with pytest.raises(hybrid_msa.SwiftAlignError, match="chunk failed"):
+        hybrid_msa.run_job_graph([hybrid_msa.Job("slow", run=slow, cores=1), hybrid_msa.Job("bad", run=bad, cores=1),
+                                  hybrid_msa.Job("after", ("bad",), slow, cores=1)], hybrid_msa.CoreBudget(2))
+    assert time.time() - started < 10
+    with hybrid_msa.cancel_scope([threading.Event()]):
+        hybrid_msa.current_cancel_events()[0].set()
+        with pytest.raises(hybrid_msa.JobCancelled):
+            hybrid_msa.run_command([sys.executable, "-c", "pass"])
+
+def test_racing_auto_replaces_slow_strategy(tmp_path):
+    import sys
+    from SwiftAlign.hybrid_msa import CoreBudget, StrategyTimeouts, run_strategies
+
+    def build_cmd(method, threads=1):
+        delay = {"einsi": 60, "ginsi": 60, "auto": 0}[method]
+        return [sys.executable, "-c", f"import time; time.sleep({delay}); print('>{method}')"]
+
+    out = tmp_path / "aligned.fasta"
+    limits = {"einsi": 1.0, "ginsi": 1.0, "auto": None}
+    assert run_strategies(build_cmd, ["einsi", "ginsi", "auto"], str(out), "chunk_0", limits=limits,
+                          budget=CoreBudget(2), race=True) == "auto"
+    assert out.read_text() == ">auto\n" and not os.path.exists(f"{out}.race")
+    # without a spare core the race never starts and the normal fallback order applies
+    busy = CoreBudget(1)
+    busy.try_acquire(1)
+    assert run_strategies(build_cmd, ["einsi", "ginsi", "auto"], str(out), "chunk_0", limits=limits,
+                          budget=busy, race=True) == "auto"
+    assert busy.free == 0
+
+    timeouts = StrategyTimeouts(10, 5)
+    assert timeouts.limit(200, 200 * 1000, "einsi", 4) > timeouts.limit(20, 20 * 1000, "einsi", 4) >= 5
+    assert timeouts.limits(20, 20 * 1000, ["einsi", "auto"], 4)["auto"] is None
+    assert StrategyTimeouts(0, 5).limit(200, 200 * 1000, "einsi", 4) is None
+
+def test_timed_out_strategy_does_not_change_calibration(tmp_path):
+    import sys
+    import time
+    from SwiftAlign.hybrid_msa import JobProgress, StrategyTimeouts, run_strategies, strategy_clock
+
+    def build_cmd(method, threads=1):
+        delay = {"einsi": 60, "auto": 0}[method]
+        return [sys.executable, "-c", f"import time; time.sleep({delay}); print('>{method}')"]
+
+    progress = JobProgress(2, 2.0, 1)
+    started = time.time()
+    with strategy_clock() as clock:
+        assert run_strategies(build_cmd, ["einsi", "auto"], str(tmp_path / "aligned.fasta"), "chunk_0",
+                              limits={"einsi": 1.0, "auto": None}) == "auto"
+    elapsed = time.time() - started
+    progress.finish("chunk_0", 1.0, 1, elapsed, strategy_seconds=clock.seconds)
+    assert elapsed >= 1.0 > clock.seconds
+
+    # the rate, and so the next time limit, only reflects the successful '--auto' run
+    only_success = JobProgress(2, 2.0, 1)
+    only_success.finish("chunk_0", 1.0, 1, clock.seconds)
+    assert progress.seconds_per_cost() == only_success.seconds_per_cost()
+    assert (StrategyTimeouts(1000, 0, progress).limit(50, 5000, "einsi", 1)
+            == StrategyTimeouts(1000, 0, only_success).limit(50, 5000, "einsi", 1))
+
+def test_fallback_is_charged_at_the_cost_of_the_method_that_ran():
+    from SwiftAlign.hybrid_msa import JobProgress, StrategyTimeouts, estimate_job_cost
+
+    einsi, auto = estimate_job_cost(50, 5000, "einsi"), estimate_job_cost(50, 5000, "auto")
+    progress = JobProgress(3, 3 * einsi, 1)
+    timeouts = StrategyTimeouts(10, 0, progress)
+    # chunk_0 asked for 'einsi' but fell back to a 0.1 sec '--auto' run
+    progress.finish("chunk_0", einsi, 1, 5.0, strategy_seconds=0.1, strategy_cost=auto)
+    assert progress.seconds_per_cost() == pytest.approx(0.1 / auto)
+    assert timeouts.limit(50, 5000, "einsi", 1) == pytest.approx(10 * 0.1 * einsi / auto)
+    # the next chunk's 'einsi' run gets a limit its own prediction supports, and joins the rate at its own cost
+    progress.finish("chunk_1", einsi, 1, 40.0, strategy_seconds=40.0, strategy_cost=einsi)
+    assert progress.seconds_per_cost() == pytest.approx(40.1 / (auto + einsi))
+    assert progress.done_cost == 2 * einsi
+
+def test_fallback_alignments_are_not_cached(tmp_path, monkeypatch):
+    from SwiftAlign import hybrid_msa
+    from SwiftAlign.cache import AlignmentCache
+
+    cache = AlignmentCache(tmp_path / "cache")
+    chunk = hybrid_msa.ChunkSpec(str(tmp_path / "chunk_0"), None, None, 2, 8)
+    data = b">a\nACGT\n>b\nACGT\n"
+    for winner in ("auto", "einsi"):
+        def run_strategies(build_cmd, methods, output_file, *args, **kwargs):
+            with open(output_file, "wb") as out:
+                out.write(data)
+            return winner
+        monkeypatch.setattr(hybrid_msa, "run_strategies", run_strategies)
+        key = hybrid_msa.make_key("chunk", data, winner)
+        hybrid_msa.run_mafft_chunk(chunk, "dna", "einsi", None, None, 1, cache=cache, cache_key=key, chunk_data=data)
+        assert cache.fetch(key, str(tmp_path / "fetched.fasta")) == (winner == "einsi")
+
+def test_refinement_windows_cut_at_conserved_anchors():
+    from SwiftAlign.hybrid_msa import alignment_matrix, anchor_windows, conserved_columns, sketch_subgroups
+
+    rows = [("a", b"ACGTAC-GTA" * 12), ("b", b"acgtacTGTA" * 12), ("c", b"ACGAACTGTA" * 12)]
+    anchors = conserved_columns(alignment_matrix(rows))
+    assert anchors[:10].tolist() == [True, True, True, False, True, True, False, True, True, True]
+    windows = anchor_windows(anchors, 50)
+    assert windows[0][0] == 0 and windows[-1][1] == 120
+    assert all(e1 == s2 for (_, e1), (s2, _) in zip(windows, windows[1:]))
+    assert all(anchors[end - 1] for _, end in windows[:-1])
+    assert anchor_windows(np.zeros(300, dtype=bool), 50) == [(0, 300)]
+
+    groups, tree = sketch_subgroups(rows * 2, "dna", 2)
+    assert sorted(i for group in groups for i in group) == list(range(6))
+
+def test_batch_shares_one_budget_and_writes_summary(tmp_path, monkeypatch):
+    from SwiftAlign import hybrid_msa
+
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    for name in ("a.fasta", "b.fa", "bad.fasta", "notes.txt"):
+        (inputs / name).write_text(">s\nACGT\n")
+    budgets = set()
+
+    def run_pipeline(args, workdir, log_file=None, budget=None):
+        budgets.add(id(budget))
+        if "bad" in args.input:
+            raise hybrid_msa.SwiftAlignError("broken input")
+        open(args.output, "w").close()
+        return {"sequences": 1, "alignment_length": 4, "chunks": 1, "runtime_sec": 0.0}
+
+    monkeypatch.setattr(hybrid_msa, "run_pipeline", run_pipeline)
+    args = hybrid_msa.build_parser().parse_args(["-i", str(inputs), "-o", str(tmp_path / "out"), "--batch",
+                                                 "--format", "clustal", "--threads", "2"])
+    with pytest.raises(hybrid_msa.SwiftAlignError, match="1 of 3"):
+        hybrid_msa.run_batch(args, str(tmp_path / "work"), None)
+    assert len(budgets) == 1
+    assert sorted(os.listdir(tmp_path / "out")) == ["a.aln", "b.aln", "batch_summary.tsv"]
+    rows = (tmp_path / "out" / "batch_summary.tsv").read_text().splitlines()
+    assert [row.split("\t")[2] for row in rows[1:]] == ["ok", "ok", "failed"]
+    assert os.listdir(tmp_path / "work") == ["2_bad"]
+
+    manifest = tmp_path / "inputs.txt"
+    manifest.write_text("inputs/a.fasta\tx.fasta\ninputs/b.fa\n")
+    assert hybrid_msa.batch_inputs(str(manifest), "out", "fasta") == [
+        (str(inputs / "a.fasta"), os.path.join("out", "x.fasta")), (str(inputs / "b.fa"), os.path.join("out", "b.fasta"))]
+
+def test_time_budget_plan_degrades_settings_to_fit():
+    from SwiftAlign import hybrid_msa
+    from SwiftAlign.ingest import scan_fasta
+    from SwiftAlign.planner import RuntimeModel, parse_duration
+
+    assert parse_duration("90m") == 5400 and parse_duration("2h") == 7200 and parse_duration("45") == 45
+    seqs = scan_fasta(INPUT_FILE)
+    model = RuntimeModel()
+
+    def plan(budget):
+        args = hybrid_msa.build_parser().parse_args(["-i", INPUT_FILE, "-o", "x", "--chunk_size", "4",
+                                                     "--time_budget", str(budget)])
+        return hybrid_msa.plan_run(seqs, "dna", "einsi", 32, args, model)
+
+    generous, tight = plan("1000d"), plan("0.000001")
+    assert (generous.mafft_method, generous.merge_method, generous.chunk_size, generous.muscle_max_iter) == ("einsi", "einsi", 4, 32)
+    assert (tight.mafft_method, tight.merge_method, tight.refine) == ("auto", "auto", "none")
+    assert sum(tight.predicted.values()) < sum(generous.predicted.values())
+
+    for cost in (1e3, 1e4, 1e5, 1e6) * 3:
+        model.observe("dna", cost, 0.1, 3e-6 * cost ** 1.2)
+    model.save()
+    assert abs(model.predict("dna", 1e7, 0.1) / (3e-6 * 1e7 ** 1.2) - 1) < 0.05
+
+def test_inflight_window_bounds_unmerged_chunks():
+    from SwiftAlign import hybrid_msa
+
+    assert hybrid_msa.streaming_leaf_order(hybrid_msa.balanced_merge_tree(8)) == (list(range(8)), 4)
+    assert hybrid_msa.streaming_leaf_order((0, (1, (2, 3)))) == ([2, 3, 1, 0], 2)
+    assert hybrid_msa.streaming_leaf_order(((((0, 1), 2), 3), 4))[1] == 2
+
+    # Leaves and merges of a caterpillar tree in one graph; the window must never hold more than two open results
+    tree = ((((((0, 1), 2), 3), 4), 5), 6)
+    order, needed = hybrid_msa.streaming_leaf_order(tree)
+    window = hybrid_msa.InflightWindow(needed)
+    peak = []
+
+    def leaf(cores, _):
+        peak.append(window.open)
+        return "leaf"
+
+    def merge_job(step, node, left, right):
+        def merge(cores, inputs):
+            window.merged(node, (left, right))
+            return "merged"
+        return hybrid_msa.Job(node, (left, right), merge, cores=1, priority=-step)
+
+    levels = hybrid_msa.merge_levels(tree, 7)
+    jobs = [hybrid_msa.Job(idx, run=leaf, cores=1, priority=-(len(levels) + 1 + order.index(idx))) for idx in range(7)]
+    jobs += [merge_job(step, *merge) for step, level in enumerate(levels, 1) for merge in level]
+    results = hybrid_msa.run_job_graph(jobs, hybrid_msa.CoreBudget(4), admit=window.admit)
+    assert results[levels[-1][-1][0]] == "merged"
+    assert max(peak) <= 2 and window.open == 1
+
+    # Cached leaves were never admitted, so merging them must not free window slots
+    window = hybrid_msa.InflightWindow(needed)
+    cached = {0: "cached", 1: "cached", 2: "cached"}
+    peak.clear()
+    jobs = [hybrid_msa.Job(idx, run=leaf, cores=1, priority=-(len(levels) + 1 + order.index(idx))) for idx in range(3, 7)]
+    jobs += [merge_job(step, *merge) for step, level in enumerate(levels, 1) for merge in level]
+    results = hybrid_msa.run_job_graph(jobs, hybrid_msa.CoreBudget(4), results=cached, admit=window.admit)
+    assert results[levels[-1][-1][0]] == "merged"
+    assert max(peak) <= 2 and window.open == 1
+
+def write_random_fasta(path, count, length=120, seed=0):
+    rng = np.random.default_rng(seed)
+    with open(path, "w") as out:
+        for i in range(count):
+            seq = "".join(rng.choice(list("ACGT"), length - int(rng.integers(0, 20))))
+            out.write(f">s{i}\n{seq}\n")
+    return str(path)
+
+def test_subgroup_refinement_end_to_end(tmp_path, fake_aligners):
+    source = write_random_fasta(tmp_path / "input.fasta", 24)
+    output = tmp_path / "aligned.fasta"
+    result = run_cli(fake_aligners, tmp_path, "-i", source, "-o", output, "--chunk_size", "4", "--threads", "4",
+                     "--refine", "subgroups", "--workdir", tmp_path / "work", "--log_file", tmp_path / "run.log")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "re-merging them along their guide tree" in (tmp_path / "run.log").read_text()
+    rows = list(SeqIO.parse(output, "fasta"))
+    assert [record.id for record in rows] == [f"s{i}" for i in range(24)]
+    assert len({len(record.seq) for record in rows}) == 1
+
+def write_family_fasta(path, families, per_family, length=120, seed=0):
+    # Point mutants of a few unrelated ancestors, interleaved so no family is contiguous in the input
+    rng = np.random.default_rng(seed)
+    ancestors = [rng.choice(list("ACGT"), length) for _ in range(families)]
+    with open(path, "w") as out:
+        for i in range(families * per_family):
+            seq = ancestors[i % families].copy()
+            sites = rng.integers(0, length, 3)
+            seq[sites] = rng.choice(list("ACGT"), 3)
+            out.write(f">s{i}\n{''.join(seq)}\n")
+    return str(path)
+
+def test_subgroup_refinement_keeps_input_order(tmp_path, fake_aligners):
+    source = write_family_fasta(tmp_path / "input.fasta", 4, 6)
+    output = tmp_path / "aligned.fasta"
+    result = run_cli(fake_aligners, tmp_path, "-i", source, "-o", output, "--chunk_size", "4", "--threads", "4",
+                     "--refine", "subgroups", "--workdir", tmp_path / "work", "--log_file", tmp_path / "run.log")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "re-merging them along their guide tree" in (tmp_path / "run.log").read_text()
+    expected = {record.id: str(record.seq) for record in SeqIO.parse(source, "fasta")}
+    rows = list(SeqIO.parse(output, "fasta"))
+    assert [record.id for record in rows] == [f"s{i}" for i in range(24)]
+    assert all(str(record.seq).replace("-", "") == expected[record.id] for record in rows)
+
+def test_similarity_chunking_keeps_input_order(tmp_path, fake_aligners):
+    source = write_family_fasta(tmp_path / "input.fasta", 4, 6)
+    output = tmp_path / "aligned.fasta"
+    result = run_cli(fake_aligners, tmp_path, "-i", source, "-o", output, "--chunk_size", "6", "--threads", "4",
+                     "--chunking", "similarity", "--refine", "none", "--workdir", tmp_path / "work",
+                     "--log_file", tmp_path / "run.log")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "Similarity chunking: 4 clusters" in (tmp_path / "run.log").read_text()
+    expected = {record.id: str(record.seq) for record in SeqIO.parse(source, "fasta")}
+    rows = list(SeqIO.parse(output, "fasta"))
+    assert [record.id for record in rows] == [f"s{i}" for i in range(24)]
+    assert all(str(record.seq).replace("-", "") == expected[record.id] for record in rows)
+
+def test_long_mode_adds_sequences_without_anchors_and_falls_back_without_any(tmp_path, fake_aligners):
+    rng = np.random.default_rng(2)
+    root = rng.choice(list("ACGT"), 6000)
+    source = tmp_path / "input.fasta"
+    with open(source, "w") as out:
+        for i in range(6):
+            seq = root.copy() if i != 3 else rng.choice(list("ACGT"), 5000)
+            sites = rng.random(seq.size) < 0.01
+            seq[sites] = rng.choice(list("ACGT"), int(sites.sum()))
+            out.write(f">s{i}\n{''.join(seq)}\n")
+    output = tmp_path / "aligned.fasta"
+    result = run_cli(fake_aligners, tmp_path, "-i", source, "-o", output, "--long_mode", "on", "--refine", "none",
+                     "--workdir", tmp_path / "work", "--log_file", tmp_path / "run.log")
+    assert result.returncode == 0, result.stdout + result.stderr
+    log_text = (tmp_path / "run.log").read_text()
+    assert "shared by 5 of 6 sequences" in log_text and "Adding 1 sequences without the shared anchors" in log_text
+    expected = {record.id: str(record.seq) for record in SeqIO.parse(source, "fasta")}
+    rows = list(SeqIO.parse(output, "fasta"))
+    assert [record.id for record in rows] == [f"s{i}" for i in range(6)]
+    assert all(str(record.seq).replace("-", "") == expected[record.id] for record in rows)
+
+    unrelated = write_random_fasta(tmp_path / "unrelated.fasta", 6)
+    result = run_cli(fake_aligners, tmp_path, "-i", unrelated, "-o", output, "--long_mode", "on", "--chunk_size", "2",
+                     "--refine", "none", "--workdir", tmp_path / "work2", "--log_file", tmp_path / "fallback.log")
+    assert result.returncode == 0, result.stdout + result.stderr
+    log_text = (tmp_path / "fallback.log").read_text()
+    assert "using chunked alignment instead" in log_text and "Total chunks created: 3" in log_text
+    assert [record.id for record in SeqIO.parse(output, "fasta")] == [f"s{i}" for i in range(6)]
+
+def test_runtime_model_only_observes_the_strategy_that_ran(tmp_path, fake_aligners):
+    import json
+    from SwiftAlign import hybrid_msa
+
+    source = tmp_path / "input.fasta"
+    rng = np.random.default_rng(0)
+    source.write_text("".join(f">s{i}\n{''.join(rng.choice(list('ACGT'), 60 if i % 2 else 120))}\n" for i in range(8)))
+    model = tmp_path / "model.json"
+    result = run_cli(dict(fake_aligners, FAKE_SLOW_ITERATIVE="1"), tmp_path, "-i", source, "-o", tmp_path / "out.fasta",
+                     "--chunk_size", "4", "--threads", "2", "--refine", "none", "--runtime_model", model,
+                     "--strategy_timeout_factor", "1", "--min_strategy_timeout", "0.5",
+                     "--workdir", tmp_path / "work", "--log_file", tmp_path / "run.log")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "Trying MAFFT method 'einsi'" in (tmp_path / "run.log").read_text()
+    samples = json.loads(model.read_text())["samples"]["dna"]
+    assert len(samples) == 2
+    # each chunk spent over a second in timed-out strategies; only the '--auto' run is observed, at its own cost
+    assert all(core_seconds < 1.0 for _, _, core_seconds in samples)
+    assert all(cost <= hybrid_msa.estimate_job_cost(4, 4 * 120, "auto") for cost, _, _ in samples)
+
+def test_unplanned_runs_record_the_measured_divergence(tmp_path, fake_aligners):
+    import json
+    from SwiftAlign.ingest import scan_fasta
+    from SwiftAlign.planner import sampled_divergence
+
+    source = write_random_fasta(tmp_path / "input.fasta", 8)
+    model = tmp_path / "model.json"
+    result = run_cli(fake_aligners, tmp_path, "-i", source, "-o", tmp_path / "out.fasta", "--chunk_size", "4",
+                     "--refine", "none", "--runtime_model", model, "--workdir", tmp_path / "work")
+    assert result.returncode == 0, result.stdout + result.stderr
+    samples = json.loads(model.read_text())["samples"]["dna"]
+    assert len(samples) == 2
+    expected = sampled_divergence(scan_fasta(source), "dna")
+    assert expected > 0.5
+    assert all(divergence == pytest.approx(expected) for _, divergence, _ in samples)
+
+def test_add_warns_about_residues_dropped_by_keeplength(tmp_path, fake_aligners):
+    reference = tmp_path / "reference.fasta"
+    reference.write_text(">r1\nACGT-ACGT\n>r2\nACGTTACGT\n")
+    new = tmp_path / "new.fasta"
+    new.write_text(">fits desc\nACGTACGT\n>long one\nACGTACGTACGTAC\n")
+    output = tmp_path / "updated.fasta"
+    result = run_cli(fake_aligners, tmp_path, "-i", reference, "--add", new, "-o", output, "--keeplength",
+                     "--workdir", tmp_path / "work", "--log_file", tmp_path / "run.log")
+    assert result.returncode == 0, result.stdout + result.stderr
+    log_text = (tmp_path / "run.log").read_text()
+    assert "dropped residues of 1 added sequences" in log_text
+    assert "long: 9 of 14 residues kept" in log_text
+    assert "fits:" not in log_text
+    assert [record.id for record in SeqIO.parse(output, "fasta")] == ["r1", "r2", "fits", "long"]
+
+def test_add_keeps_every_residue_by_default(tmp_path, fake_aligners):
+    reference = tmp_path / "reference.fasta"
+    reference.write_text(">r1\nACGT-ACGT\n>r2\nACGTTACGT\n")
+    new = tmp_path / "new.fasta"
+    new.write_text(">fits\nACGTACGT\n>long one\nACGTACGTACGTAC\n>longer\nACGTACGTACGTACGTA\n")
+    output = tmp_path / "updated.fasta"
+    result = run_cli(fake_aligners, tmp_path, "-i", reference, "--add", new, "-o", output, "--chunk_size", "1",
+                     "--workdir", tmp_path / "work", "--log_file", tmp_path / "run.log")
+    assert result.returncode == 0, result.stdout + result.stderr
+    log_text = (tmp_path / "run.log").read_text()
+    assert "dropped residues" not in log_text and "opened 8 insertion columns" in log_text
+    rows = {record.id: str(record.seq) for record in SeqIO.parse(output, "fasta")}
+    assert list(rows) == ["r1", "r2", "fits", "long", "longer"]
+    assert rows["r1"] == "ACGT-ACGT--------" and rows["long"] == "ACGTACGTACGTAC---"
+    assert rows["longer"] == "ACGTACGTACGTACGTA"
+
+def test_added_batches_share_reference_columns_and_overlay_insertions():
+    from SwiftAlign.hybrid_msa import alignment_matrix, gap_columns, merge_added_batches, reference_columns
+
+    reference = [("r1", b"AC-GT"), ("r2", b"ACTGT")]
+    gaps = gap_columns(alignment_matrix(reference))
+    # batch 0 opened two columns after reference column 1, batch 1 one column there and one at the end
+    outputs = [[("r1", b"AC---GT"), ("r2", b"AC--TGT"), ("a", b"ACggTGT")],
+               [("r1", b"AC--GT-"), ("r2", b"AC-TGT-"), ("b", b"ACa-GTc")]]
+    batches = []
+    for rows in outputs:
+        mask = reference_columns(alignment_matrix(rows[:2]), gaps)
+        batches.append((rows[2:], mask))
+    assert batches[0][1].tolist() == [True, True, False, False, True, True, True]
+    merged, inserted = merge_added_batches(reference, batches)
+    assert inserted == 3
+    assert merged == [("r1", b"AC---GT-"), ("r2", b"AC--TGT-"), ("a", b"ACggTGT-"), ("b", b"ACa--GTc")]
+    assert reference_columns(alignment_matrix([("r1", b"ACG-T"), ("r2", b"ACTGT")]), gaps) is None
+
+def test_run_events_are_opt_in(tmp_path, fake_aligners):
+    source = write_random_fasta(tmp_path / "input.fasta", 6)
+    result = run_cli(fake_aligners, tmp_path, "-i", source, "-o", tmp_path / "plain.fasta", "--workdir", tmp_path / "plain",
+                     "--log_file", tmp_path / "plain.log")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert not list(tmp_path.rglob("*.events.jsonl")) and not list(tmp_path.rglob("*.trace.json"))
+
+    result = run_cli(fake_aligners, tmp_path, "-i", source, "-o", tmp_path / "traced.fasta", "--workdir", tmp_path / "work",
+                     "--log_file", tmp_path / "traced.log", "--events_prefix")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert (tmp_path / "work" / "run.events.jsonl").exists() and (tmp_path / "work" / "run.trace.json").exists()
+
+def test_failed_run_without_manifest_removes_its_workspace(tmp_path, fake_aligners):
+    bad = tmp_path / "bad.fasta"
+    bad.write_text("this is not FASTA\n")
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+    result = run_cli(fake_aligners, tmp_path, "-i", bad, "-o", tmp_path / "out.fasta", "--tmpdir", scratch,
+                     "--log_file", tmp_path / "run.log")
+    assert result.returncode == 1
+    log_text = (tmp_path / "run.log").read_text()
+    assert "--resume" not in log_text and "Run stopped before anything could be resumed." in log_text
+    assert list(scratch.iterdir()) == []
@@ -0,0 +1,77 @@
+import gzip
+import io
+
+import numpy as np
+from Bio import SeqIO, bgzf
+
+from SwiftAlign.ingest import PackedBlock, input_compression, load_fasta, scan_fasta, scan_stream
+
+# -------------------- Helper Function --------------------
+def write_fasta(tmp_path, text, name="input.fasta"):
+    path = tmp_path / name
+    path.write_bytes(text)
+    return str(path)
+
+# -------------------- Tests --------------------
+def test_index_matches_biopython_across_block_boundaries(tmp_path):
+    text = (b">seq1 first record\nATGCATGC\nATG\n"
+            b">seq2\r\nAAAA\r\nCC\r\n"
+            b">seq3 empty\n"
+            b">seq4 long header line that crosses a block\nGGGGGGGGGGGGGGGGGGGG\nTT")
+    path = write_fasta(tmp_path, text)
+    expected = list(SeqIO.parse(path, "fasta"))
+    for block_size in (3, 7, 16, 1 << 20):
+        index = scan_fasta(path, block_size=block_size)
+        assert [r.id for r in index] == [r.id for r in expected]
+        assert [r.description for r in index] == [r.description for r in expected]
+        assert index.lengths.tolist() == [len(r.seq) for r in expected]
+        assert [seq.decode() for _, seq in index.iter_sequences()] == [str(r.seq) for r in expected]
+
+def test_residue_classification(tmp_path):
+    dna = scan_fasta(write_fasta(tmp_path, b">a\nACGTNacgtn\n>b\nACGT\n", "dna.fasta"))
+    assert dna.classified_residues == dna.dna_residues() == 14
+    protein = scan_fasta(write_fasta(tmp_path, b">p\nMKVLWHEEQRS\n", "protein.fasta"))
+    assert protein.dna_residues() < 0.85 * protein.classified_residues
+
+def test_raw_bytes_roundtrip(tmp_path):
+    path = write_fasta(tmp_path, b">x\nAC\nGT\n>y\nTTTT\n>z\nGG")
+    index = scan_fasta(path)
+    chunk = write_fasta(tmp_path, index.raw_bytes(index[1:]), "chunk.fasta")
+    records = list(SeqIO.parse(chunk, "fasta"))
+    assert [(r.id, str(r.seq)) for r in records] == [("y", "TTTT"), ("z", "GG")]
+    assert np.array_equal(index.subset([2, 0]).lengths, [2, 4])
+
+def test_compressed_input_is_indexed_into_packed_memory(tmp_path):
+    text = (b"preamble\n>a soft-masked\nACGTacgtNNNNNNACGT\nRYACGT\n>b\n\n>c\r\nTTTTGGGGCCCCAAAA\n>p protein\nMKVLWHEEQRS\n"
+            * 50)
+    plain = scan_fasta(write_fasta(tmp_path, text[len(b"preamble\n"):]))
+    expected = [plain.sequence(record) for record in plain]
+    gz = tmp_path / "input.fasta.gz"
+    gz.write_bytes(gzip.compress(text))
+    writer = bgzf.BgzfWriter(str(tmp_path / "input.fasta.bgz"), "wb")
+    writer.write(text)
+    writer.close()
+    assert [input_compression(str(path)) for path in (gz, tmp_path / "input.fasta.bgz")] == ["gzip", "bgzf"]
+
+    indexes = [load_fasta(str(gz)), load_fasta(str(tmp_path / "input.fasta.bgz"), threads=4)]
+    indexes += [scan_stream(io.BytesIO(text), "-", block_size=block_size) for block_size in (1, 7, 64)]
+    for index in indexes:
+        assert [r.description for r in index] == [r.description for r in plain]
+        assert [index.sequence(record) for record in index] == expected
+        assert np.array_equal(index.residue_counts, plain.residue_counts)
+        chunk = write_fasta(tmp_path, index.raw_bytes(index[4:7]), "chunk.fasta")
+        assert [str(r.seq).encode() for r in SeqIO.parse(chunk, "fasta")] == expected[4:7]
+
+def test_packed_block_encodings():
+    rng = np.random.default_rng(0)
+    dna = np.frombuffer(b"ACGT", dtype=np.uint8)[rng.integers(0, 4, 10001)]
+    dna[100:400] = ord("N")
+    dna[500:520] |= 0x20
+    dna[777] = ord("R")
+    iupac = np.frombuffer(b"ACGTRYSWKMBDHVN-", dtype=np.uint8)[rng.integers(0, 16, 999)]
+    protein = np.frombuffer(b"MKVLWHEEQRS" * 20, dtype=np.uint8)
+    for residues, bits in ((dna, 2), (iupac, 4), (protein, 8)):
+        block = PackedBlock(residues)
+        assert block.bits == bits and block.nbytes <= residues.size
+        for start, end in ((0, residues.size), (3, 9), (99, 401), (515, 778)):
+            assert block.slice(start, end) == residues[start:end].tobytes()
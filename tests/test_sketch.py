@@ -0,0 +1,38 @@
+import random
+
+import numpy as np
+
+from SwiftAlign.hybrid_msa import balanced_merge_tree, merge_levels
+from SwiftAlign.sketch import cluster_sketches, guide_tree, kmer_codes, sketch_sequence, similarity
+
+# -------------------- Helper Function --------------------
+def mutate(seq, n, rng):
+    seq = list(seq)
+    for _ in range(n):
+        seq[rng.randrange(len(seq))] = rng.choice("ACGT")
+    return "".join(seq)
+
+# -------------------- Tests --------------------
+def test_kmers_are_strand_independent():
+    seq = b"ATGCGTACGTTAGCTAGCTAGCTAGGATCCAAGT"
+    revcomp = seq[::-1].translate(bytes.maketrans(b"ACGT", b"TGCA"))
+    assert sorted(kmer_codes(seq).tolist()) == sorted(kmer_codes(revcomp).tolist())
+    assert kmer_codes(b"ACGTNACGT", k=4).size == 2
+
+def test_clusters_follow_families():
+    rng = random.Random(7)
+    families = ["".join(rng.choice("ACGT") for _ in range(400)) for _ in range(3)]
+    seqs = [mutate(families[i % 3], 4, rng).encode() for i in range(12)]
+    signatures = np.stack([sketch_sequence(s) for s in seqs])
+    groups = cluster_sketches(signatures, 4)
+    assert sorted(len(g) for g in groups) == [4, 4, 4]
+    assert all(len({i % 3 for i in g}) == 1 for g in groups)
+    assert similarity(signatures, signatures[0])[0] == 1.0
+
+def test_merge_trees_cover_every_leaf():
+    signatures = np.stack([sketch_sequence(s) for s in (b"ACGT" * 30, b"ACGA" * 30, b"TTGCA" * 30)])
+    for tree, n in ((guide_tree(signatures), 3), (balanced_merge_tree(5), 5)):
+        levels = merge_levels(tree, n)
+        merged = [child for level in levels for _, left, right in level for child in (left, right)]
+        assert sorted(merged) == list(range(2 * n - 2))
+    assert [len(level) for level in merge_levels(balanced_merge_tree(5), 5)] == [2, 1, 1]